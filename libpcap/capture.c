@@ -0,0 +1,225 @@
+// libpcap capture thread writing decoded header records to a single producer / single consumer ring.
+// Live captures drop records when the ring is full (counted, the kernel would drop them anyway),
+// pcap files wait for the reader instead so a replay is complete.
+
+#include <errno.h>
+#include <pcap.h>
+#include <pthread.h>
+#include <stdatomic.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#include "capture.h"
+
+#define OFFLINE_BATCH 4096  // packets read from a file between two consumer wake-ups
+
+struct pc_capture {
+    pcap_t *handle;
+    int linktype;
+    int offline;
+    double resolution;  // timestamp fraction units per second
+    pthread_t thread;
+    int started;
+
+    pc_record *records;
+    size_t capacity;
+    _Atomic size_t head;  // records written, only the capture thread writes it
+    _Atomic size_t tail;  // records released, only the reader writes it
+    pthread_mutex_t lock;
+    pthread_cond_t readable;
+    pthread_cond_t writable;
+    _Atomic int stopping;
+    int finished;
+
+    _Atomic uint64_t stats[PC_NSTATS];
+    char error[PCAP_ERRBUF_SIZE];
+};
+
+static void notify(pc_capture *c, pthread_cond_t *cond) {
+    pthread_mutex_lock(&c->lock);
+    pthread_cond_broadcast(cond);
+    pthread_mutex_unlock(&c->lock);
+}
+
+static void on_packet(u_char *user, const struct pcap_pkthdr *header, const u_char *packet) {
+    pc_capture *c = (pc_capture *)user;
+    atomic_fetch_add(&c->stats[PC_RECEIVED], 1);
+    size_t head = atomic_load_explicit(&c->head, memory_order_relaxed);
+    if (head - atomic_load_explicit(&c->tail, memory_order_acquire) >= c->capacity) {
+        if (!c->offline) {
+            atomic_fetch_add(&c->stats[PC_RING_DROPS], 1);
+            return;
+        }
+        pthread_mutex_lock(&c->lock);
+        pthread_cond_broadcast(&c->readable);
+        while (head - atomic_load(&c->tail) >= c->capacity && !atomic_load(&c->stopping))
+            pthread_cond_wait(&c->writable, &c->lock);
+        pthread_mutex_unlock(&c->lock);
+        if (atomic_load(&c->stopping))
+            return;
+    }
+    double time = header->ts.tv_sec + header->ts.tv_usec / c->resolution;
+    if (pc_parse(c->linktype, packet, header->caplen, time, &c->records[head % c->capacity])) {
+        atomic_store_explicit(&c->head, head + 1, memory_order_release);
+        atomic_fetch_add(&c->stats[PC_DECODED], 1);
+    }
+}
+
+static void *capture_loop(void *arg) {
+    pc_capture *c = (pc_capture *)arg;
+    struct pcap_stat ps;
+    while (!atomic_load(&c->stopping)) {
+        int n = pcap_dispatch(c->handle, c->offline ? OFFLINE_BATCH : -1, on_packet, (u_char *)c);
+        notify(c, &c->readable);
+        if (n == PCAP_ERROR) {
+            snprintf(c->error, sizeof(c->error), "%s", pcap_geterr(c->handle));
+            break;
+        }
+        if (n == PCAP_ERROR_BREAK || (n == 0 && c->offline))
+            break;  // stopped, or end of the file
+        if (!c->offline && pcap_stats(c->handle, &ps) == 0) {
+            atomic_store(&c->stats[PC_PCAP_DROPS], ps.ps_drop);
+            atomic_store(&c->stats[PC_IF_DROPS], ps.ps_ifdrop);
+        }
+    }
+    pthread_mutex_lock(&c->lock);
+    c->finished = 1;
+    pthread_cond_broadcast(&c->readable);
+    pthread_mutex_unlock(&c->lock);
+    return NULL;
+}
+
+static pcap_t *open_live(const char *device, int snaplen, int promisc, int timeout_ms, int buffer_mb, char *errbuf) {
+    pcap_t *handle = pcap_create(device, errbuf);
+    if (handle == NULL)
+        return NULL;
+    pcap_set_snaplen(handle, snaplen);
+    pcap_set_promisc(handle, promisc);
+    pcap_set_timeout(handle, timeout_ms);
+    if (buffer_mb > 0)
+        pcap_set_buffer_size(handle, buffer_mb << 20);
+    int status = pcap_activate(handle);
+    if (status < 0) {  // > 0 are warnings
+        snprintf(errbuf, PCAP_ERRBUF_SIZE, "%s: %s", device,
+                 status == PCAP_ERROR ? pcap_geterr(handle) : pcap_statustostr(status));
+        pcap_close(handle);
+        return NULL;
+    }
+    return handle;
+}
+
+pc_capture *pc_open(const char *source, int offline, const char *filter, int snaplen, int promisc,
+                    int timeout_ms, int buffer_mb, size_t capacity, char *errbuf) {
+    errbuf[0] = '\0';
+    pcap_t *handle = offline
+        ? pcap_open_offline_with_tstamp_precision(source, PCAP_TSTAMP_PRECISION_NANO, errbuf)
+        : open_live(source, snaplen, promisc, timeout_ms, buffer_mb, errbuf);
+    if (handle == NULL)
+        return NULL;
+
+    if (filter != NULL && filter[0] != '\0') {
+        struct bpf_program program;
+        if (pcap_compile(handle, &program, filter, 1, PCAP_NETMASK_UNKNOWN) == PCAP_ERROR ||
+            pcap_setfilter(handle, &program) == PCAP_ERROR) {
+            snprintf(errbuf, PCAP_ERRBUF_SIZE, "filter '%s': %s", filter, pcap_geterr(handle));
+            pcap_close(handle);
+            return NULL;
+        }
+        pcap_freecode(&program);
+    }
+
+    pc_capture *c = calloc(1, sizeof(pc_capture));
+    if (c != NULL)
+        c->records = calloc(capacity, sizeof(pc_record));
+    if (c == NULL || c->records == NULL) {
+        snprintf(errbuf, PCAP_ERRBUF_SIZE, "cannot allocate a ring of %zu records", capacity);
+        free(c);
+        pcap_close(handle);
+        return NULL;
+    }
+    c->handle = handle;
+    c->offline = offline;
+    c->linktype = pcap_datalink(handle);
+    c->resolution = pcap_get_tstamp_precision(handle) == PCAP_TSTAMP_PRECISION_NANO ? 1e9 : 1e6;
+    c->capacity = capacity;
+    pthread_mutex_init(&c->lock, NULL);
+    pthread_cond_init(&c->readable, NULL);
+    pthread_cond_init(&c->writable, NULL);
+    return c;
+}
+
+int pc_start(pc_capture *c) {
+    if (c->started)
+        return 0;
+    int status = pthread_create(&c->thread, NULL, capture_loop, c);
+    c->started = status == 0;
+    return status;
+}
+
+int pc_wait(pc_capture *c, int timeout_ms, size_t *first, size_t *count) {
+    struct timespec deadline;
+    clock_gettime(CLOCK_REALTIME, &deadline);
+    deadline.tv_sec += timeout_ms / 1000;
+    deadline.tv_nsec += (long)(timeout_ms % 1000) * 1000000;
+    if (deadline.tv_nsec >= 1000000000) {
+        deadline.tv_sec += 1;
+        deadline.tv_nsec -= 1000000000;
+    }
+    size_t tail = atomic_load(&c->tail);
+    int result = 0;
+    pthread_mutex_lock(&c->lock);
+    while (1) {
+        size_t head = atomic_load_explicit(&c->head, memory_order_acquire);
+        if (head > tail) {
+            *first = tail % c->capacity;
+            *count = head - tail < c->capacity - *first ? head - tail : c->capacity - *first;
+            result = 1;
+            break;
+        }
+        if (c->finished || !c->started) {
+            result = -1;
+            break;
+        }
+        if (pthread_cond_timedwait(&c->readable, &c->lock, &deadline) == ETIMEDOUT)
+            break;
+    }
+    pthread_mutex_unlock(&c->lock);
+    return result;
+}
+
+void pc_release(pc_capture *c, size_t count) {
+    atomic_fetch_add_explicit(&c->tail, count, memory_order_release);
+    if (c->offline)
+        notify(c, &c->writable);
+}
+
+pc_record *pc_records(pc_capture *c) { return c->records; }
+
+void pc_stats(pc_capture *c, uint64_t *stats) {
+    for (int i = 0; i < PC_NSTATS; i++)
+        stats[i] = atomic_load(&c->stats[i]);
+}
+
+const char *pc_error(pc_capture *c) { return c->error; }
+
+void pc_stop(pc_capture *c) {
+    if (!c->started || atomic_exchange(&c->stopping, 1))
+        return;
+    pcap_breakloop(c->handle);
+    notify(c, &c->writable);
+    pthread_join(c->thread, NULL);
+}
+
+void pc_close(pc_capture *c) {
+    if (c == NULL)
+        return;
+    pc_stop(c);
+    pcap_close(c->handle);
+    pthread_mutex_destroy(&c->lock);
+    pthread_cond_destroy(&c->readable);
+    pthread_cond_destroy(&c->writable);
+    free(c->records);
+    free(c);
+}
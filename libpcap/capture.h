@@ -0,0 +1,61 @@
+// Native capture source for the Python sniffer (python/native_capture.py).
+// A capture thread reads packets with libpcap (live interface or pcap file, BPF filter),
+// decodes the IPv4/TCP/UDP header fields `process_packet` produces into fixed-layout
+// records and appends them to a ring buffer Python reads in batches without copying.
+
+#ifndef CAPTURE_H
+#define CAPTURE_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+// one decoded packet, 64 bytes, same fields and missing-layer values (-1) as python/pcap_decoder.py
+// keep in sync with RECORD in python/native_capture.py
+typedef struct {
+    double time;              // seconds since the epoch
+    uint32_t src_ip;          // host byte order
+    uint32_t dst_ip;
+    int64_t tcp_seq;          // -1 when not TCP
+    int64_t tcp_ack;
+    int32_t packet_size;      // IP total length
+    int32_t tcp_sport;
+    int32_t tcp_dport;
+    int32_t udp_sport;        // -1 when not UDP
+    int32_t udp_dport;
+    uint16_t identification;
+    uint16_t tcp_flags;       // 9 flag bits, 0 when not TCP
+    uint8_t ttl;
+    uint8_t ip_flags;         // 3 bits (evil, DF, MF)
+    uint8_t _pad[6];
+} pc_record;
+
+typedef struct pc_capture pc_capture;
+
+// stats indexes of pc_stats
+enum { PC_RECEIVED, PC_DECODED, PC_RING_DROPS, PC_PCAP_DROPS, PC_IF_DROPS, PC_NSTATS };
+
+size_t pc_record_size(void);
+
+// Decode one captured frame of `linktype`, returns 1 and fills `record` for IPv4 packets, 0 otherwise.
+int pc_parse(int linktype, const uint8_t *data, uint32_t caplen, double time, pc_record *record);
+
+// Open an interface (offline = 0) or a pcap file (offline = 1) with an optional BPF `filter`.
+// `capacity` records are allocated for the ring. Returns NULL and fills `errbuf` (256 bytes) on failure.
+pc_capture *pc_open(const char *source, int offline, const char *filter, int snaplen, int promisc,
+                    int timeout_ms, int buffer_mb, size_t capacity, char *errbuf);
+// Start the capture thread, 0 on success.
+int pc_start(pc_capture *capture);
+// Wait up to `timeout_ms` for records: sets the first ring index and the contiguous count available.
+// Returns 1 when records are available, 0 on timeout, -1 when the capture ended and the ring is empty.
+int pc_wait(pc_capture *capture, int timeout_ms, size_t *first, size_t *count);
+// Give `count` records back to the capture thread once read.
+void pc_release(pc_capture *capture, size_t count);
+pc_record *pc_records(pc_capture *capture);
+void pc_stats(pc_capture *capture, uint64_t *stats);
+// Error of a capture that ended on failure, empty string otherwise.
+const char *pc_error(pc_capture *capture);
+// Stop the capture thread (pcap_breakloop), the records left can still be read.
+void pc_stop(pc_capture *capture);
+void pc_close(pc_capture *capture);
+
+#endif
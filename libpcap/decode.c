@@ -0,0 +1,83 @@
+// Header field decoding of one frame, the fixed offsets of python/pcap_decoder.py.
+
+#include "capture.h"
+
+#define DLT_EN10MB 1
+#define DLT_RAW 101
+#define DLT_RAW_BSD 12
+#define DLT_RAW_OPENBSD 14
+#define DLT_LINUX_SLL 113
+#define DLT_LINUX_SLL2 276
+
+#define ETH_P_IP 0x0800
+#define IPPROTO_TCP 6
+#define IPPROTO_UDP 17
+
+static inline uint16_t be16(const uint8_t *p) { return (uint16_t)(p[0] << 8 | p[1]); }
+
+static inline uint32_t be32(const uint8_t *p) {
+    return (uint32_t)p[0] << 24 | (uint32_t)p[1] << 16 | (uint32_t)p[2] << 8 | p[3];
+}
+
+size_t pc_record_size(void) { return sizeof(pc_record); }
+
+// offset of the IP header, -1 when the frame does not carry IPv4
+static long network_offset(int linktype, const uint8_t *data, uint32_t caplen) {
+    switch (linktype) {
+    case DLT_EN10MB: {
+        if (caplen < 14)
+            return -1;
+        uint16_t ethertype = be16(data + 12);
+        if (ethertype == 0x8100 || ethertype == 0x88a8) {  // one VLAN tag
+            if (caplen < 18)
+                return -1;
+            return be16(data + 16) == ETH_P_IP ? 18 : -1;
+        }
+        return ethertype == ETH_P_IP ? 14 : -1;
+    }
+    case DLT_LINUX_SLL:
+        return caplen >= 16 && be16(data + 14) == ETH_P_IP ? 16 : -1;
+    case DLT_LINUX_SLL2:
+        return caplen >= 20 && be16(data) == ETH_P_IP ? 20 : -1;
+    case DLT_RAW:
+    case DLT_RAW_BSD:
+    case DLT_RAW_OPENBSD:
+        return 0;
+    default:
+        return -1;
+    }
+}
+
+int pc_parse(int linktype, const uint8_t *data, uint32_t caplen, double time, pc_record *record) {
+    long l3 = network_offset(linktype, data, caplen);
+    if (l3 < 0 || l3 + 20 > (long)caplen)
+        return 0;
+    const uint8_t *ip = data + l3;
+    if (ip[0] >> 4 != 4)
+        return 0;
+
+    uint16_t flags_frag = be16(ip + 6);
+    long l4 = l3 + (ip[0] & 0x0F) * 4;
+    int first_fragment = (flags_frag & 0x1FFF) == 0;
+    int is_tcp = ip[9] == IPPROTO_TCP && first_fragment && l4 + 14 <= (long)caplen;
+    int is_udp = ip[9] == IPPROTO_UDP && first_fragment && l4 + 4 <= (long)caplen;
+    const uint8_t *transport = data + l4;
+
+    record->time = time;
+    record->src_ip = be32(ip + 12);
+    record->dst_ip = be32(ip + 16);
+    record->packet_size = be16(ip + 2);
+    record->identification = be16(ip + 4);
+    record->ttl = ip[8];
+    record->ip_flags = (uint8_t)(flags_frag >> 13);
+    record->tcp_sport = is_tcp ? be16(transport) : -1;
+    record->tcp_dport = is_tcp ? be16(transport + 2) : -1;
+    record->tcp_seq = is_tcp ? (int64_t)be32(transport + 4) : -1;
+    record->tcp_ack = is_tcp ? (int64_t)be32(transport + 8) : -1;
+    record->tcp_flags = is_tcp ? be16(transport + 12) & 0x1FF : 0;
+    record->udp_sport = is_udp ? be16(transport) : -1;
+    record->udp_dport = is_udp ? be16(transport + 2) : -1;
+    for (int i = 0; i < 6; i++)
+        record->_pad[i] = 0;
+    return 1;
+}
@@ -0,0 +1,131 @@
+"""
+Blocker state persistence: rewriting `clients.json` on every client update (as
+`update_client_status` did) against the journaled store flushed once per window
+(`state_store.JournalStore`), for `--clients` clients over `--windows` windows
+(250 clients x 360 windows is one hour of 10 s windows), blocking streaming clients
+through a fake nft. Reports time and bytes written, then checks a crash (torn last
+journal write) recovers the flushed state.
+
+The rewrite baseline is quadratic (the state written on every update grows every
+window), so it runs on the first `--rewrite-windows` windows only and its full run
+is estimated from its per window cost, fitted as growing linearly. Both stores are
+compared on those windows as measured; `--rewrite-windows 360` measures the whole
+baseline (tens of minutes and GBs written).
+
+```bash
+python3 benchmarks/bench_blocker_state.py --clients 250 --windows 360
+```
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from blocker import Blocker  # noqa: E402
+from nft_set import FakeNft, NftSet  # noqa: E402
+
+
+class RewriteBlocker(Blocker):
+    """The previous behaviour: the whole state file written on every update."""
+
+    def update_client_status(self, client_ip, is_streaming, server_ips):
+        super().update_client_status(client_ip, is_streaming, server_ips)
+        self.save_state()
+
+    def save_state(self):
+        with open(self.state_file, 'w') as f:
+            json.dump(self.clients, f, indent=4)
+        self.store.bytes_written += os.path.getsize(self.state_file)
+        self.store.dirty.clear()
+
+
+def run(blocker_class, tmp, clients, windows, seed=0):
+    rng = np.random.default_rng(seed)
+    blocker = blocker_class(os.path.join(tmp, f"{blocker_class.__name__}.json"),
+                            os.path.join(tmp, f"{blocker_class.__name__}-blocked-ips-v4.txt"),
+                            nft=NftSet(runner=FakeNft()))
+    blocker.store.flush_interval = None  # flush at window end only
+    blocker.streaming_limit_seconds = 0  # streaming clients get blocked too
+    client_ips = [f"192.168.0.{2 + i % 250}" if i < 250 else f"10.0.{i // 250}.{i % 250}" for i in range(clients)]
+    with contextlib.redirect_stdout(io.StringIO()):  # the blocker logs every state change
+        costs = simulate(blocker, client_ips, rng, windows)
+    return costs, blocker
+
+
+def simulate(blocker, client_ips, rng, windows):
+    """(seconds, bytes written) of every window."""
+    costs = []
+    for _ in range(windows):
+        start, written = time.perf_counter(), blocker.store.bytes_written
+        streaming = rng.random(len(client_ips)) < 0.3
+        for client_ip, is_streaming in zip(client_ips, streaming):
+            servers = [f"142.250.{rng.integers(0, 256)}.{rng.integers(0, 256)}" for _ in range(3)]
+            blocker.update_client_status(client_ip, bool(is_streaming), servers)
+        blocker.end_window()
+        costs.append((time.perf_counter() - start, blocker.store.bytes_written - written))
+    return np.array(costs)
+
+
+def extrapolate(costs, windows):
+    """Total (seconds, bytes) of `windows` windows, per window costs fitted as a line."""
+    measured = np.arange(len(costs))
+    if len(costs) >= windows or len(costs) < 2:
+        return costs.sum(axis=0) * windows / len(costs)
+    fit = [np.polyval(np.polyfit(measured, column, 1), np.arange(windows)).sum() for column in costs.T]
+    return np.array(fit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the blocker state persistence.")
+    parser.add_argument("--clients", type=int, default=250, help="LAN clients.")
+    parser.add_argument("--windows", type=int, default=360, help="Windows (360 x 10 s = 1 hour).")
+    parser.add_argument("--rewrite-windows", type=int, default=20,
+                        help="Windows the quadratic rewrite baseline runs, the rest is estimated.")
+    args = parser.parse_args()
+    capped = min(args.rewrite_windows, args.windows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rewrite_costs, rewrite = run(RewriteBlocker, tmp, args.clients, capped)
+        journal_costs, journal = run(Blocker, tmp, args.clients, args.windows)
+        print(f"{args.clients} clients x {args.windows} windows")
+
+        def line(name, costs):
+            seconds, written = costs
+            return f"{name}: {seconds:8.2f} s {written / 1e6:9.1f} MB written"
+
+        rewrite_part, journal_part = rewrite_costs.sum(axis=0), journal_costs[:capped].sum(axis=0)
+        print(f"first {capped} windows")
+        print(line("  rewrite per update", rewrite_part))
+        print(line("  journal per window", journal_part) +
+              f" ({rewrite_part[0] / journal_part[0]:.0f}x faster, {rewrite_part[1] / journal_part[1]:.0f}x less)")
+        rewrite_total, journal_total = extrapolate(rewrite_costs, args.windows), journal_costs.sum(axis=0)
+        estimated = " (estimated)" if capped < args.windows else ""
+        print(f"all {args.windows} windows")
+        print(line("  rewrite per update", rewrite_total) + estimated)
+        print(line("  journal per window", journal_total) +
+              f" ({rewrite_total[0] / journal_total[0]:.0f}x faster, {rewrite_total[1] / journal_total[1]:.0f}x less)")
+
+        print(f"nft: {journal.nft.transactions} transactions, {len(journal.nft.runner.elements)} "
+              f"(client . server) elements, {len(journal.blocked_ips)} blocked servers")
+        reloaded = Blocker(journal.state_file, journal.blocked_ips_file).clients
+        print(f"reload after clean run matches: {reloaded == journal.clients}")
+        with open(journal.store.journal_file, 'a') as f:
+            f.write('{"client": "192.168.0.2", "state": {"is_str')  # crash in the middle of a flush
+        recovered = Blocker(journal.state_file, journal.blocked_ips_file)
+        print(f"recovery after torn write matches: {recovered.clients == journal.clients}")
+        legacy = Blocker(rewrite.state_file, rewrite.blocked_ips_file).clients
+        print(f"old clients.json loads: {legacy == rewrite.clients}")
+
+
+if __name__ == "__main__":
+    main()
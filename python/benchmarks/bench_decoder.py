@@ -0,0 +1,73 @@
+"""
+Compare packets/s of the Scapy decoder (`process_packet`) and the raw fixed-offset
+decoder (`pcap_decoder.RawPcapReader`) on a recorded capture, and check both
+produce the same columns.
+
+```bash
+sudo tcpdump -i eno1 -s 192 -c 200000 -w capture.pcap port 80 or port 443
+python3 benchmarks/bench_decoder.py capture.pcap
+```
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from scapy_sniffer import get_pcap_reader, process_packet  # noqa: E402
+from pcap_decoder import RawPcapReader  # noqa: E402
+from capture_buffer import to_strings  # noqa: E402
+
+
+def decode_scapy(path):
+    data = []
+    with get_pcap_reader(path) as pcap_reader:
+        for packet in pcap_reader:
+            packet_data = process_packet(packet)
+            if packet_data:
+                data.append(packet_data)
+    return pd.DataFrame(data)
+
+
+def decode_raw(path, block_size):
+    with RawPcapReader(open(path, 'rb'), block_size=block_size) as reader:
+        batches = [pd.DataFrame(batch) for batch in reader]
+    return pd.DataFrame(to_strings(pd.concat(batches, ignore_index=True)))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pcap decoders.")
+    parser.add_argument("pcap", type=str, help="Recorded capture (classic pcap).")
+    parser.add_argument("--block-size", type=int, default=1 << 20, help="Raw decoder read size in bytes.")
+    args = parser.parse_args()
+
+    df_raw, t_raw = timed(decode_raw, args.pcap, args.block_size)
+    df_scapy, t_scapy = timed(decode_scapy, args.pcap)
+
+    print(f"scapy: {len(df_scapy):9d} packets {t_scapy:8.3f} s {len(df_scapy) / t_scapy:12.0f} pps")
+    print(f"raw  : {len(df_raw):9d} packets {t_raw:8.3f} s {len(df_raw) / t_raw:12.0f} pps")
+    print(f"speedup: {t_scapy / t_raw:.1f}x")
+
+    if len(df_raw) != len(df_scapy):
+        print("MISMATCH: decoders produced a different number of packets")
+        return 1
+    mismatched = [col for col in df_scapy.columns
+                  if not df_scapy[col].astype(str).equals(df_raw[col].astype(str))
+                  and not (col == 'time' and np.allclose(df_scapy[col], df_raw[col], rtol=0, atol=1e-6))]
+    print(f"columns differing: {mismatched if mismatched else 'none'}")
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
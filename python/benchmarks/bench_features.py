@@ -0,0 +1,109 @@
+"""
+Compare the batched feature engine (`feature_engine.make_batched_features`) with the
+pandas path (`make_windowed_features` once per client, as `main()` did) for speed,
+and check both give the same features within a tolerance.
+
+Uses the training data `raw.h5` (features per scenario `name`) when present,
+otherwise synthetic traffic of `--clients` LAN clients.
+
+```bash
+python3 benchmarks/bench_features.py --clients 50
+python3 benchmarks/bench_features.py --raw
+```
+"""
+
+import argparse
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_window_buffer import synthetic_batches  # noqa: E402
+from capture_buffer import PacketBuffer  # noqa: E402
+from config import config  # noqa: E402
+from feature_creation import make_windowed_features, preprocess, read_hdf  # noqa: E402
+from feature_engine import make_batched_features, plan_features  # noqa: E402
+
+
+def synthetic_packets(clients, pps, seconds):
+    """Decoder batches of `clients` LAN clients."""
+    rng = np.random.default_rng(1)
+    for batch in synthetic_batches(pps, seconds):
+        lan = (0xC0A80002 + rng.integers(0, clients, len(batch['time']))).astype(np.uint32)
+        up = batch['src_ip'] >> 16 == 0xC0A8
+        batch['src_ip'] = np.where(up, lan, batch['src_ip'])
+        batch['dst_ip'] = np.where(up, batch['dst_ip'], lan)
+        batch['time'] = batch['time'] + 1.7e9
+        yield batch
+
+
+def synthetic_capture(clients, pps, seconds):
+    buffer = PacketBuffer()
+    for batch in synthetic_packets(clients, pps, seconds):
+        buffer.extend(batch)
+    return preprocess(buffer.frame())
+
+
+def pandas_features(df, by):
+    frames = {key: make_windowed_features(group.copy()) for key, group in df.groupby(by)}
+    return pd.concat(frames, names=[by])
+
+
+def best_of(repeat, func, *args, **kwargs):
+    """Shortest time of `repeat` calls (timings of a few ms are noisy) and the result."""
+    best = np.inf
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batched feature engine.")
+    parser.add_argument("--clients", type=int, default=50, help="Synthetic LAN clients.")
+    parser.add_argument("--pps", type=int, default=6000, help="Synthetic packets per second.")
+    parser.add_argument("--seconds", type=int, default=10, help="Synthetic capture length.")
+    parser.add_argument("--raw", action="store_true", help="Use the training data raw.h5.")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of REPEAT runs of each path.")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', RuntimeWarning)
+
+    if args.raw:
+        df, by = read_hdf(), 'name'
+    else:
+        df, by = synthetic_capture(args.clients, args.pps, args.seconds), 'client'
+    print(f"{len(df)} packets, {df[by].nunique()} {by}s, window {config['window-size']} s")
+
+    t_pandas, expected = best_of(args.repeat, pandas_features, df, by)
+    t_batched, result = best_of(args.repeat, make_batched_features, df, by=by)
+    print(f"pandas : {t_pandas:8.3f} s {len(expected):6d} windows")
+    print(f"batched: {t_batched:8.3f} s {len(result):6d} windows")
+    print(f"speedup: {t_pandas / t_batched:.1f}x (best of {args.repeat})")
+
+    selected = config['selected_features']
+    t_selected, subset = best_of(args.repeat, make_batched_features, df, by=by, features=selected)
+    _, intermediates, columns, cost = plan_features(selected)
+    print(f"selected {len(selected)} features: {t_selected:8.3f} s (plan cost {cost} vs "
+          f"{plan_features()[3]}, {len(intermediates)} intermediates, {len(columns)} columns)")
+
+    expected = expected[result.columns]
+    if not expected.index.equals(result.index) or not subset.index.equals(result.index):
+        print("MISMATCH: different (key, window) rows")
+        return 1
+    if not subset.equals(result[selected]):
+        print("MISMATCH: selected features differ from the full set")
+        return 1
+    close = np.isclose(result.to_numpy(), expected.to_numpy(), rtol=1e-7, atol=1e-9)
+    bad = result.columns[~close.all(axis=0)].to_list()
+    print(f"features differing: {bad if bad else 'none'}")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Compare model inference for one window of many clients: one `predict_proba` per
+client (as `main()` did), one call for all clients, and the exported forest
+(`tree_export.ForestEvaluator`). Also times the model startup (imports + load)
+of both backends in fresh interpreters, the numpy one also on its first start when
+it exports etree.npz, and checks the probabilities are identical (exits 1 if not).
+
+```bash
+python3 benchmarks/bench_inference.py --clients 100
+```
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+from joblib import load
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_features import synthetic_capture  # noqa: E402
+from classifier import client_probas  # noqa: E402
+from config import config  # noqa: E402
+from feature_engine import make_batched_features  # noqa: E402
+from tree_export import ForestEvaluator, export_forest  # noqa: E402
+
+STARTUP = {
+    'sklearn': "from joblib import load; load({model!r})",
+    'numpy': "from tree_export import ForestEvaluator; ForestEvaluator({arrays!r})",
+    # first start of the numpy backend, load_model() exports the arrays (needs sklearn)
+    'numpy-export': ("from joblib import load; from tree_export import ForestEvaluator, export_forest; "
+                     "export_forest(load({model!r}), {arrays!r} + '.new.npz'); ForestEvaluator({arrays!r} + '.new.npz')"),
+}
+
+
+def per_client(model, features):
+    return {client_ip: np.mean(model.predict_proba(client_features), axis=0)
+            for client_ip, client_features in features.groupby(level='client', observed=True)}
+
+
+def timed(func, *args, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def startup(backend, arrays):
+    code = STARTUP[backend].format(model=str(config['model']), arrays=str(arrays))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-W", "ignore", "-c", code], check=True,
+                   cwd=Path(__file__).resolve().parents[1])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched inference and the exported forest.")
+    parser.add_argument("--clients", type=int, default=100, help="Synthetic LAN clients.")
+    parser.add_argument("--pps", type=int, default=10000, help="Synthetic packets per second.")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    model = load(config['model'])
+    columns = list(getattr(model, 'feature_names_in_', config['selected_features']))
+    features = make_batched_features(synthetic_capture(args.clients, args.pps, config['window-size']),
+                                     features=columns)
+    with tempfile.TemporaryDirectory() as tmp:
+        arrays = Path(tmp) / 'etree.npz'
+        export_forest(model, arrays)
+        evaluator = ForestEvaluator(arrays)
+        print(f"{len(features)} rows, {features.index.get_level_values('client').nunique()} clients, "
+              f"{evaluator.n_estimators} trees")
+
+        t_client, expected = timed(per_client, model, features)
+        t_batched, batched = timed(client_probas, model, features)
+        t_numpy, exported = timed(client_probas, evaluator, features)
+        print(f"per client predict_proba : {1e3 * t_client:8.2f} ms")
+        print(f"batched predict_proba    : {1e3 * t_batched:8.2f} ms ({t_client / t_batched:.1f}x)")
+        print(f"batched exported forest  : {1e3 * t_numpy:8.2f} ms ({t_client / t_numpy:.1f}x)")
+        print(f"startup sklearn/numpy    : {startup('sklearn', arrays):.2f} s / {startup('numpy', arrays):.2f} s "
+              f"(first numpy start, exporting: {startup('numpy-export', arrays):.2f} s)")
+
+        identical = np.array_equal(model.predict_proba(features), evaluator.predict_proba(features))
+        close = all(np.allclose(expected[client], batched[client]) and
+                    np.allclose(expected[client], exported[client]) for client in expected)
+        print(f"exported probabilities identical: {identical}, client averages match: {close}")
+    return 0 if identical and close else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
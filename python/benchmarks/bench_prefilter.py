@@ -0,0 +1,147 @@
+"""
+Throughput prefilter (`prefilter.ThroughputFilter`) ahead of the model against the
+ML-only path, window by window over recorded captures (pcap, csv or HDF5 with a
+scenario `name` and label `y`, as `extract_features.py` reads them) or, without
+inputs, a synthetic LAN: `--traffic video` the video and interactive clients of
+`synthetic_traffic.lan_traffic` (labeled per client), `--traffic busy` one where only
+`--busy` of the `--clients` clients are heavy.
+
+Reports the client-windows short-circuited, the time of both paths, how often the
+verdicts agree, the streaming verdicts the prefilter missed and, with labels, the
+accuracy of both paths and the share of streaming client-windows detected.
+Exits 1 when the prefilter misses streaming verdicts of the model.
+
+```bash
+python3 benchmarks/bench_prefilter.py training/packets.h5
+python3 benchmarks/bench_prefilter.py --traffic video --clients 100 --video 0.3
+```
+"""
+
+import argparse
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_features import synthetic_packets  # noqa: E402
+from capture_buffer import PacketBuffer  # noqa: E402
+from classifier import client_probas  # noqa: E402
+from config import config  # noqa: E402
+from extract_features import read_chunks  # noqa: E402
+from feature_creation import is_lan_ip, load_model, preprocess  # noqa: E402
+from feature_engine import make_batched_features  # noqa: E402
+from prefilter import ThroughputFilter  # noqa: E402
+from synthetic_traffic import lan_clients, lan_traffic  # noqa: E402
+from training_store import window_chunks  # noqa: E402
+
+
+def synthetic_lan(clients, busy, pps, seconds, seed=0):
+    """Synthetic capture where all but `busy` clients keep 2% of their packets."""
+    rng = np.random.default_rng(seed)
+    buffer = PacketBuffer()
+    for batch in synthetic_packets(clients, pps, seconds):
+        lan = np.where(batch['src_ip'] >> 16 == 0xC0A8, batch['src_ip'], batch['dst_ip'])
+        keep = (lan - 0xC0A80002 < busy) | (rng.random(len(lan)) < 0.02)
+        buffer.extend({name: np.asarray(column)[keep] for name, column in batch.items()})
+    return buffer.frame().assign(name='synthetic')
+
+
+def video_lan(clients, video, pps, seconds, seed=0):
+    """Synthetic video/interactive LAN, `y` 1 on the packets of the video clients."""
+    ips, is_video = lan_clients(clients, video, seed=seed)
+    buffer = PacketBuffer()
+    for batch in lan_traffic(clients, pps, seconds, video, seed):
+        buffer.extend(batch)
+    df = buffer.frame()
+    client = np.where(is_lan_ip(df['src_ip'].to_numpy()), df['src_ip'], df['dst_ip'])
+    return df.assign(name='synthetic', y=np.isin(client, ips[is_video]).astype(np.int8))
+
+
+def windows(chunks):
+    """Preprocessed (name, window, rows) in time order per scenario."""
+    for df in window_chunks(chunks, by='name'):
+        df = preprocess(df)
+        window = np.floor(df['time'].to_numpy() / config['window-size']).astype(np.int64)
+        for (name, index), rows in df.groupby([df['name'], window], sort=True):
+            yield name, index, rows
+
+
+def replay(model, features, frames, prefilter=False):
+    """Verdicts {(name, window, client): is_streaming} and the seconds spent classifying."""
+    prefilters = {}  # one per scenario, recordings are not one continuous capture
+    verdicts = {}
+    elapsed = 0.0
+    for name, index, rows in frames:
+        start = time.perf_counter()
+        idle = ()
+        if prefilter:
+            rows, idle = prefilters.setdefault(name, ThroughputFilter()).select(rows)
+        probas = client_probas(model, make_batched_features(rows, features=features)) if len(rows) else {}
+        elapsed += time.perf_counter() - start
+        verdicts.update({(name, index, client): False for client in idle})
+        verdicts.update({(name, index, client): proba[1] > config['class-1-threshold']
+                         for client, proba in probas.items()})
+    short_circuited = sum(f.short_circuited for f in prefilters.values())
+    client_windows = sum(f.client_windows for f in prefilters.values())
+    return verdicts, elapsed, short_circuited, client_windows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the throughput prefilter against the ML-only path.")
+    parser.add_argument("inputs", nargs='*', help="Recorded captures (pcap, csv, h5), synthetic LAN if none.")
+    parser.add_argument("--traffic", choices=["video", "busy"], default="video",
+                        help="Synthetic LAN: video and interactive clients, or a few busy ones.")
+    parser.add_argument("--clients", type=int, default=100, help="Synthetic LAN clients.")
+    parser.add_argument("--video", type=float, default=0.3, help="With --traffic video, share of video clients.")
+    parser.add_argument("--busy", type=int, default=10, help="With --traffic busy, clients at full rate.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic traffic.")
+    parser.add_argument("--pps", type=int, default=5000, help="Synthetic packets per second.")
+    parser.add_argument("--seconds", type=int, default=120, help="Synthetic capture length.")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')  # model pickled by another sklearn version
+
+    if args.inputs:
+        frames = [frame for path in args.inputs for frame in windows(read_chunks(path))]
+    elif args.traffic == 'video':
+        frames = list(windows([video_lan(args.clients, args.video, args.pps, args.seconds, args.seed)]))
+    else:
+        frames = list(windows([synthetic_lan(args.clients, args.busy, args.pps, args.seconds, args.seed)]))
+    # label of each (scenario, client): the scenario label of recordings, per client synthetic ones
+    labels = {}
+    for name, _, rows in frames:
+        if 'y' in rows:
+            labels.update({(name, client): y for client, y in rows.groupby('client')['y'].first().items()})
+    model = load_model()
+    features = list(getattr(model, 'feature_names_in_', config['selected_features']))
+
+    ml, t_ml, _, _ = replay(model, features, frames)
+    fast, t_fast, short_circuited, client_windows = replay(model, features, frames, prefilter=True)
+    print(f"{len(frames)} windows, {client_windows} client-windows, "
+          f"{short_circuited} short-circuited ({100 * short_circuited / max(client_windows, 1):.0f}%)")
+    print(f"ML only:        {t_ml:7.2f} s")
+    print(f"prefilter + ML: {t_fast:7.2f} s ({t_ml / max(t_fast, 1e-9):.1f}x faster)")
+
+    # clients without valid features have no ML-only verdict, they are compared where both have one
+    common = ml.keys() & fast.keys()
+    agree = sum(ml[key] == fast[key] for key in common)
+    missed = sum(ml[key] and not fast[key] for key in common)
+    streaming = sum(ml[key] for key in common)
+    print(f"verdicts agree: {agree}/{len(common)} ({100 * agree / max(len(common), 1):.1f}%), "
+          f"streaming verdicts missed: {missed}/{streaming}")
+    if labels:
+        video = [key for key in common if labels[(key[0], key[2])] == 1]
+        for title, verdicts in (("ML only", ml), ("prefilter + ML", fast)):
+            correct = sum(verdicts[key] == bool(labels[(key[0], key[2])] == 1) for key in common)
+            detected = sum(verdicts[key] for key in video)
+            print(f"{title:<15} accuracy {100 * correct / max(len(common), 1):5.1f}%, "
+                  f"streaming client-windows detected {detected}/{len(video)}")
+    return 1 if missed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
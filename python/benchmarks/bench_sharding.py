@@ -0,0 +1,75 @@
+"""
+Scaling of the sharded classification (`sharding.ShardedClassifier`) with 1, 2, 4
+and 8 worker processes, replaying a synthetic multi-client pcap at full speed.
+Checks every run gives the same verdicts. Speedup is bounded by the cores available.
+
+```bash
+python3 benchmarks/bench_sharding.py --clients 200 --pps 20000 --seconds 60
+```
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_features import synthetic_packets  # noqa: E402
+from pcap_decoder import RawPcapReader  # noqa: E402
+from sharding import ShardedClassifier  # noqa: E402
+from synthetic_traffic import write_pcap  # noqa: E402
+
+
+def run(path, workers):
+    """Replay `path` through `workers` shards, returns (startup s, replay s, verdicts)."""
+    verdicts = {}
+
+    def on_window(window, window_verdicts):
+        verdicts.update({(window, client): proba for client, (proba, _) in window_verdicts.items()})
+
+    start = time.perf_counter()
+    sharded = ShardedClassifier(workers, on_window)
+    startup = time.perf_counter() - start
+    start = time.perf_counter()
+    with RawPcapReader(open(path, 'rb')) as reader:
+        for batch in reader:
+            sharded.feed(batch)
+    sharded.close()
+    return startup, time.perf_counter() - start, verdicts, sharded.packets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded classification.")
+    parser.add_argument("--clients", type=int, default=200, help="Synthetic LAN clients.")
+    parser.add_argument("--pps", type=int, default=20000, help="Synthetic packets per second.")
+    parser.add_argument("--seconds", type=int, default=60, help="Synthetic capture length.")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4, 8], help="Worker counts to run.")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', RuntimeWarning)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'lan.pcap')
+        count = write_pcap(path, synthetic_packets(args.clients, args.pps, args.seconds))
+        print(f"{count} packets, {args.clients} clients, {args.seconds} s, {os.cpu_count()} cpus")
+        baseline, expected = None, None
+        for workers in args.workers:
+            startup, elapsed, verdicts, packets = run(path, workers)
+            baseline = baseline or elapsed
+            print(f"{workers} workers: startup {startup:6.2f} s replay {elapsed:7.2f} s "
+                  f"{packets / elapsed:9.0f} pps speedup {baseline / elapsed:4.1f}x "
+                  f"{len(verdicts)} verdicts")
+            if expected is None:
+                expected = verdicts
+            elif verdicts.keys() != expected.keys() or not all(
+                    np.allclose(verdicts[key], expected[key]) for key in expected):
+                print("  verdicts differ from the 1 worker run!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Streaming accumulators (`streaming_features.StreamingWindower`) against rebuilding
+each window with `preprocess` + `make_batched_features`:
+checks both give the same features (tumbling and hopping windows) and compares
+the work done when a window closes, the latency spike the capture loop sees:
+the update of the batch closing a window (its packets are added too) and, of it,
+the features of the closed windows alone.
+
+```bash
+python3 benchmarks/bench_streaming.py --clients 50 --pps 6000 --hop 2
+```
+"""
+
+import argparse
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_features import synthetic_packets  # noqa: E402
+from capture_buffer import PacketBuffer  # noqa: E402
+from config import config  # noqa: E402
+from feature_creation import preprocess  # noqa: E402
+from feature_engine import make_batched_features  # noqa: E402
+from streaming_features import StreamingWindower  # noqa: E402
+
+
+def stream(batches, hop, features=None, close_work=None):
+    windower = StreamingWindower(features=features, hop=hop)
+    if close_work is not None:  # time the window closes inside update()
+        close = windower._close
+
+        def timed_close(*args):
+            start = time.perf_counter()
+            rows = close(*args)
+            close_work.append(time.perf_counter() - start)
+            return rows
+        windower._close = timed_close
+    frames, update_times, close_times = [], [], []
+    for batch in batches:
+        start = time.perf_counter()
+        frame = windower.update(batch)
+        elapsed = time.perf_counter() - start
+        (close_times if len(frame) else update_times).append(elapsed)
+        frames.append(frame)
+    frames.append(windower.flush())
+    return pd.concat(frames), np.array(update_times), np.array(close_times)
+
+
+def rebuild(batches, window_size, features=None):
+    """Previous main(): buffer the window, rebuild it when it closes."""
+    buffer, frames, close_times = PacketBuffer(), [], []
+    current = None
+    for batch in batches:
+        window = batch['time'][0] // window_size
+        if current is not None and window != current and len(buffer):
+            start = time.perf_counter()
+            frames.append(make_batched_features(preprocess(buffer.frame()), features=features))
+            close_times.append(time.perf_counter() - start)
+            buffer.clear()
+        current = window
+        buffer.extend(batch)
+    frames.append(make_batched_features(preprocess(buffer.frame()), features=features))
+    return pd.concat(frames), np.array(close_times)
+
+
+def compare(result, expected):
+    result = result.drop(columns='servers')
+    result.index = result.index.set_levels(result.index.levels[0].astype(str), level=0)
+    expected = expected.copy()
+    expected.index = expected.index.set_levels(expected.index.levels[0].astype(str), level=0)
+    result, expected = result.sort_index(), expected.sort_index()
+    common = result.index.intersection(expected.index)
+    if len(common) != len(result) or len(common) != len(expected):
+        return f"{len(result)} vs {len(expected)} windows"
+    close = np.isclose(result.loc[common].to_numpy(dtype=float), expected.loc[common, result.columns].to_numpy(),
+                       rtol=1e-6, atol=1e-9)
+    bad = result.columns[~close.all(axis=0)].to_list()
+    return f"features differing {bad}" if bad else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming feature accumulators.")
+    parser.add_argument("--clients", type=int, default=50, help="Synthetic LAN clients.")
+    parser.add_argument("--pps", type=int, default=6000, help="Synthetic packets per second.")
+    parser.add_argument("--seconds", type=int, default=60, help="Synthetic capture length.")
+    parser.add_argument("--hop", type=int, default=2, help="Hop of the sliding windows to check.")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', RuntimeWarning)
+    window_size = config['window-size']
+    selected = config['selected_features']
+
+    batches = []
+    for batch in synthetic_packets(args.clients, args.pps, args.seconds):
+        # split batches at pane boundaries so the rebuild path sees whole windows
+        panes = (batch['time'] // args.hop).astype(np.int64)
+        for pane in np.unique(panes):
+            batches.append({name: np.asarray(column)[panes == pane] for name, column in batch.items()})
+
+    result, update_times, close_times = stream(batches, window_size)
+    expected, rebuild_times = rebuild(batches, window_size)
+    error = compare(result, expected)
+    print(f"tumbling {window_size} s windows: {len(result)} rows, {'MISMATCH ' + error if error else 'match'}")
+
+    close_work = []
+    result, update_times, close_times = stream(batches, window_size, selected, close_work)
+    _, rebuild_times = rebuild(batches, window_size, selected)
+    per_packet = (update_times.sum() + close_times.sum()) / (args.pps * args.seconds) * 1e6
+    print(f"streaming: {per_packet:.2f} us/packet, batch closing a window max {close_times.max() * 1e3:8.2f} ms, "
+          f"closing alone max {max(close_work) * 1e3:8.2f} ms")
+    print(f"rebuild  : window close mean {rebuild_times.mean() * 1e3:8.2f} ms max {rebuild_times.max() * 1e3:8.2f} ms")
+
+    hopping, _, _ = stream(batches, args.hop)
+    errors = []
+    for offset in range(0, window_size, args.hop):
+        shifted = [dict(batch, time=batch['time'] - offset) for batch in batches]
+        expected, _ = rebuild(shifted, window_size)
+        expected.index = expected.index.set_levels(expected.index.levels[1] + pd.Timedelta(seconds=offset), level=1)
+        starts = hopping.index.get_level_values('dttime')
+        rows = hopping[((starts - pd.Timestamp(0)).total_seconds().astype(int) % window_size) == offset]
+        expected = expected[expected.index.get_level_values('dttime').isin(rows.index.get_level_values('dttime'))]
+        error = compare(rows, expected)
+        if error:
+            errors.append(f"offset {offset}: {error}")
+    print(f"hopping {window_size} s windows every {args.hop} s: {len(hopping)} rows, "
+          f"{'MISMATCH ' + '; '.join(errors) if errors else 'match'}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
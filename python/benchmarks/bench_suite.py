@@ -0,0 +1,226 @@
+"""
+Reproducible end to end benchmark: writes a deterministic synthetic LAN capture
+(`synthetic_traffic.lan_traffic`, video and interactive clients) and replays it as
+fast as possible through
+
+- `decode`: the raw pcap decoder only,
+- `pipeline`: raw decoder -> windows -> `preprocess` -> `make_batched_features` -> model,
+- `prefilter`: the same behind the throughput prefilter,
+- `reference` (`--reference`): Scapy `process_packet` -> `preprocess` ->
+  `make_windowed_features` and one `predict_proba` per client, as the first sniffer did,
+
+each case in a fresh process, reporting packets per second sustained, per window
+latency p50/p99, peak RSS, and the share of video / interactive client-windows
+classified as streaming. The startup (imports + model load) of both model backends
+is timed in fresh interpreters. Results are written as JSON, with the git commit,
+to track regressions across commits.
+
+```bash
+python3 benchmarks/bench_suite.py --clients 100 --pps 10000 --seconds 60 --output bench.json
+```
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from synthetic_traffic import lan_clients, lan_traffic, write_pcap  # noqa: E402
+
+ROOT = Path(__file__).resolve().parents[1]
+STARTUP = ("from config import config; config['model-backend'] = {backend!r}; "
+           "import scapy_sniffer; from feature_creation import load_model; load_model()")
+
+
+def percentiles(latencies):
+    values = 1e3 * np.asarray(latencies) if latencies else np.zeros(1)
+    return {'windows': len(latencies), 'p50_ms': round(float(np.percentile(values, 50)), 3),
+            'p99_ms': round(float(np.percentile(values, 99)), 3), 'max_ms': round(float(values.max()), 3)}
+
+
+def detection(verdicts, video_clients):
+    """Share of the video and interactive client-windows classified as streaming."""
+    video = [streaming for (client, _), streaming in verdicts.items() if int(client) in video_clients]
+    other = [streaming for (client, _), streaming in verdicts.items() if int(client) not in video_clients]
+    return {'video_streaming': round(float(np.mean(video)), 3) if video else None,
+            'interactive_streaming': round(float(np.mean(other)), 3) if other else None}
+
+
+def run_decode(pcap, args):
+    from pcap_decoder import RawPcapReader
+    packets = 0
+    start = time.perf_counter()
+    with RawPcapReader(open(pcap, 'rb')) as reader:
+        for batch in reader:
+            packets += len(batch['time'])
+    return packets, time.perf_counter() - start, [], {}
+
+
+def run_pipeline(pcap, args, prefilter=False):
+    from capture_buffer import PacketBuffer
+    from classifier import window_verdicts
+    from config import config
+    from feature_creation import load_model
+    from pcap_decoder import RawPcapReader
+    from pipeline import TimeWindower
+    from prefilter import ThroughputFilter
+
+    model = load_model()
+    features = list(getattr(model, 'feature_names_in_', config['selected_features']))
+    throughput = ThroughputFilter() if prefilter else None
+    windower = TimeWindower(PacketBuffer(), config['window-size'])
+    latencies, verdicts = [], {}
+
+    def classify(window):
+        start = time.perf_counter()
+        for client, (proba, _) in window_verdicts(model, window, features, throughput).items():
+            verdicts[(client, len(latencies))] = proba is not None and proba[1] > config['class-1-threshold']
+        latencies.append(time.perf_counter() - start)
+
+    packets = 0
+    start = time.perf_counter()
+    with RawPcapReader(open(pcap, 'rb')) as reader:
+        for batch in reader:
+            packets += len(batch['time'])
+            for window in windower.add(batch):
+                classify(window)
+    for window in windower.flush():
+        classify(window)
+    return packets, time.perf_counter() - start, latencies, verdicts
+
+
+def run_reference(pcap, args):
+    import pandas as pd
+    from scapy.all import PcapReader
+    from config import config
+    from feature_creation import load_model, make_windowed_features, preprocess
+    from scapy_sniffer import process_packet
+
+    model = load_model()
+    features = list(getattr(model, 'feature_names_in_', config['selected_features']))
+    latencies, verdicts = [], {}
+
+    def classify(rows):
+        start = time.perf_counter()
+        df = preprocess(pd.DataFrame(rows))
+        for client, group in df.groupby('client'):
+            window_features = make_windowed_features(group.copy())
+            if not window_features.empty:
+                proba = np.mean(model.predict_proba(window_features[features]), axis=0)
+                verdicts[(client, len(latencies))] = proba[1] > config['class-1-threshold']
+        latencies.append(time.perf_counter() - start)
+
+    rows, window, packets = [], None, 0
+    start = time.perf_counter()
+    with PcapReader(str(pcap)) as reader:
+        for packet in reader:
+            row = process_packet(packet)
+            if row is None:
+                continue
+            packets += 1
+            index = row['time'] // config['window-size']
+            if window is not None and index != window:
+                classify(rows)
+                rows = []
+            window = index
+            rows.append(row)
+    if rows:
+        classify(rows)
+    return packets, time.perf_counter() - start, latencies, verdicts
+
+
+CASES = {
+    'decode': run_decode,
+    'pipeline': run_pipeline,
+    'prefilter': lambda pcap, args: run_pipeline(pcap, args, prefilter=True),
+    'reference': run_reference,
+}
+
+
+def worker(case, pcap, args, queue):
+    warnings.simplefilter('ignore')
+    packets, elapsed, latencies, verdicts = CASES[case](pcap, args)
+    ips, is_video = lan_clients(args.clients, args.video, seed=args.seed)
+    queue.put({'packets': packets, 'seconds': round(elapsed, 3), 'pps': round(packets / elapsed),
+               **percentiles(latencies),
+               'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+               **(detection(verdicts, set(ips[is_video].tolist())) if verdicts else {})})
+
+
+def run_case(case, pcap, args):
+    """A case in a fresh process, so imports and peak RSS are its own."""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=worker, args=(case, pcap, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def startup(backend, repeat=3):
+    """Best of `repeat` fresh interpreters importing the sniffer and loading the model."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-W", "ignore", "-c", STARTUP.format(backend=backend)],
+                       check=True, cwd=ROOT, capture_output=True)
+        best = min(best, time.perf_counter() - start)
+    return round(best, 3)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End to end benchmark on deterministic synthetic traffic.")
+    parser.add_argument("--clients", type=int, default=100, help="Synthetic LAN clients.")
+    parser.add_argument("--video", type=float, default=0.3, help="Share of the clients watching video.")
+    parser.add_argument("--pps", type=int, default=10000, help="Packets per second of the capture.")
+    parser.add_argument("--seconds", type=int, default=60, help="Capture length.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the traffic.")
+    parser.add_argument("--cases", nargs='+', default=['decode', 'pipeline', 'prefilter'], choices=list(CASES),
+                        help="Cases to run.")
+    parser.add_argument("--reference", action="store_true", help="Also run the Scapy + pandas reference (slow).")
+    parser.add_argument("--output", type=str, default=None, help="JSON results file (default stdout).")
+    args = parser.parse_args()
+    cases = args.cases + (['reference'] if args.reference and 'reference' not in args.cases else [])
+
+    results = {'commit': git_commit(), 'python': platform.python_version(), 'machine': platform.machine(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'params': {name: getattr(args, name) for name in ('clients', 'video', 'pps', 'seconds', 'seed')},
+               'cases': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        pcap = Path(tmp) / 'lan.pcap'
+        results['params']['packets'] = write_pcap(
+            pcap, lan_traffic(args.clients, args.pps, args.seconds, args.video, args.seed))
+        for case in cases:
+            results['cases'][case] = run_case(case, pcap, args)
+            print(f"{case}: {results['cases'][case]}", file=sys.stderr)
+    results['startup_s'] = {backend: startup(backend) for backend in ('sklearn', 'numpy')}
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Peak RSS and per-window build time of the capture window storage:
+the previous list of `process_packet` dicts + `pd.DataFrame(data)` against
+`capture_buffer.PacketBuffer`. Each mode runs in its own process so peak RSS
+is not shared.
+
+```bash
+python3 benchmarks/bench_window_buffer.py --pps 6000 --windows 12
+python3 benchmarks/bench_window_buffer.py --pcap capture.pcap
+```
+"""
+
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from capture_buffer import PACKET_DTYPES, PacketBuffer, to_strings  # noqa: E402
+from pcap_decoder import RawPcapReader  # noqa: E402
+
+
+def synthetic_batches(pps, seconds, batch_size=2048, seed=0):
+    """Typed decoder batches of random LAN/WAN traffic."""
+    rng = np.random.default_rng(seed)
+    total = pps * seconds
+    for start in range(0, total, batch_size):
+        n = min(batch_size, total - start)
+        lan = (0xC0A80000 + rng.integers(2, 50, n)).astype(np.uint32)
+        wan = rng.integers(0x01000000, 0xDF000000, n).astype(np.uint32)
+        up = rng.random(n) < 0.3
+        tcp = rng.random(n) < 0.7
+        yield {
+            'src_ip': np.where(up, lan, wan), 'dst_ip': np.where(up, wan, lan),
+            'packet_size': rng.integers(40, 1500, n), 'time': (start + np.arange(n)) / pps,
+            'identification': rng.integers(0, 65535, n), 'ttl': rng.integers(30, 128, n),
+            'ip_flags': rng.choice([0, 2], n),
+            'tcp_sport': np.where(tcp, 443, -1), 'tcp_dport': np.where(tcp, rng.integers(1024, 65535, n), -1),
+            'tcp_seq': np.where(tcp, rng.integers(0, 2**32, n), -1), 'tcp_ack': np.where(tcp, rng.integers(0, 2**32, n), -1),
+            'tcp_flags': np.where(tcp, rng.choice([0x10, 0x18], n), 0),
+            'udp_sport': np.where(tcp, -1, 443), 'udp_dport': np.where(tcp, -1, rng.integers(1024, 65535, n)),
+        }
+
+
+def pcap_batches(path):
+    with RawPcapReader(open(path, 'rb')) as reader:
+        yield from reader
+
+
+def run_dicts(batches, per_window):
+    """Previous main(): one dict per packet, DataFrame built at the window boundary."""
+    data, times, count = [], [], 0
+    append_time = 0.0
+    for batch in batches:
+        batch = to_strings(batch)
+        columns = list(batch)
+        rows = zip(*(batch[name].tolist() for name in columns))
+        start = time.perf_counter()
+        for row in rows:
+            data.append(dict(zip(columns, row)))  # what process_packet returns
+        append_time += time.perf_counter() - start
+        count += len(batch['time'])
+        if count >= per_window:
+            start = time.perf_counter()
+            frame = pd.DataFrame(data)
+            times.append((append_time, time.perf_counter() - start))
+            del frame
+            data.clear()
+            count, append_time = 0, 0.0
+    return times
+
+
+def run_buffer(batches, per_window):
+    data, times = PacketBuffer(), []
+    append_time = 0.0
+    for batch in batches:
+        start = time.perf_counter()
+        data.extend(batch)
+        append_time += time.perf_counter() - start
+        if len(data) >= per_window:
+            start = time.perf_counter()
+            frame = data.frame()
+            times.append((append_time, time.perf_counter() - start))
+            del frame
+            data.clear()
+            append_time = 0.0
+    return times
+
+
+def worker(mode, args, queue):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.pcap:
+        # load up front so decoding is not part of either measurement
+        batches = [{name: np.asarray(column, dtype=PACKET_DTYPES[name]) for name, column in batch.items()}
+                   for batch in pcap_batches(args.pcap)]
+    else:
+        batches = synthetic_batches(args.pps, args.windows * args.window_size)
+    per_window = args.pps * args.window_size
+    times = (run_dicts if mode == 'dicts' else run_buffer)(batches, per_window)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((times, baseline, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark capture window storage.")
+    parser.add_argument("--pps", type=int, default=6000, help="Packets per second (and per window size).")
+    parser.add_argument("--windows", type=int, default=12, help="Number of windows to simulate.")
+    parser.add_argument("--window-size", type=int, default=10, help="Window size in seconds.")
+    parser.add_argument("--pcap", type=str, default=None, help="Use a recorded capture instead of synthetic packets.")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    for mode in ('dicts', 'buffer'):
+        queue = ctx.Queue()
+        process = ctx.Process(target=worker, args=(mode, args, queue))
+        process.start()
+        times, baseline, peak = queue.get()
+        process.join()
+        append = np.array([t[0] for t in times]) * 1e3
+        build = np.array([t[1] for t in times]) * 1e3
+        print(f"{mode:>6}: windows {len(times):3d} | append/window {append.mean():8.2f} ms | "
+              f"build/window mean {build.mean():8.2f} ms max {build.max():8.2f} ms | "
+              f"peak RSS {peak / 1024:7.1f} MB (+{(peak - baseline) / 1024:6.1f} MB over imports)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Deterministic synthetic LAN traffic written as decoder batches (typed columns as
+`pcap_decoder.RawPcapReader` yields them) to a classic pcap file, Ethernet/IPv4 with
+TCP or UDP headers captured like `tcpdump -s 54`, so benchmarks can replay it.
+
+`lan_traffic` mixes video clients (ABR players: a burst of full size segment packets
+from one CDN server every few seconds, at a varying quality, with their acks) and
+interactive clients (sparse request/response packets to many servers), in the first
+of `lan_subnets()`. The same arguments and seed give the same packets.
+
+```bash
+python3 benchmarks/synthetic_traffic.py /tmp/lan.pcap --clients 200 --video 0.3 --pps 20000 --seconds 60
+```
+"""
+
+import argparse
+import ipaddress
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from feature_creation import lan_subnets  # noqa: E402
+
+SEGMENT_SECONDS = 4  # ABR segment duration
+LINK_PPS = 4000  # packets per second of a segment burst
+VIDEO_WEIGHT = 8  # a video client sends this many times the packets of an interactive one
+SNAPLEN = 54  # ethernet + ip + tcp headers
+PCAP_HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, SNAPLEN, 1)
+
+RECORD = np.dtype([
+    ('ts_sec', '<u4'), ('ts_usec', '<u4'), ('caplen', '<u4'), ('len', '<u4'),
+    ('eth_dst', 'u1', 6), ('eth_src', 'u1', 6), ('ethertype', '>u2'),
+    ('version_ihl', 'u1'), ('tos', 'u1'), ('total_length', '>u2'), ('identification', '>u2'),
+    ('flags_frag', '>u2'), ('ttl', 'u1'), ('proto', 'u1'), ('checksum', '>u2'),
+    ('src_ip', '>u4'), ('dst_ip', '>u4'),
+    ('sport', '>u2'), ('dport', '>u2'), ('seq', '>u4'), ('ack', '>u4'),
+    ('offset', 'u1'), ('flags', 'u1'), ('window', '>u2'), ('l4_checksum', '>u2'), ('urgent', '>u2'),
+])
+
+
+def encode(batch):
+    """Pcap records (header + captured bytes) of a batch as bytes."""
+    n = len(batch['time'])
+    tcp = np.asarray(batch['tcp_sport']) >= 0
+    records = np.zeros(n, dtype=RECORD)
+    time = np.asarray(batch['time'])
+    records['ts_sec'] = time
+    records['ts_usec'] = np.round((time - np.floor(time)) * 1e6).clip(0, 999999)
+    records['caplen'] = SNAPLEN
+    records['len'] = np.maximum(14 + np.asarray(batch['packet_size']), SNAPLEN)
+    records['ethertype'] = 0x0800
+    records['version_ihl'] = 0x45
+    records['total_length'] = batch['packet_size']
+    records['identification'] = batch['identification']
+    records['flags_frag'] = np.asarray(batch['ip_flags']).astype(np.uint16) << 13
+    records['ttl'] = batch['ttl']
+    records['proto'] = np.where(tcp, 6, 17)
+    records['src_ip'] = batch['src_ip']
+    records['dst_ip'] = batch['dst_ip']
+    records['sport'] = np.where(tcp, batch['tcp_sport'], batch['udp_sport'])
+    records['dport'] = np.where(tcp, batch['tcp_dport'], batch['udp_dport'])
+    records['seq'] = np.where(tcp, batch['tcp_seq'], 0)
+    records['ack'] = np.where(tcp, batch['tcp_ack'], 0)
+    records['offset'] = np.where(tcp, 0x50, 0)
+    records['flags'] = np.where(tcp, np.asarray(batch['tcp_flags']) & 0xFF, 0)
+    return records.tobytes()
+
+
+def lan_clients(clients, video=0.3, subnet=None, seed=0):
+    """uint32 IPs of `clients` hosts of the LAN `subnet` and which of them watch video."""
+    network = ipaddress.ip_network(subnet or lan_subnets()[0], strict=False)
+    if network.version != 4 or clients > network.num_addresses - 3:
+        raise ValueError(f"{clients} clients do not fit in {network}")
+    ips = (int(network.network_address) + 2 + np.arange(clients)).astype(np.uint32)
+    is_video = np.zeros(clients, dtype=bool)
+    is_video[np.random.default_rng(seed).permutation(clients)[:round(video * clients)]] = True
+    return ips, is_video
+
+
+def _packets(rng, time, up, client, server, size, ttl, tcp, seq, ack):
+    n = len(time)
+    return {
+        'src_ip': np.where(up, client, server).astype(np.uint32),
+        'dst_ip': np.where(up, server, client).astype(np.uint32),
+        'packet_size': size.astype(np.int32), 'time': time,
+        'identification': rng.integers(0, 65536, n), 'ttl': np.where(up, 64, ttl),
+        'ip_flags': np.full(n, 2),  # DF
+        'tcp_sport': np.where(tcp, np.where(up, 50000, 443), -1),
+        'tcp_dport': np.where(tcp, np.where(up, 443, 50000), -1),
+        'tcp_seq': np.where(tcp, seq, -1), 'tcp_ack': np.where(tcp, ack, -1),
+        'tcp_flags': np.where(tcp, np.where(rng.random(n) < 0.2, 0x18, 0x10), 0),
+        'udp_sport': np.where(tcp, -1, np.where(up, 50000, 443)),
+        'udp_dport': np.where(tcp, -1, np.where(up, 443, 50000)),
+    }
+
+
+def _video(rng, start, seconds, rate, client, server, ttl, quic, phase):
+    """An ABR player: a segment every SEGMENT_SECONDS, downloaded as a burst, acked every 3 packets."""
+    segments = np.arange(start + phase, start + seconds, SEGMENT_SECONDS)
+    quality = rng.uniform(0.5, 1.5, len(segments))  # bitrate adaptation
+    counts = np.maximum((0.75 * rate * SEGMENT_SECONDS * quality).astype(np.int64), 1)
+    first = np.repeat(segments, counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    down = first + offset / LINK_PPS
+    acks = down[::3] + 2e-4
+    chatter = np.sort(rng.uniform(start, start + seconds, rng.poisson(0.05 * rate * seconds)))
+    time = np.concatenate([down, acks, chatter])
+    up = np.concatenate([np.zeros(len(down), bool), np.ones(len(acks), bool), rng.random(len(chatter)) < 0.5])
+    size = np.concatenate([np.where(rng.random(len(down)) < 0.9, 1500, rng.integers(600, 1500, len(down))),
+                           rng.integers(52, 67, len(acks)), rng.integers(60, 400, len(chatter))])
+    # one connection: the server sequence grows with the bytes downloaded, the client acks them,
+    # pure acks carry no payload so the server keeps acking the same client sequence
+    payload = np.concatenate([size[:len(down)] - 40, np.zeros(len(acks), np.int64), size[len(down) + len(acks):] - 40])
+    order = np.argsort(time, kind='stable')
+    downloaded = np.empty(len(time), dtype=np.int64)
+    downloaded[order] = np.cumsum(np.where(up, 0, payload)[order])
+    uploaded = np.empty(len(time), dtype=np.int64)
+    uploaded[order] = np.cumsum(np.where(up, payload, 0)[order])
+    seq = np.where(up, uploaded, downloaded)
+    ack = np.where(up, downloaded, uploaded)
+    return _packets(rng, time, up, client, server, size, ttl, np.full(len(time), not quic), seq, ack)
+
+
+def _interactive(rng, start, seconds, rate, client, servers, ttls):
+    """Browsing, messaging: small requests and responses of random sizes to many servers."""
+    n = rng.poisson(rate * seconds)
+    time = np.sort(rng.uniform(start, start + seconds, n))
+    pick = rng.integers(0, len(servers), n)
+    up = rng.random(n) < 0.45
+    size = np.where(rng.random(n) < 0.6, rng.integers(52, 300, n), rng.integers(300, 1500, n))
+    return _packets(rng, time, up, client, servers[pick], size, ttls[pick], rng.random(n) < 0.85,
+                    rng.integers(0, 2**32, n), rng.integers(0, 2**32, n))
+
+
+def lan_traffic(clients, pps, seconds, video=0.3, seed=0, batch_size=2048, block=10, start=1.7e9):
+    """
+    Decoder batches of `clients` LAN clients (`lan_clients`) sending about `pps`
+    packets per second for `seconds`, generated `block` seconds at a time in time order.
+    """
+    ips, is_video = lan_clients(clients, video, seed=seed)
+    rng = np.random.default_rng([seed, 0])
+    weights = np.where(is_video, VIDEO_WEIGHT, 1.0)
+    rates = pps * weights / weights.sum()
+    cdn = rng.integers(0x08000000, 0xDF000000, clients).astype(np.uint32)
+    cdn_ttl = rng.integers(50, 60, clients)
+    quic = rng.random(clients) < 0.5
+    phase = rng.uniform(0, SEGMENT_SECONDS, clients)
+    servers = rng.integers(0x01000000, 0xDF000000, (clients, 50)).astype(np.uint32)
+    server_ttls = rng.integers(40, 120, (clients, 50))
+    for index, block_start in enumerate(range(0, seconds, block)):
+        rng = np.random.default_rng([seed, index + 1])
+        length = min(block, seconds - block_start)
+        parts = [_video(rng, start + block_start, length, rates[c], ips[c], cdn[c], cdn_ttl[c], quic[c], phase[c])
+                 if is_video[c] else
+                 _interactive(rng, start + block_start, length, rates[c], ips[c], servers[c], server_ttls[c])
+                 for c in range(clients)]
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        order = np.argsort(columns['time'], kind='stable')
+        for first in range(0, len(order), batch_size):
+            rows = order[first:first + batch_size]
+            yield {name: column[rows] for name, column in columns.items()}
+
+
+def write_pcap(path, batches):
+    """Write `batches` to `path`, returns the number of packets."""
+    count = 0
+    with open(path, 'wb') as stream:
+        stream.write(PCAP_HEADER)
+        for batch in batches:
+            stream.write(encode(batch))
+            count += len(batch['time'])
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic multi-client pcap file.")
+    parser.add_argument("path", help="Output pcap file.")
+    parser.add_argument("--clients", type=int, default=200, help="Synthetic LAN clients.")
+    parser.add_argument("--video", type=float, default=0.3, help="Share of the clients watching video.")
+    parser.add_argument("--pps", type=int, default=20000, help="Packets per second.")
+    parser.add_argument("--seconds", type=int, default=60, help="Capture length.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, same seed same packets.")
+    args = parser.parse_args()
+    count = write_pcap(args.path, lan_traffic(args.clients, args.pps, args.seconds, args.video, args.seed))
+    print(f"Wrote {count} packets to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,107 @@
-import json
+import heapq
+import subprocess
 import time
 from datetime import datetime
 from config import config
+from pcap_decoder import format_ip
+from state_store import JournalStore
+from nft_set import NftSet, nft_seconds
 
 class Blocker:
-    def __init__(self, state_file='clients.json', blocked_ips_file='/etc/blocked-ips-v4.txt'):
+    def __init__(self, state_file='clients.json', blocked_ips_file='/etc/blocked-ips-v4.txt', nft=None):
         self.state_file = state_file
         self.blocked_ips_file = blocked_ips_file
         self.streaming_limit_seconds = config['streaming-limit-seconds']
+        # updates are buffered and journaled, see state_store.py
+        self.store = JournalStore(state_file, flush_interval=config['state-flush-seconds'])
         self.clients = self.load_state()
+        # blocklist loaded once and kept in sync, new entries written at window end
+        self.blocked_ips = self.load_blocklist()
+        self.pending_blocked_ips = []
+        # (client . server) elements of the nftables set, one transaction per window.
+        # A client's blocked servers and when nft drops them are kept in its record
+        # ('blocked_servers', {server: expiry time}), so they survive restarts.
+        self.nft = nft or NftSet()
+        self.block_seconds = nft_seconds(self.nft.timeout)
+        # per client max-heap of (-count, server), stale entries are skipped lazily
+        self.server_heaps = {ip: self._server_heap(client) for ip, client in self.clients.items()}
 
     def load_state(self):
-        try:
-            with open(self.state_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        # same JSON file as before plus the journal of the updates since the last compaction
+        return self.store.load()
 
     def save_state(self):
-        with open(self.state_file, 'w') as f:
-            json.dump(self.clients, f, indent=4)
+        """Write the clients updated since the last call, once per window."""
+        self.store.flush(self.clients)
+
+    def load_blocklist(self):
+        try:
+            with open(self.blocked_ips_file, 'r') as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    @staticmethod
+    def _server_heap(client):
+        heap = [(-count, ip) for ip, count in client['server_ips'].items()]
+        heapq.heapify(heap)
+        return heap
+
+    def top_servers(self, client_ip, k=1):
+        """
+        The `k` servers with most traffic of a client not blocked for it, or whose
+        nft block expired. Servers blocked now are dropped from the heap and pushed
+        back by the next traffic counted for them.
+        """
+        heap = self.server_heaps.get(client_ip, [])
+        client = self.clients[client_ip]
+        counts = client['server_ips']
+        blocked = client.get('blocked_servers', {})
+        now = time.time()
+        top = []
+        while heap and len(top) < k:
+            count, ip = heapq.heappop(heap)
+            if counts.get(ip) == -count and blocked.get(ip, 0) <= now:
+                top.append((count, ip))
+        for entry in top:
+            heapq.heappush(heap, entry)
+        return [ip for _, ip in top]
+
+    def end_window(self):
+        """Apply the blocks decided in the window and persist the state."""
+        try:
+            self.apply_blocks()
+        except (subprocess.CalledProcessError, OSError) as error:
+            print(f"nft update failed, retrying next window: {error}")
+        self.save_state()
+
+    def apply_blocks(self):
+        """
+        Commit the nft set changes, then append the new blocked IPs to the blocklist file.
+        Both stay queued when nft or the write fails, so the count of IPs added to the
+        file (returned) is only reported once they are written.
+        The expiry of the pairs committed is counted from the commit, so a pair is
+        blocked again at the latest one window after nft dropped it.
+        """
+        pairs = list(self.nft.adds)
+        self.nft.commit()
+        expiry = time.time() + self.block_seconds
+        for client_ip, ip in pairs:
+            client = self.clients.get(client_ip)
+            if client and ip in client.get('blocked_servers', {}):
+                client['blocked_servers'][ip] = expiry
+                self.store.mark(client_ip)
+        added = len(self.pending_blocked_ips)
+        if added:
+            with open(self.blocked_ips_file, 'a') as f:
+                f.writelines(f"{ip}\n" for ip in self.pending_blocked_ips)
+            self.pending_blocked_ips.clear()
+        return added
 
     def update_client_status(self, client_ip, is_streaming, server_ips):
+        # state is kept by dotted IP strings, the sniffer passes uint32 IPs
+        client_ip = format_ip(client_ip)
+        server_ips = [format_ip(ip) for ip in server_ips]
         if client_ip not in self.clients:
             self.clients[client_ip] = {
                 'is_streaming': False,
@@ -35,6 +115,7 @@ class Blocker:
 
         client = self.clients[client_ip]
         client['last_seen'] = time.time()
+        self.store.mark(client_ip)
 
         if is_streaming:
             client['consecutive_streaming_count'] += 1
@@ -62,11 +143,16 @@ class Blocker:
                 client['total_streaming_time'] += streaming_duration
                 client['streaming_start_time'] = time.time() # Reset start time for the next interval
 
+            heap = self.server_heaps.setdefault(client_ip, [])
             for ip in server_ips:
                 client['server_ips'][ip] = client['server_ips'].get(ip, 0) + 1 # Simple traffic count
+                heapq.heappush(heap, (-client['server_ips'][ip], ip))
+            if len(heap) > 2 * len(client['server_ips']) + 16:  # drop the stale entries
+                self.server_heaps[client_ip] = self._server_heap(client)
 
         self.check_quota_and_block(client_ip)
-        self.save_state()
+        if self.store.due():
+            self.save_state()
 
     def check_quota_and_block(self, client_ip):
         client = self.clients[client_ip]
@@ -74,23 +160,22 @@ class Blocker:
             if not client.get('is_blocked'):
                 print(f"Client {client_ip} has exceeded the streaming quota.")
 
-            # Get the server IP with the most traffic
-            if client['server_ips']:
-                # Sort by traffic count (descending)
-                sorted_ips = sorted(client['server_ips'].items(), key=lambda item: item[1], reverse=True)
-
-                # Find the first IP that is not already in the blocklist
-                with open(self.blocked_ips_file, 'a+') as f:
-                    f.seek(0)
-                    blocked_ips = [line.strip() for line in f.readlines()]
-
-                    for ip, count in sorted_ips:
-                        if ip not in blocked_ips:
-                            print(f"Blocking server {ip} for client {client_ip}.")
-                            f.write(f"{ip}\n")
-                            client['is_blocked'] = True
-                            # We only block one IP per call, as per the README
-                            break
+            # The server IP with the most traffic that is not already blocked for this client
+            # We only block one IP per call, as per the README
+            # An expired block (nft dropped the element) is renewed the same way
+            for ip in self.top_servers(client_ip):
+                print(f"Blocking server {ip} for client {client_ip}.")
+                if ip not in self.blocked_ips:  # the dnsmasq blocklist is global
+                    self.blocked_ips.add(ip)
+                    self.pending_blocked_ips.append(ip)
+                now = time.time()
+                blocked = client.setdefault('blocked_servers', {})
+                for server, expiry in list(blocked.items()):
+                    if expiry <= now:
+                        del blocked[server]
+                blocked[ip] = now + self.block_seconds  # set again when nft commits
+                self.nft.add(client_ip, ip)
+                client['is_blocked'] = True
 
     def cleanup_clients(self, timeout=3600):
         """Remove clients that haven't been seen for a while."""
@@ -99,4 +184,6 @@ class Blocker:
             if now - client_data['last_seen'] > timeout:
                 print(f"Removing inactive client {client_ip}.")
                 del self.clients[client_ip]
+                self.server_heaps.pop(client_ip, None)
+                self.store.delete(client_ip)
         self.save_state()
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Preallocated columnar buffer holding the packets of the current capture window.
+
+Replaces the list of `process_packet` dicts: decoders write typed columns into
+per-column NumPy arrays that grow in chunks, the window is handed to
+`preprocess` as zero-copy views and the buffer is reset without reallocating.
+IPs are stored as uint32 and IP/TCP flags as their header bit values.
+"""
+
+import socket
+import struct
+import numpy as np
+import pandas as pd
+from pcap_decoder import IP_FLAGS_STR, TCP_FLAGS_STR, ip_to_str
+
+# same columns as `process_packet`, -1 when the layer is missing
+PACKET_DTYPES = {
+    'src_ip': np.uint32,
+    'dst_ip': np.uint32,
+    'packet_size': np.int32,
+    'time': np.float64,
+    'identification': np.uint16,
+    'ttl': np.uint8,
+    'ip_flags': np.uint8,
+    'tcp_sport': np.int32,
+    'tcp_dport': np.int32,
+    'tcp_seq': np.int64,
+    'tcp_ack': np.int64,
+    'tcp_flags': np.uint16,
+    'udp_sport': np.int32,
+    'udp_dport': np.int32,
+}
+
+IP_FLAGS_INT = {name: value for value, name in enumerate(IP_FLAGS_STR)}
+TCP_FLAGS_INT = {name: value for value, name in enumerate(TCP_FLAGS_STR)}
+
+
+def packet_to_row(packet_data):
+    """Convert a `process_packet` dict (string IPs and flags) to typed column values."""
+    row = dict(packet_data)
+    row['src_ip'] = struct.unpack("!I", socket.inet_aton(packet_data['src_ip']))[0]
+    row['dst_ip'] = struct.unpack("!I", socket.inet_aton(packet_data['dst_ip']))[0]
+    row['ip_flags'] = IP_FLAGS_INT[packet_data['ip_flags']]
+    row['tcp_flags'] = TCP_FLAGS_INT[packet_data['tcp_flags']]
+    return row
+
+
+def to_strings(columns):
+    """
+    Columns with IPs and flags as the strings `process_packet` gives,
+    used for printing and for the training csv files.
+    """
+    columns = dict(columns)
+    columns['src_ip'] = ip_to_str(columns['src_ip'])
+    columns['dst_ip'] = ip_to_str(columns['dst_ip'])
+    columns['ip_flags'] = IP_FLAGS_STR[columns['ip_flags']]
+    columns['tcp_flags'] = TCP_FLAGS_STR[columns['tcp_flags']]
+    return columns
+
+
+class PacketBuffer:
+    """Typed per-column packet storage for one capture window."""
+
+    def __init__(self, chunk_size=65536):
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.capacity = 0
+        self.columns = {name: np.empty(0, dtype=dtype) for name, dtype in PACKET_DTYPES.items()}
+        self._reserve(chunk_size)
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, needed):
+        """Grow every column by whole chunks until `needed` packets fit."""
+        if needed <= self.capacity:
+            return
+        chunks = -(-needed // self.chunk_size)
+        capacity = chunks * self.chunk_size
+        for name, column in self.columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+        self.capacity = capacity
+
+    def append(self, row):
+        """Append a single packet, `row` as given by `packet_to_row`."""
+        self._reserve(self.size + 1)
+        for name, column in self.columns.items():
+            column[self.size] = row[name]
+        self.size += 1
+
+    def extend(self, batch):
+        """Append a batch of packets given as a dict of equally sized column arrays."""
+        count = len(batch['time'])
+        if not count:
+            return
+        self._reserve(self.size + count)
+        for name, column in self.columns.items():
+            column[self.size:self.size + count] = batch[name]
+        self.size += count
+
+    def window(self):
+        """Views of the buffered packets, only valid until the buffer is cleared or grown."""
+        return {name: column[:self.size] for name, column in self.columns.items()}
+
+    def frame(self):
+        """DataFrame over the buffered packets without copying the columns."""
+        return pd.DataFrame(self.window(), copy=False)
+
+    def clear(self):
+        """Reset the window keeping the allocated memory."""
+        self.size = 0
@@ -0,0 +1,65 @@
+"""
+Per client verdicts from the window features, shared by the single process
+sniffer and the sharded workers (`sharding.py`).
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from config import config
+from feature_creation import preprocess
+from feature_engine import make_batched_features
+from metrics import FEATURES, PREDICT, PREPROCESS
+from pcap_decoder import format_ip
+
+
+def client_probas(model, features):
+    """
+    Class probabilities of every client averaged over its time windows,
+    the rows of all clients scored in a single `predict_proba` call.
+    """
+    if features.empty:
+        return {}
+    codes, clients = pd.factorize(features.index.get_level_values('client'), sort=True)
+    with PREDICT.time():
+        proba = model.predict_proba(features)
+    counts = np.bincount(codes, minlength=len(clients))
+    avg_proba = np.column_stack([np.bincount(codes, weights=proba[:, k], minlength=len(clients))
+                                 for k in range(proba.shape[1])]) / counts[:, np.newaxis]
+    return dict(zip(clients, avg_proba))
+
+
+def window_verdicts(model, window, features=None, prefilter=None):
+    """
+    Classify a window of decoded packets (columns as in `capture_buffer`).
+    Returns {client ip: (average class probabilities, server ips)}, with None
+    probabilities for the clients short-circuited by the `prefilter` (not streaming).
+    """
+    with PREPROCESS.time():
+        df_data = preprocess(pd.DataFrame(window, copy=False))
+    verdicts = {}
+    if prefilter is not None:
+        df_data, idle = prefilter.select(df_data)
+        verdicts = {client_ip: (None, np.empty(0, dtype=np.uint32)) for client_ip in idle}
+    if df_data.empty:
+        return verdicts
+    with FEATURES.time():
+        features = make_batched_features(df_data, features=features)
+    client_servers = df_data.groupby('client', observed=True)['server'].unique()
+    verdicts.update({client_ip: (avg_proba, np.asarray(client_servers[client_ip]))
+                     for client_ip, avg_proba in client_probas(model, features).items()})
+    return verdicts
+
+
+def log_verdict(client_ip, avg_proba, client_status="ALLOWED"):
+    """Print the activity of a client (uint32 or string IP), returns whether it is streaming."""
+    is_streaming = avg_proba[1] > config['class-1-threshold']
+    status_msg = "IS STREAMING" if is_streaming else "is NOT streaming"
+    score = 100 * avg_proba[1] if is_streaming else 100 * avg_proba[0]
+    print(
+        f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | "
+        f"Client: {format_ip(client_ip):<15} | Status: {client_status:<7} | "
+        f"Activity: {status_msg:<15} | "
+        f"Score/Score Threshold: {score:3.0f}%/{config['class-1-threshold']*100:3.0f}%"
+    )
+    return is_streaming
@@ -12,13 +12,44 @@ config['selected_features'] = ['ack_entropy',
                             'dw_pkt_entropy',
                             'dl_pkt_avg']
 
-config['lan-subnet'] = '192.168.0.0'
-config['lan-subnet-mask'] = 24
+# LAN subnets (IPv4 and IPv6 prefixes), packets from/to them define the clients
+# e.g. ['192.168.0.0/24', '10.0.0.0/8', 'fd00::/8']
+config['lan-subnets'] = ['192.168.0.0/24']
 # window of statistical analysis of tcp header data and grouping to create features 
 config['window-size'] = 10 
 config['class-1-threshold'] = 0.6
 config['streaming-limit-seconds'] = 3600 # 1 hour
+# blocker state is journaled at window end, or at most every these seconds
+config['state-flush-seconds'] = 60
+# nftables set of blocked (client . server) pairs, see README (Router rule)
+config['nft'] = {'family': 'inet', 'table': 'fw4', 'set': 'stream_user_block',
+                 'timeout': '2h', 'command': ['nft']}
+# enforcement worker: nft/dnsmasq updates at most every these seconds
+config['enforce-min-interval'] = 10
+config['dnsmasq-reload'] = ['/etc/init.d/dnsmasq', 'reload']
+# throughput fast path (prefilter.py): only clients whose EWMA rate reaches start (and until
+# it falls below stop) are classified by the model, the others are not streaming.
+# Off by default (or --prefilter): on synthetic traffic it misses streaming verdicts of low
+# rate video clients (benchmarks/bench_prefilter.py --traffic video --pps 2000)
+config['prefilter'] = {'enabled': False, 'start-kbps': 400, 'stop-kbps': 150,
+                       'start-pps': 50, 'stop-pps': 20, 'half-life': 10}
+# bounded queues between the capture, windowing and classification stages
+# policy when full: 'block' (backpressure), 'drop-newest' or 'drop-oldest'
+config['queue-size'] = 8
+config['queue-policy'] = {'windowing': 'block', 'classification': 'drop-oldest'}
 
 config['path'] = {}
 config['path']['raw'] = pathlib.Path(__file__).parent / 'training' / 'raw.h5'
+# training captures appended in chunks by training_store.TrainingRecorder
+config['path']['packets'] = pathlib.Path(__file__).parent / 'training' / 'packets.h5'
+# features per capture cached by extract_features.py
+config['path']['features-cache'] = pathlib.Path(__file__).parent / 'training' / 'features-cache'
 config['model'] = pathlib.Path(__file__).parent / 'etree.joblib'
+# 'sklearn' or 'numpy': score with the forest exported to flat arrays (tree_export.py),
+# faster for small batches and no sklearn import at startup
+config['model-backend'] = 'sklearn'
+config['model-arrays'] = pathlib.Path(__file__).parent / 'etree.npz'
+# native capture library of --decoder native (native_capture.py), `make -C libpcap`
+config['native-capture'] = pathlib.Path(__file__).parents[1] / 'libpcap' / 'libcapture.so'
+# BPF filter of the native capture, the one of the tcpdump command line
+config['capture-filter'] = 'port 80 or port 443'
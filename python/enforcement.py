@@ -0,0 +1,141 @@
+"""
+Enforcement off the capture path: the classifier submits per client verdicts to a
+bounded queue (blocking when full, no verdict is lost) and an `Enforcer` thread
+owns the `Blocker`. It applies the 3-consecutive-window hysteresis of
+`update_client_status`, and at window end applies the blocks decided (one nft
+transaction, repeated requests for the same (client . server) coalesced by
+`NftSet`) and signals dnsmasq to reload the blocklist, at most once every
+`min_interval` seconds and retried with backoff.
+
+Enforcement latency is measured from the verdict being submitted to the nft/dnsmasq
+update that applied it, see `stats()`.
+"""
+
+import queue
+import subprocess
+import threading
+import time
+from config import config
+from metrics import BLOCKER_IO
+from pcap_decoder import format_ip
+from pipeline import BoundedQueue
+
+
+def run_command(command):
+    subprocess.run(command, check=True, capture_output=True)
+
+
+class Enforcer(threading.Thread):
+    def __init__(self, blocker, maxsize=4096, min_interval=None, max_backoff=60, runner=None):
+        super().__init__(name="enforcer", daemon=True)
+        self.blocker = blocker
+        # never dropped: the hysteresis counts consecutive verdicts and a 'window' event
+        # triggers the apply, a full queue makes the classifier wait instead
+        self.events = BoundedQueue('enforcement', maxsize, 'block')
+        self.min_interval = config['enforce-min-interval'] if min_interval is None else min_interval
+        self.max_backoff = max_backoff
+        self.runner = runner or run_command
+        self.reload_command = config['dnsmasq-reload']
+        self.window_ended = False
+        self.reload_pending = False
+        self.oldest_pending = None  # submit time of the oldest verdict not applied yet
+        self.next_apply = 0.0
+        self.backoff = 1.0
+        self.verdicts = 0
+        self.applies = 0
+        self.failures = 0
+        self.reloads = 0
+        self.queue_latency = []  # seconds, of the last windows
+        self.apply_latency = []
+
+    def submit(self, client_ip, is_streaming, server_ips):
+        """Queue a client verdict (called from the classification stage)."""
+        self.events.put(('verdict', time.time(), client_ip, is_streaming, server_ips))
+
+    def end_window(self):
+        """Queue the window end, blocks decided in the window are applied after it."""
+        self.events.put(('window', time.time(), None, None, None))
+
+    def is_blocked(self, client_ip):
+        client = self.blocker.clients.get(format_ip(client_ip))
+        return bool(client and client.get('is_blocked'))
+
+    def start(self):
+        super().start()
+        return self
+
+    def stop(self):
+        """Apply what is pending and stop the thread."""
+        self.events.close()
+        self.join()
+
+    def run(self):
+        while True:
+            try:
+                event = self.events.get(timeout=self._wait())
+            except queue.Empty:
+                event = False  # a deferred apply is due
+            if event is None:
+                break
+            if event:
+                self._handle(*event)
+            if self.window_ended and time.time() >= self.next_apply:
+                self._apply()
+        self._apply()
+
+    def _wait(self):
+        if not self.window_ended:
+            return None
+        return max(self.next_apply - time.time(), 0.0)
+
+    def _handle(self, kind, submitted, client_ip, is_streaming, server_ips):
+        self.queue_latency.append(time.time() - submitted)
+        if kind == 'window':
+            self.window_ended = True
+            return
+        self.verdicts += 1
+        blocked = len(self.blocker.nft.adds)
+        self.blocker.update_client_status(client_ip, is_streaming, server_ips)
+        if len(self.blocker.nft.adds) > blocked and self.oldest_pending is None:
+            self.oldest_pending = submitted
+
+    def _apply(self):
+        """
+        Apply the pending blocks and dnsmasq reload, backing off on failure.
+        The state is saved on every attempt, a failing nft or dnsmasq does not lose it.
+        """
+        try:
+            with BLOCKER_IO.time():
+                try:
+                    if self.blocker.apply_blocks():
+                        self.reload_pending = True
+                    if self.reload_pending:
+                        self.runner(self.reload_command)
+                        self.reload_pending = False
+                        self.reloads += 1
+                finally:
+                    self.blocker.save_state()
+        except (subprocess.CalledProcessError, OSError) as error:
+            self.failures += 1
+            print(f"Enforcement failed, retrying in {self.backoff:.0f} s: {error}")
+            self.next_apply = time.time() + self.backoff
+            self.backoff = min(2 * self.backoff, self.max_backoff)
+            return
+        if self.oldest_pending is not None:
+            self.apply_latency.append(time.time() - self.oldest_pending)
+            self.oldest_pending = None
+        self.applies += 1
+        self.window_ended = False
+        self.backoff = 1.0
+        self.next_apply = time.time() + self.min_interval  # rate limit
+        del self.queue_latency[:-1000], self.apply_latency[:-1000]
+
+    def stats(self):
+        def ms(values, q):
+            return round(1e3 * sorted(values)[int(q * (len(values) - 1))], 3) if values else 0.0
+        return {'verdicts': self.verdicts, 'applies': self.applies, 'failures': self.failures,
+                'reloads': self.reloads, 'queue': self.events.stats(),
+                'queue_latency_ms_p50': ms(self.queue_latency, 0.5),
+                'queue_latency_ms_max': ms(self.queue_latency, 1.0),
+                'apply_latency_ms_p50': ms(self.apply_latency, 0.5),
+                'apply_latency_ms_max': ms(self.apply_latency, 1.0)}
@@ -0,0 +1,143 @@
+"""
+Offline feature extraction of recorded captures over a process pool.
+
+Each input (pcap, csv of the old training mode, or HDF5 table with a scenario `name`
+column as raw.h5/packets.h5) is read in chunks, re-cut at window edges
+(`training_store.window_chunks`, a window straddling two chunks is kept whole) and
+the chunks are preprocessed and featured (`make_batched_features`, per scenario
+`name` as `make_windowed_features` is in the notebook) by `--workers` processes.
+
+Features of every input are cached in `config['path']['features-cache']`, keyed by
+the hash of the file content and the feature set (`FEATURES_VERSION`, features,
+window size, LAN subnets), so unchanged captures are never recomputed.
+
+```bash
+python3 extract_features.py training/*.txt training/raw.h5 capture.pcap --workers 4 --output features.h5
+```
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+from config import config
+from capture_buffer import PacketBuffer
+from feature_creation import iter_hdf, lan_subnets, preprocess
+from feature_engine import FEATURES_VERSION, make_batched_features, plan_features
+from pcap_decoder import RawPcapReader
+from training_store import window_chunks
+
+PCAP_SUFFIXES = ('.pcap', '.cap', '.dmp')
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(path, features=None):
+    """Hash of the file content and of everything the features depend on."""
+    names = plan_features(features)[0]
+    settings = json.dumps([FEATURES_VERSION, names, config['window-size'], lan_subnets()])
+    return hashlib.sha256(f"{file_hash(path)} {settings}".encode()).hexdigest()[:24]
+
+
+def read_chunks(path, chunksize=500_000):
+    """Raw packet rows of a capture in chunks, with a scenario `name` (the file name when missing)."""
+    path = Path(path)
+    if path.suffix in ('.h5', '.hdf5'):
+        with pd.HDFStore(path, mode='r') as store:
+            keys = store.keys()
+        for key in keys:
+            for chunk in iter_hdf(path, key, chunksize=chunksize):
+                yield chunk if 'name' in chunk else chunk.assign(name=path.stem)
+    elif path.suffix in PCAP_SUFFIXES:
+        buffer = PacketBuffer(chunksize)
+        with RawPcapReader(open(path, 'rb')) as reader:
+            for batch in reader:
+                buffer.extend(batch)
+                if len(buffer) >= chunksize:
+                    yield buffer.frame().copy().assign(name=path.stem)
+                    buffer.clear()
+        if len(buffer):
+            yield buffer.frame().copy().assign(name=path.stem)
+    else:  # csv files written by the old training mode
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            yield chunk if 'name' in chunk else chunk.assign(name=path.stem)
+
+
+def chunk_features(df, features=None):
+    """Features per (name, window) of whole windows of raw rows, with the label `y` when recorded."""
+    labels = df.groupby('name')['y'].first() if 'y' in df else None
+    xy = make_batched_features(preprocess(df), by='name', features=features)
+    if labels is not None:
+        xy['y'] = xy.index.get_level_values('name').map(labels)
+    return xy
+
+
+def extract(path, features=None, executor=None, workers=1, chunksize=500_000, cache_dir=None):
+    """Features of a capture, from the cache or computed chunk by chunk on `executor`."""
+    cache_dir = Path(cache_dir or config['path']['features-cache'])
+    cache_file = cache_dir / f"{Path(path).name}-{cache_key(path, features)}.h5"
+    if cache_file.exists():
+        return pd.read_hdf(cache_file, 'features'), True
+
+    frames = []
+    pending = collections.deque()
+    for df in window_chunks(read_chunks(path, chunksize), by='name'):
+        if executor is None:
+            frames.append(chunk_features(df, features))
+            continue
+        if len(pending) >= 2 * workers:  # bound the chunks held in memory
+            frames.append(pending.popleft().result())
+        pending.append(executor.submit(chunk_features, df, features))
+    frames += [future.result() for future in pending]
+    xy = pd.concat(frames).sort_index() if frames else pd.DataFrame()
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix('.tmp')
+    xy.to_hdf(tmp_file, key='features', mode='w')
+    os.replace(tmp_file, cache_file)
+    return xy, False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute training features of recorded captures in parallel.")
+    parser.add_argument("inputs", nargs='+', help="pcap, csv or HDF5 (raw.h5, packets.h5) captures.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes, 0 to compute in this one.")
+    parser.add_argument("--features", nargs='+', default=None, help="Features to compute (default all).")
+    parser.add_argument("--chunk", type=int, default=500_000, help="Packets per chunk.")
+    parser.add_argument("--cache", type=str, default=None, help="Cache directory.")
+    parser.add_argument("--output", type=str, default=None, help="HDF5 file of all the features (key 'features').")
+    args = parser.parse_args()
+
+    executor = None
+    if args.workers:
+        executor = concurrent.futures.ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('spawn'))
+    frames = []
+    try:
+        for path in args.inputs:
+            start = time.perf_counter()
+            xy, cached = extract(path, args.features, executor, args.workers, args.chunk, args.cache)
+            print(f"{path}: {len(xy)} windows, {'cached' if cached else f'{time.perf_counter() - start:.1f} s'}")
+            frames.append(xy)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if args.output:
+        pd.concat(frames).to_hdf(args.output, key='features', mode='w')
+        print(f"Features written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
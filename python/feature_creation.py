@@ -1,48 +1,198 @@
-import struct
-import socket
+import ipaddress
 import numpy as np
 import pandas as pd
 from config import config
 from joblib import load
+from pcap_decoder import str_to_ip
+from tree_export import ForestEvaluator, export_forest
+
+HDF_KEY = 'raw_packets'
+NAME_SIZE = 64  # itemsize of the scenario `name` column
+
+
+def hdf_where(names=None, start=None, end=None):
+    """Query on the `name` and `time` data columns, None for everything."""
+    terms = []
+    if names is not None:
+        terms.append(f"name in {list(names)!r}")
+    if start is not None:
+        terms.append(f"time >= {float(start)!r}")
+    if end is not None:
+        terms.append(f"time < {float(end)!r}")
+    return " & ".join(terms) or None
+
+
+def _append_new(store, key, df):
+    store.append(key, df, index=False, min_itemsize={'name': NAME_SIZE} if 'name' in df else None,
+                 data_columns=[column for column in ('name', 'time') if column in df])
+
+
+def _copy_hdf(store, source, target, chunksize):
+    """Copy the table `source` to a new table `target` chunk by chunk, then remove `source`."""
+    if target in store:  # left by an interrupted copy
+        store.remove(target)
+    for chunk in store.select(source, chunksize=chunksize):
+        _append_new(store, target, chunk)
+    store.remove(source)
+
+
+def _migrate_hdf(store, key, chunksize=500_000):
+    """
+    Rewrite, once, a table written by the old `update_hdf` (`to_hdf(format='table')`: no data
+    columns, `name` as wide as its longest value then) in the layout of `append_hdf`,
+    through a `<key>_migrating` copy. An interrupted migration resumes from the phase it
+    stopped in. The space of the old table is only reclaimed by `ptrepack`.
+    """
+    print(f"Migrating the HDF5 table '{key}' to the appendable layout (once)...")
+    migrating = f"{key}_migrating"
+    if key in store and not _queryable(store, key):
+        _copy_hdf(store, key, migrating, chunksize)
+    _copy_hdf(store, migrating, key, chunksize)
+
+
+def _queryable(store, key):
+    """Whether the `name` and `time` columns of the table are data columns."""
+    columns = {'name', 'time'} & set(store.select(key, stop=0).columns)
+    return columns <= set(store.get_storer(key).data_columns or ())
+
+
+def append_hdf(path, key, df):
+    """Append rows to an HDF5 table without rewriting it, created with `name` and `time` as data columns."""
+    with pd.HDFStore(path, mode='a') as store:
+        if f"{key}_migrating" in store or (key in store and not _queryable(store, key)):
+            _migrate_hdf(store, key)
+        if key not in store:
+            _append_new(store, key, df)
+            return
+        storer = store.get_storer(key)
+        if 'name' in df and len(df):
+            size, longest = storer.table.coldescrs['name'].itemsize, df['name'].str.len().max()
+            if longest > size:
+                raise ValueError(f"Scenario names are stored in {size} characters, "
+                                 f"'{df['name'][df['name'].str.len().idxmax()]}' has {longest}.")
+        store.append(key, df, index=False)
+
+
+def iter_hdf(path, key, names=None, start=None, end=None, chunksize=500_000):
+    """
+    Rows of an HDF5 table in chunks of `chunksize`, only of the scenarios `names` and times in [start, end).
+    Selected on disk when `name`/`time` are data columns, else (tables written by the old
+    `update_hdf`) filtered chunk by chunk.
+    """
+    with pd.HDFStore(path, mode='r') as store:
+        queryable = set(store.get_storer(key).data_columns or ())
+        needed = {column for column, value in (('name', names), ('time', start), ('time', end)) if value is not None}
+        if needed <= queryable:
+            yield from store.select(key, where=hdf_where(names, start, end), chunksize=chunksize)
+            return
+        for chunk in store.select(key, chunksize=chunksize):
+            mask = np.ones(len(chunk), dtype=bool)
+            if names is not None:
+                mask &= chunk['name'].isin(list(names)).to_numpy()
+            if start is not None:
+                mask &= chunk['time'].to_numpy() >= start
+            if end is not None:
+                mask &= chunk['time'].to_numpy() < end
+            yield chunk[mask]
+
 
 def update_hdf(df):
-    dfdisk = pd.read_hdf(config['path']['raw'])
-    dfdisk = pd.concat([dfdisk, df], ignore_index=True)
-    dfdisk.to_hdf(config['path']['raw'], key="raw_packets", mode='w', format='table')
+    """Append training rows (with `name` and `y` columns) to raw.h5."""
+    append_hdf(config['path']['raw'], HDF_KEY, df)
+
+
+def read_hdf(names=None, start=None, end=None, chunksize=None):
+    """
+    Training rows of raw.h5, only of the scenarios `names` and times in [start, end).
+    With `chunksize` an iterator of DataFrames, so the whole file is never in memory.
+    """
+    chunks = iter_hdf(config['path']['raw'], HDF_KEY, names, start, end, chunksize or 500_000)
+    if chunksize:
+        return chunks
+    return pd.concat(list(chunks) or [pd.DataFrame()], ignore_index=True)
 
-def read_hdf():
-    df = pd.read_hdf(config['path']['raw'])
-    return df
 
 def load_model():    
+    if config['model-backend'] == 'numpy':
+        path = config['model-arrays']
+        if not path.exists() or path.stat().st_mtime < config['model'].stat().st_mtime:
+            export_forest(load(config['model']), path)  # once per model, needs sklearn
+        return ForestEvaluator(path)
     model = load(config['model'])
     return model
 
 
-def preprocess(df):
+def lan_subnets():
+    """config['lan-subnets'], or the single subnet of an older config (lan-subnet, lan-subnet-mask)."""
+    if 'lan-subnets' in config:
+        return config['lan-subnets']
+    return [f"{config['lan-subnet']}/{config['lan-subnet-mask']}"]
+
+
+def lan_networks(subnets=None):
+    """IPv4 subnets as (network, mask) uint32 pairs and IPv6 prefixes as `ipaddress` networks."""
+    v4, v6 = [], []
+    for subnet in subnets or lan_subnets():
+        network = ipaddress.ip_network(subnet, strict=False)
+        if network.version == 4:
+            v4.append((int(network.network_address), int(network.netmask)))
+        else:
+            v6.append(network)
+    return v4, v6
+
+
+def is_lan_ip(ip_array, subnets=None):
     """
-    Function to preprocess tcpdump raw tcp header data
+    Mask of the IPs inside any of the LAN `subnets` (default `lan_subnets()`).
+    uint32 IPs are tested with one mask operation per IPv4 subnet,
+    string IPs (csv files, IPv6) once per unique IP.
     """
+    v4, v6 = lan_networks(subnets)
+    ip_array = np.asarray(ip_array)
+    if pd.api.types.is_integer_dtype(ip_array.dtype):
+        ip_ints = ip_array.astype(np.uint32)
+        inside = np.zeros(len(ip_ints), dtype=bool)
+        for network, mask in v4:
+            inside |= (ip_ints & mask) == network
+        return inside
+    codes, uniques = pd.factorize(ip_array)
+    uniques = np.asarray(uniques).astype(str)
+    ipv6 = np.array([':' in ip for ip in uniques], dtype=bool)
+    inside = np.zeros(len(uniques), dtype=bool)
+    inside[~ipv6] = is_lan_ip(str_to_ip(uniques[~ipv6]), subnets)
+    inside[ipv6] = [any(ip in network for network in v6) for ip in map(ipaddress.ip_address, uniques[ipv6])]
+    return inside[codes]
+
 
-    # Function to convert IP string to integer
-    def ip_to_int(ip):
-        return struct.unpack("!I", socket.inet_aton(ip))[0]
+def as_ip_ints(ip_array):
+    """uint32 IPs from uint32 or dotted string arrays, IPv6 strings are kept as strings."""
+    ip_array = np.asarray(ip_array)
+    if pd.api.types.is_integer_dtype(ip_array.dtype):
+        return ip_array.astype(np.uint32)
+    codes, uniques = pd.factorize(ip_array)
+    uniques = np.asarray(uniques).astype(str)
+    if any(':' in ip for ip in uniques):
+        return uniques[codes]
+    return str_to_ip(uniques)[codes]
 
-    # Function to check if IPs are in subnet
-    def is_ip_in_subnet(ip_array, subnet, mask_bits):
-        subnet_int = ip_to_int(subnet)
-        mask = (0xFFFFFFFF << (32 - mask_bits)) & 0xFFFFFFFF
-        ip_ints = np.vectorize(ip_to_int)(ip_array)
-        return (ip_ints & mask) == (subnet_int & mask)
+
+def preprocess(df):
+    """
+    Function to preprocess tcpdump raw tcp header data
+    client and server are uint32 IPs (dotted strings only for logging and the blocker)
+    """
 
     # Initialize new columns
     df['client'] = ''
     df['server'] = ''
     df['updown'] = 0  # -1 for download, +1 for upload
 
+    # Parse string IPs (csv files) once per unique IP
+    df = df.assign(src_ip=as_ip_ints(df['src_ip'].values), dst_ip=as_ip_ints(df['dst_ip'].values))
+
     # Perform vectorized subnet checks
-    df.loc[:, 'src_in_subnet'] = is_ip_in_subnet(df['src_ip'].values, config['lan-subnet'], config['lan-subnet-mask'])
-    df.loc[:, 'dst_in_subnet'] = is_ip_in_subnet(df['dst_ip'].values, config['lan-subnet'], config['lan-subnet-mask'])
+    df.loc[:, 'src_in_subnet'] = is_lan_ip(df['src_ip'].values)
+    df.loc[:, 'dst_in_subnet'] = is_lan_ip(df['dst_ip'].values)
 
     # Filter out rows where both src_ip and dst_ip are in the subnet (ignore internal traffic)
     internal_traffic_mask = df['src_in_subnet'] & df['dst_in_subnet']
@@ -50,8 +200,9 @@ def preprocess(df):
     # we might have empty df if no wan-lan traffic
 
     # Assign 'client' and 'server' based on whether src_ip or dst_ip is in the subnet
-    df.loc[:, 'client'] = np.where(df['src_in_subnet'], df['src_ip'], df['dst_ip'])
-    df.loc[:, 'server'] = np.where(df['src_in_subnet'], df['dst_ip'], df['src_ip'])
+    client = np.where(df['src_in_subnet'], df['src_ip'], df['dst_ip'])
+    server = np.where(df['src_in_subnet'], df['dst_ip'], df['src_ip'])
+    df = df.assign(client=client, server=server)
 
     # Assign 'updown' based on whether src_ip or dst_ip is in the subnet
     df.loc[:, 'updown'] = np.where(df['src_in_subnet'], 1, -1)
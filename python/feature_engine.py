@@ -0,0 +1,297 @@
+"""
+Batched feature engine: computes the `make_windowed_features` features for every
+(client, window) pair of a capture in a single pass.
+
+Rows are sorted once by (client, time) so each (client, window) pair is a
+contiguous segment, the means/variances are segment reductions (`np.add.reduceat`)
+and value counts for entropies and nunique are done for all segments at once.
+Output matches `make_windowed_features` applied per client (see benchmarks/bench_features.py).
+
+Every feature is registered in `FEATURES` with the input columns and shared
+intermediates it needs and a relative cost; `plan_features` resolves what a
+set of features needs so inference only computes the features the model uses.
+"""
+
+import numpy as np
+import pandas as pd
+from config import config
+
+
+def _segment_sum(values, starts):
+    return np.add.reduceat(values, starts) if len(values) else np.zeros(0)
+
+
+def _segment_var(values, seg, starts, counts, mask=None):
+    """Sample variance (ddof=1) per segment, two pass like pandas, NaN for counts < 2."""
+    values = values.astype(np.float64)
+    if mask is not None:
+        values = np.where(mask, values, 0.0)
+    mean = _segment_sum(values, starts) / counts
+    dev = values - mean[seg]
+    if mask is not None:
+        dev = np.where(mask, dev, 0.0)
+    return _segment_sum(dev * dev, starts) / np.where(counts > 1, counts - 1, np.nan)
+
+
+def _value_counts(values, seg):
+    """
+    Count of every distinct value inside each segment, NaNs ignored like `value_counts`.
+    Returns the segment of each distinct (segment, value) pair and its count.
+    """
+    if values.dtype.kind in 'iub' and len(values) and values.min() >= -1 and values.max() < 2**32:
+        codes = values.astype(np.int64) + 1  # fits in 33 bits
+    elif values.dtype.kind == 'f':
+        valid = ~np.isnan(values)
+        values, seg = values[valid], seg[valid]
+        codes = np.unique(values, return_inverse=True)[1].astype(np.int64)
+    else:
+        codes = pd.factorize(values)[0].astype(np.int64)
+    if not len(codes):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # small value ranges (sizes, ttls, flags) are counted in a (segment, value) table, no sort
+    ncodes = int(codes.max()) + 1
+    size = (int(seg.max()) + 1) * ncodes
+    if size <= max(4 * len(codes), 1 << 16):
+        table = np.bincount(seg.astype(np.int64) * ncodes + codes, minlength=size)
+        pairs = np.flatnonzero(table)
+        return pairs // ncodes, table[pairs]
+    keys = np.sort((seg.astype(np.int64) << 33) | codes)
+    new_run = np.ones(len(keys), dtype=bool)
+    new_run[1:] = keys[1:] != keys[:-1]
+    run_starts = np.flatnonzero(new_run)
+    return keys[run_starts] >> 33, np.diff(np.append(run_starts, len(keys)))
+
+
+def _entropy_of_counts(run_seg, counts, nseg):
+    total = np.bincount(run_seg, weights=counts, minlength=nseg)
+    prob = counts / total[run_seg]
+    return -np.bincount(run_seg, weights=prob * np.log2(prob), minlength=nseg)
+
+
+def _entropy(values, seg, nseg):
+    return _entropy_of_counts(*_value_counts(values, seg), nseg)
+
+
+def _nunique(values, seg, nseg):
+    run_seg, _ = _value_counts(values, seg)
+    return np.bincount(run_seg, minlength=nseg)
+
+
+class Segments:
+    """
+    Rows of a capture sorted by (group, time) and split in (group, window) segments.
+    Input columns are gathered on first use and intermediates shared by several
+    features (up/down masks, sums, variances, value counts) are computed once.
+    """
+
+    def __init__(self, df, by='client'):
+        self.df = df
+        self.window_size = config['window-size']
+        if by is None:
+            keys, self.key_values = np.zeros(len(df), dtype=np.int64), None
+        else:
+            keys, self.key_values = pd.factorize(df[by], sort=True)
+        time = df['time'].to_numpy(dtype=np.float64)
+        if len(time) and np.all(time[1:] >= time[:-1]) and keys.max() < 1 << 16:
+            # capture order: a stable sort by group keeps it, radix sort of 16 bit keys
+            self.order = np.argsort(keys.astype(np.uint16), kind='stable')
+        else:
+            self.order = np.lexsort((time, keys))
+        self.keys, self.time = keys[self.order], time[self.order]
+        self._cache = {}
+
+        # windows aligned as resample does (origin at the start of the first day of each group),
+        # rows are sorted by (group, time) so every (group, window) is a contiguous segment
+        new_key = np.ones(len(self.keys), dtype=bool)
+        new_key[1:] = self.keys[1:] != self.keys[:-1]
+        key_starts = np.flatnonzero(new_key)
+        self.origin = np.repeat(np.floor(self.time[key_starts] / 86400) * 86400,
+                                np.diff(np.append(key_starts, len(self.keys))))
+        self.window = np.floor((self.time - self.origin) / self.window_size).astype(np.int64)
+
+        new_segment = new_key.copy()
+        new_segment[1:] |= self.window[1:] != self.window[:-1]
+        self.starts = np.flatnonzero(new_segment)
+        self.nseg = len(self.starts)
+        self.seg = np.cumsum(new_segment) - 1
+        self.counts = np.diff(np.append(self.starts, len(self.keys))).astype(np.float64)
+
+    def column(self, name):
+        """Input column in segment order."""
+        if name not in self._cache:
+            self._cache[name] = self.df[name].to_numpy()[self.order]
+        return self._cache[name]
+
+    def get(self, name):
+        """Shared intermediate `name` from `INTERMEDIATES`, computed once."""
+        if name not in self._cache:
+            self._cache[name] = INTERMEDIATES[name].compute(self)
+        return self._cache[name]
+
+    def index(self, by):
+        bin_seconds = self.origin[self.starts].astype(np.int64) + self.window[self.starts] * self.window_size
+        dttime = pd.DatetimeIndex(bin_seconds.astype('datetime64[s]').astype('datetime64[ns]'), name='dttime')
+        if by is None:
+            return dttime
+        return pd.MultiIndex.from_arrays([self.key_values[self.keys[self.starts]], dttime], names=[by, 'dttime'])
+
+
+class Feature:
+    """
+    A windowed feature (or shared intermediate): the input columns and intermediates
+    it needs, a relative cost (1 segment sum, 2 variance, 3 value counts) and how to
+    compute it from `Segments`.
+    """
+
+    def __init__(self, columns=(), needs=(), cost=1, compute=None):
+        self.columns = tuple(columns)
+        self.needs = tuple(needs)
+        self.cost = cost
+        self.compute = compute
+
+
+def _time_diff(sg):
+    """Time differences between consecutive packets of the same segment, NaN on the first."""
+    time_diff = np.full(len(sg.time), np.nan)
+    time_diff[1:] = sg.time[1:] - sg.time[:-1]
+    time_diff[sg.starts] = np.nan
+    return time_diff
+
+
+def _masked_sum(sg, mask, values):
+    return _segment_sum(np.where(sg.get(mask), values, 0.0), sg.starts)
+
+
+INTERMEDIATES = {
+    'up': Feature(['updown'], cost=1, compute=lambda sg: sg.column('updown') > 0),
+    'dw': Feature(needs=['up'], cost=1, compute=lambda sg: ~sg.get('up')),
+    'n_up': Feature(needs=['up'], cost=1, compute=lambda sg: _segment_sum(sg.get('up').astype(np.float64), sg.starts)),
+    'n_dw': Feature(needs=['n_up'], cost=1, compute=lambda sg: sg.counts - sg.get('n_up')),
+    'size': Feature(['packet_size'], cost=1, compute=lambda sg: sg.column('packet_size').astype(np.float64)),
+    'up_sum': Feature(needs=['up', 'size'], cost=1, compute=lambda sg: _masked_sum(sg, 'up', sg.get('size'))),
+    'dw_sum': Feature(needs=['dw', 'size'], cost=1, compute=lambda sg: _masked_sum(sg, 'dw', sg.get('size'))),
+    'up_avg': Feature(needs=['up_sum', 'n_up'], cost=1, compute=lambda sg: sg.get('up_sum') / sg.get('n_up')),
+    'dw_avg': Feature(needs=['dw_sum', 'n_dw'], cost=1, compute=lambda sg: sg.get('dw_sum') / sg.get('n_dw')),
+    'up_var': Feature(needs=['size', 'n_up', 'up'], cost=2,
+                      compute=lambda sg: _segment_var(sg.get('size'), sg.seg, sg.starts, sg.get('n_up'), sg.get('up'))),
+    'dw_var': Feature(needs=['size', 'n_dw', 'dw'], cost=2,
+                      compute=lambda sg: _segment_var(sg.get('size'), sg.seg, sg.starts, sg.get('n_dw'), sg.get('dw'))),
+    'time_diff': Feature(cost=1, compute=_time_diff),
+    'ack_counts': Feature(['tcp_ack'], cost=3, compute=lambda sg: _value_counts(sg.column('tcp_ack'), sg.seg)),
+}
+
+
+def _dl_pkt_avg(sg):
+    time_diff = sg.get('time_diff')
+    has_diff = ~np.isnan(time_diff)
+    return _segment_sum(np.where(has_diff, time_diff, 0.0), sg.starts) / (sg.counts - 1)
+
+
+def _jitter(sg):
+    time_diff = sg.get('time_diff')
+    has_diff = ~np.isnan(time_diff)
+    return _segment_var(np.where(has_diff, time_diff, 0.0), sg.seg, sg.starts, sg.counts - 1, has_diff)
+
+
+def _masked(sg, column, mask):
+    mask = sg.get(mask)
+    return sg.column(column)[mask], sg.seg[mask]
+
+
+# Same features as `feature_creation.make_windowed_features`, in the same column order
+FEATURES = {
+    'pkt_entropy': Feature(['packet_size'], cost=3,
+                           compute=lambda sg: _entropy(sg.column('packet_size'), sg.seg, sg.nseg)),
+    'up_pkt_entropy': Feature(['packet_size'], ['up'], cost=3,
+                              compute=lambda sg: _entropy(*_masked(sg, 'packet_size', 'up'), sg.nseg)),
+    'dw_pkt_entropy': Feature(['packet_size'], ['dw'], cost=3,
+                              compute=lambda sg: _entropy(*_masked(sg, 'packet_size', 'dw'), sg.nseg)),
+    'up_speed': Feature(needs=['up_sum'], compute=lambda sg: sg.get('up_sum') / sg.window_size),
+    'dw_speed': Feature(needs=['dw_sum'], compute=lambda sg: sg.get('dw_sum') / sg.window_size),
+    'net_updown': Feature(needs=['up_sum', 'dw_sum'], compute=lambda sg: sg.get('up_sum') - sg.get('dw_sum')),
+    'div_updown': Feature(needs=['up_sum', 'dw_sum'],
+                          compute=lambda sg: sg.get('up_sum') / np.where(sg.get('dw_sum') != 0, sg.get('dw_sum'), 1)),
+    'div_updown_var': Feature(needs=['up_var', 'dw_var'],
+                              compute=lambda sg: sg.get('up_var') / np.where(sg.get('dw_var') != 0, sg.get('dw_var'), 1)),
+    'up_pkt_var': Feature(needs=['up_var'], compute=lambda sg: sg.get('up_var')),
+    'dw_pkt_var': Feature(needs=['dw_var'], compute=lambda sg: sg.get('dw_var')),
+    'up_pkt_avg': Feature(needs=['up_avg'], compute=lambda sg: sg.get('up_avg')),
+    'dw_pkt_avg': Feature(needs=['dw_avg'], compute=lambda sg: sg.get('dw_avg')),
+    'dw_ttl_unique': Feature(['ttl'], ['dw'], cost=3,
+                             compute=lambda sg: _nunique(*_masked(sg, 'ttl', 'dw'), sg.nseg)),
+    'dw_ttl_avg': Feature(['ttl'], ['dw', 'n_dw'], cost=1,
+                          compute=lambda sg: _masked_sum(sg, 'dw', sg.column('ttl').astype(np.float64)) / sg.get('n_dw')),
+    'tcp_ack_var': Feature(['tcp_ack'], cost=2,
+                           compute=lambda sg: _segment_var(sg.column('tcp_ack'), sg.seg, sg.starts, sg.counts)),
+    'updw_pkt': Feature(needs=['up_avg', 'dw_avg'], compute=lambda sg: sg.get('dw_avg') - sg.get('up_avg')),
+    'dl_pkt_avg': Feature(needs=['time_diff'], cost=1, compute=_dl_pkt_avg),
+    'dl_pkt_entropy': Feature(needs=['time_diff'], cost=4,  # value counts of floats
+                              compute=lambda sg: _entropy(sg.get('time_diff'), sg.seg, sg.nseg)),
+    'jitter': Feature(needs=['time_diff'], cost=2, compute=_jitter),
+    'num_unique_ips': Feature(['server'], cost=3, compute=lambda sg: _nunique(sg.column('server'), sg.seg, sg.nseg)),
+    'tcp_nports': Feature(['tcp_sport', 'tcp_dport'], cost=6,
+                          compute=lambda sg: _nunique(sg.column('tcp_sport'), sg.seg, sg.nseg) +
+                          _nunique(sg.column('tcp_dport'), sg.seg, sg.nseg)),
+    'udp_nports': Feature(['udp_sport', 'udp_dport'], cost=6,
+                          compute=lambda sg: _nunique(sg.column('udp_sport'), sg.seg, sg.nseg) +
+                          _nunique(sg.column('udp_dport'), sg.seg, sg.nseg)),
+    'tcp_seq': Feature(['tcp_seq'], cost=3, compute=lambda sg: _nunique(sg.column('tcp_seq'), sg.seg, sg.nseg)),
+    'tcp_ack': Feature(needs=['ack_counts'], cost=1,
+                       compute=lambda sg: np.bincount(sg.get('ack_counts')[0], minlength=sg.nseg)),
+    'tcp_flags': Feature(['tcp_flag'], cost=3, compute=lambda sg: _nunique(sg.column('tcp_flag'), sg.seg, sg.nseg)),
+    'ttl_entropy': Feature(['ttl'], cost=3, compute=lambda sg: _entropy(sg.column('ttl'), sg.seg, sg.nseg)),
+    'ack_entropy': Feature(needs=['ack_counts'], cost=1,
+                           compute=lambda sg: _entropy_of_counts(*sg.get('ack_counts'), sg.nseg)),
+}
+
+FEATURE_COLUMNS = list(FEATURES)
+# bump when a feature computation changes, invalidates the extract_features.py caches
+FEATURES_VERSION = 1
+
+# a window has a NaN feature (and is dropped) unless it has 2 upload and 2 download packets
+INTERMEDIATES['valid'] = Feature(needs=['n_up', 'n_dw'], cost=1,
+                                 compute=lambda sg: (sg.get('n_up') >= 2) & (sg.get('n_dw') >= 2))
+
+
+def plan_features(names=None):
+    """
+    Plan the computation of features `names` (all when None).
+    Returns the features in output order, the shared intermediates they need
+    (each computed once, dependencies first), the input columns read and the total cost.
+    """
+    names = FEATURE_COLUMNS if names is None else list(names)
+    unknown = [name for name in names if name not in FEATURES]
+    if unknown:
+        raise KeyError(f"Unknown features {unknown}, available {FEATURE_COLUMNS}")
+    intermediates, columns = [], set()
+
+    def visit(feature):
+        columns.update(feature.columns)
+        for need in feature.needs:
+            if need not in intermediates:
+                visit(INTERMEDIATES[need])
+                intermediates.append(need)
+
+    for name in names:
+        visit(FEATURES[name])
+    visit(INTERMEDIATES['valid'])
+    cost = sum(FEATURES[name].cost for name in names) + sum(INTERMEDIATES[name].cost for name in intermediates)
+    return names, intermediates, sorted(columns), cost
+
+
+def make_batched_features(df, by='client', features=None):
+    """
+    Windowed features of every `by` group (client, or None for a single group) and window.
+    Same features and window rule as `make_windowed_features`: windows of
+    `config['window-size']` seconds aligned as `resample` does and dropped if any of
+    the 27 features would be NaN, even when only some `features` (all when None) are computed.
+    Returns a DataFrame indexed by (by, dttime), or by dttime only if `by` is None.
+    """
+    names, intermediates, _, _ = plan_features(features)
+    sg = Segments(df, by)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name in intermediates:
+            sg.get(name)
+        values = {name: np.asarray(FEATURES[name].compute(sg), dtype=np.float64) for name in names}
+    gfeatures = pd.DataFrame(values, index=sg.index(by), columns=names)
+    return gfeatures[sg.get('valid')].dropna()
@@ -0,0 +1,259 @@
+"""
+Process metrics of the sniffer: counters, gauges and latency histograms in a
+`Registry`, exposed as Prometheus text on a local HTTP endpoint (`serve`) and/or
+as a periodic JSON log line (`JsonLogger`). The `stats()` dicts of the pipeline,
+enforcer and prefilter are exported at scrape time through collectors.
+
+`WindowProfiler` is the opt-in hook dumping a cProfile of the classification of
+one window (`--profile-window`), for `python -m pstats` or snakeviz.
+
+Metrics are per process: with `--workers` the preprocess/feature/predict
+histograms of the shard workers are not exported, the window lag is.
+"""
+
+import contextlib
+import cProfile
+import http.server
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name, {}, self.value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the `q` quantile (the largest bound for +Inf)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield f"{self.name}_bucket", {'le': '+Inf' if bound == float('inf') else repr(bound)}, total
+        yield f"{self.name}_sum", {}, self.sum
+        yield f"{self.name}_count", {}, self.count
+
+
+def stats_samples(prefix, stats, label=None):
+    """
+    (name, labels, value) of the numbers in a `stats()` dict, nested dicts flattened
+    into the name, or their keys given as `label` values for the first level.
+    """
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            if label is not None:
+                for name, labels, number in stats_samples(prefix, value):
+                    yield name, {label: key, **labels}, number
+            else:
+                yield from stats_samples(f"{prefix}_{key}", value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}_{key}", {}, value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = {}
+
+    def _add(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self._add(Counter(name, help))
+
+    def gauge(self, name, help):
+        return self._add(Gauge(name, help))
+
+    def histogram(self, name, help, buckets=BUCKETS):
+        return self._add(Histogram(name, help, buckets))
+
+    def collect(self, prefix, stats, label=None):
+        """Export `stats()` (a callable returning a dict) under `prefix` at every scrape."""
+        self.collectors[prefix] = (stats, label)
+
+    def prometheus(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+            lines += [_sample_line(*sample) for sample in metric.samples()]
+        families = {}  # one TYPE line per name, its samples differ by labels
+        for prefix, (stats, label) in list(self.collectors.items()):
+            for name, labels, value in stats_samples(prefix, stats(), label):
+                families.setdefault(name, []).append(_sample_line(name, labels, value))
+        for name, samples in families.items():
+            lines += [f"# TYPE {name} untyped", *samples]
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Flat dict of the values, histograms as count/p50/p99/max-bucket in ms."""
+        values = {}
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Histogram):
+                values[name] = {'count': metric.count,
+                                'p50_ms': round(1e3 * metric.quantile(0.5), 3),
+                                'p99_ms': round(1e3 * metric.quantile(0.99), 3),
+                                'mean_ms': round(1e3 * metric.sum / metric.count, 3) if metric.count else 0.0}
+            else:
+                values[name] = metric.value
+        for prefix, (stats, _) in list(self.collectors.items()):
+            values[prefix] = stats()
+        return values
+
+
+def _sample_line(name, labels, value):
+    if labels:
+        name += "{" + ",".join(f'{key}="{label}"' for key, label in labels.items()) + "}"
+    return f"{name} {value}"
+
+
+def serve(registry, port, host='127.0.0.1'):
+    """Serve `registry` as Prometheus text on http://host:port/metrics from a daemon thread."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # no line per scrape
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+class JsonLogger(threading.Thread):
+    """Writes the registry snapshot as one JSON line every `interval` seconds, counters also as rates."""
+
+    def __init__(self, registry, interval, stream=None):
+        super().__init__(name="metrics-log", daemon=True)
+        self.registry = registry
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.stopped = threading.Event()
+        self.last = {}
+        self.last_time = time.time()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.log()
+
+    def log(self):
+        now = time.time()
+        values = self.registry.snapshot()
+        for name, metric in self.registry.metrics.items():
+            if metric.kind == 'counter':
+                values[f"{name}_per_s"] = round((metric.value - self.last.get(name, 0)) / (now - self.last_time), 1)
+                self.last[name] = metric.value
+        self.last_time = now
+        print(json.dumps({'time': round(now, 3), **values}), file=self.stream, flush=True)
+
+    def stop(self):
+        self.stopped.set()
+        self.log()
+
+
+class WindowProfiler:
+    """Runs the `window`-th call of the wrapped function under cProfile and dumps the profile to `path`."""
+
+    def __init__(self, window, path=None):
+        self.window = window
+        self.path = path or f"window-{window}.prof"
+        self.calls = 0
+
+    def wrap(self, func):
+        def profiled(*args, **kwargs):
+            self.calls += 1
+            if self.calls != self.window:
+                return func(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                profile.dump_stats(self.path)
+                summary = io.StringIO()
+                pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(15)
+                print(f"Profile of window {self.window} written to {self.path}\n{summary.getvalue()}")
+        return profiled
+
+
+REGISTRY = Registry()
+PACKETS = REGISTRY.counter('packets_decoded_total', "Packets decoded from the capture.")
+WINDOWS = REGISTRY.counter('windows_classified_total', "Windows classified.")
+WINDOW_BUILD = REGISTRY.histogram('window_build_seconds', "Time to cut decoded batches in windows.")
+PREPROCESS = REGISTRY.histogram('preprocess_seconds', "preprocess() time per window.")
+FEATURES = REGISTRY.histogram('features_seconds', "Feature extraction time per window.")
+PREDICT = REGISTRY.histogram('predict_proba_seconds', "predict_proba() time per window.")
+BLOCKER_IO = REGISTRY.histogram('blocker_io_seconds', "nft, blocklist, dnsmasq and state file updates per apply.")
+ACTIVE_CLIENTS = REGISTRY.gauge('active_clients', "Clients with packets in the last window.")
+WINDOW_LAG = REGISTRY.gauge('window_lag_seconds', "Wall clock minus the last packet timestamp of the window classified.")
@@ -0,0 +1,96 @@
+"""
+Batched updates of the nftables set of blocked (client . server) pairs described
+in the README (`table inet fw4 { set stream_user_block { type ipv4_addr . ipv4_addr;
+flags timeout; } }`).
+
+Element adds/deletes are queued and applied in a single `nft -f -` transaction
+(`commit`, once per window). The command runner is pluggable: `FakeNft` keeps the
+set in memory so the blocker can be exercised without nftables or root.
+"""
+
+import re
+import subprocess
+from config import config
+
+NFT_UNITS = {'d': 86400, 'h': 3600, 'm': 60, 's': 1}
+
+
+def nft_seconds(timeout):
+    """Seconds of an nft time such as '2h' or '1h30m'."""
+    parts = re.findall(r'(\d+)([dhms])', timeout)
+    if not parts or ''.join(number + unit for number, unit in parts) != timeout:
+        raise ValueError(f"Invalid nft timeout '{timeout}', use e.g. '2h' or '1h30m'.")
+    return sum(int(number) * NFT_UNITS[unit] for number, unit in parts)
+
+
+def run_nft(script, command=None):
+    """Apply an nft script atomically (`nft -f -`), raises CalledProcessError on failure."""
+    command = command or config['nft']['command']
+    subprocess.run([*command, '-f', '-'], input=script, text=True, check=True, capture_output=True)
+
+
+class NftSet:
+    def __init__(self, runner=None, family=None, table=None, name=None, timeout=None):
+        settings = config['nft']
+        self.runner = runner or run_nft
+        self.family = family or settings['family']
+        self.table = table or settings['table']
+        self.name = name or settings['set']
+        self.timeout = timeout or settings['timeout']
+        self.adds = {}
+        self.deletes = set()
+        self.transactions = 0
+
+    def add(self, client_ip, server_ip, timeout=None):
+        """Queue `client . server` to be blocked for `timeout` (nft time, e.g. '2h')."""
+        self.deletes.discard((client_ip, server_ip))
+        self.adds[(client_ip, server_ip)] = timeout or self.timeout
+
+    def delete(self, client_ip, server_ip):
+        self.adds.pop((client_ip, server_ip), None)
+        self.deletes.add((client_ip, server_ip))
+
+    def script(self):
+        """The queued changes as one nft transaction."""
+        target = f"{self.family} {self.table} {self.name}"
+        lines = []
+        if self.adds:
+            elements = ", ".join(f"{client} . {server} timeout {timeout}"
+                                 for (client, server), timeout in self.adds.items())
+            lines.append(f"add element {target} {{ {elements} }}")
+        if self.deletes:
+            elements = ", ".join(f"{client} . {server}" for client, server in self.deletes)
+            lines.append(f"delete element {target} {{ {elements} }}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def commit(self):
+        """Apply the queued changes, returns the number of elements changed."""
+        script = self.script()
+        if not script:
+            return 0
+        self.runner(script)  # on failure the changes stay queued for the next commit
+        changed = len(self.adds) + len(self.deletes)
+        self.adds.clear()
+        self.deletes.clear()
+        self.transactions += 1
+        return changed
+
+
+class FakeNft:
+    """Runner keeping the set elements in memory, for tests and benchmarks."""
+
+    def __init__(self):
+        self.elements = {}
+        self.scripts = []
+
+    def __call__(self, script):
+        self.scripts.append(script)
+        for line in script.splitlines():
+            action, _, rest = line.partition(" element ")
+            for element in rest[rest.index("{") + 1:rest.rindex("}")].split(","):
+                fields = element.split()
+                key = (fields[0], fields[2])
+                if action == "add":
+                    self.elements[key] = fields[4] if len(fields) > 4 else None
+                else:
+                    self.elements.pop(key, None)
@@ -0,0 +1,238 @@
+"""
+Fast pcap ingest: reads a classic libpcap stream (stdin, FIFO or file) in large
+blocks and decodes the Ethernet/IPv4/TCP/UDP header fields that
+`scapy_sniffer.process_packet` produces using fixed offsets and NumPy gathers,
+instead of building Scapy layer objects for every packet.
+
+Only the record headers are walked in Python (they are variable length); all
+header fields of a block are then decoded at once.
+pcapng streams are not supported, use `--decoder scapy` for those.
+"""
+
+import socket
+import struct
+import numpy as np
+
+PCAP_MAGIC = {  # magic -> (byte order, timestamp resolution)
+    b'\xd4\xc3\xb2\xa1': ('<', 1e6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e9),
+}
+
+# link types tcpdump writes for the interfaces we capture on
+DLT_EN10MB = 1
+DLT_RAW = 101
+DLT_LINUX_SLL = 113
+DLT_LINUX_SLL2 = 276
+LINKTYPES = {DLT_EN10MB, DLT_RAW, 12, 14, DLT_LINUX_SLL, DLT_LINUX_SLL2}
+
+ETH_P_IP = 0x0800
+ETH_P_8021Q = (0x8100, 0x88a8)
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+# same strings scapy gives for str(flags), "NONE" when no flag is set
+TCP_FLAG_NAMES = 'FSRPAUECN'
+IP_FLAG_NAMES = ('MF', 'DF', 'evil')
+
+
+def _flag_strings(names, nbits, sep):
+    table = []
+    for value in range(1 << nbits):
+        flags = [name for bit, name in enumerate(names) if value & (1 << bit)]
+        table.append(sep.join(flags) if flags else "NONE")
+    return np.array(table, dtype=object)
+
+
+TCP_FLAGS_STR = _flag_strings(TCP_FLAG_NAMES, 9, '')
+IP_FLAGS_STR = _flag_strings(IP_FLAG_NAMES, 3, '+')
+
+
+def ip_to_str(ip_ints):
+    """Convert an array of uint32 IPs to dotted strings (one inet_ntoa per unique IP)."""
+    uniques, inverse = np.unique(np.asarray(ip_ints, dtype=np.uint32), return_inverse=True)
+    names = np.array([socket.inet_ntoa(struct.pack('!I', int(ip))) for ip in uniques], dtype=object)
+    return names[inverse]
+
+
+def str_to_ip(ip_strs):
+    """Convert an array of dotted IPv4 strings to uint32, parsing the characters of all strings at once."""
+    chars = np.asarray(ip_strs).astype('S16').view(np.uint8).reshape(-1, 16)
+    if chars[:, 15].any():  # longer than 15 characters, not cut to a valid IP
+        raise ValueError("Not dotted IPv4 strings.")
+    chars = np.ascontiguousarray(chars[:, :15].T).astype(np.uint32)
+    ips = np.zeros(chars.shape[1], dtype=np.uint32)
+    octet = np.zeros(chars.shape[1], dtype=np.uint32)
+    dots = np.zeros(chars.shape[1], dtype=np.uint32)
+    valid = np.ones(chars.shape[1], dtype=bool)
+    has_digit = np.zeros(chars.shape[1], dtype=bool)  # of the current octet
+    ended = np.zeros(chars.shape[1], dtype=bool)
+    for char in chars:  # one character position of every string at a time
+        digit = (char >= ord('0')) & (char <= ord('9'))
+        dot = char == ord('.')
+        valid &= (digit | dot | (char == 0)) & ~(ended & (digit | dot))
+        valid &= ~dot | has_digit  # empty octet
+        ended |= char == 0
+        ips = np.where(dot, (ips << 8) | octet, ips)
+        valid &= octet <= 255
+        octet = np.where(digit, octet * 10 + char - ord('0'), np.where(dot, 0, octet))
+        has_digit = np.where(dot, False, has_digit | digit)
+        dots += dot
+    if not (valid & has_digit & (octet <= 255) & (dots == 3)).all():
+        raise ValueError("Not dotted IPv4 strings.")
+    return (ips << 8) | octet
+
+
+def format_ip(ip):
+    """Dotted string of a single uint32 IP, strings (e.g. IPv6) are returned as they are."""
+    return ip if isinstance(ip, str) else socket.inet_ntoa(struct.pack('!I', int(ip)))
+
+
+def _be16(data, idx):
+    return (data[idx].astype(np.uint16) << 8) | data[idx + 1]
+
+
+def _be32(data, idx):
+    return ((data[idx].astype(np.uint32) << 24) | (data[idx + 1].astype(np.uint32) << 16) |
+            (data[idx + 2].astype(np.uint32) << 8) | data[idx + 3])
+
+
+class RawPcapReader:
+    """
+    Iterates over a pcap stream yielding one batch per block read.
+    Each batch is a dict of NumPy arrays with the `process_packet` columns,
+    IPs as uint32 and flags as their bit values (see `capture_buffer.to_strings`).
+    Non IPv4 packets are skipped as in `process_packet`.
+    """
+
+    def __init__(self, stream, block_size=1 << 20):
+        self.stream = stream
+        self.block_size = block_size
+        # read1 returns whatever the pipe has instead of waiting for a full block
+        self._read = getattr(stream, 'read1', stream.read)
+        header = self._read_exact(24)
+        if len(header) < 24 or header[:4] not in PCAP_MAGIC:
+            raise ValueError("Not a classic pcap stream (pcapng?), use the scapy decoder.")
+        self.endian, self.resolution = PCAP_MAGIC[header[:4]]
+        self.linktype = struct.unpack(self.endian + 'I', header[20:24])[0] & 0xFFFF
+        if self.linktype not in LINKTYPES:
+            raise ValueError(f"Unsupported pcap link type {self.linktype}.")
+        self._record = struct.Struct(self.endian + 'IIII')
+        self._pending = b''
+
+    def _read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self._read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.stream.close()
+
+    def __iter__(self):
+        while True:
+            chunk = self._read(self.block_size)
+            if not chunk:
+                return
+            buffer = self._pending + chunk if self._pending else chunk
+            batch, consumed = self.decode_block(buffer)
+            self._pending = buffer[consumed:]
+            if batch is not None:
+                yield batch
+
+    def decode_block(self, buffer):
+        """
+        Decode every complete record in `buffer`.
+        Returns (batch or None, number of bytes consumed).
+        """
+        unpack_from = self._record.unpack_from
+        size = len(buffer)
+        offsets, ts_sec, ts_frac, caplens = [], [], [], []
+        pos = 0
+        while pos + 16 <= size:
+            sec, frac, caplen, _ = unpack_from(buffer, pos)
+            if pos + 16 + caplen > size:
+                break  # partial record, wait for the next block
+            offsets.append(pos + 16)
+            ts_sec.append(sec)
+            ts_frac.append(frac)
+            caplens.append(caplen)
+            pos += 16 + caplen
+        if not offsets:
+            return None, pos
+        data = np.frombuffer(buffer, dtype=np.uint8, count=pos)
+        batch = self.decode_headers(data, np.array(offsets, dtype=np.int64),
+                                    np.array(caplens, dtype=np.int64),
+                                    np.array(ts_sec, dtype=np.float64) +
+                                    np.array(ts_frac, dtype=np.float64) / self.resolution)
+        return batch, pos
+
+    def _network_offsets(self, data, start, end):
+        """Offset of the IP header for each packet and a mask of IPv4 ones."""
+        last = len(data) - 2
+        if self.linktype == DLT_EN10MB:
+            ethertype = _be16(data, np.minimum(start + 12, last))
+            vlan = np.isin(ethertype, ETH_P_8021Q)
+            ethertype = np.where(vlan, _be16(data, np.minimum(start + 16, last)), ethertype)
+            l3 = start + np.where(vlan, 18, 14)
+            is_ip = ethertype == ETH_P_IP
+        elif self.linktype == DLT_LINUX_SLL:
+            is_ip = _be16(data, np.minimum(start + 14, last)) == ETH_P_IP
+            l3 = start + 16
+        elif self.linktype == DLT_LINUX_SLL2:
+            is_ip = _be16(data, np.minimum(start, last)) == ETH_P_IP
+            l3 = start + 20
+        else:  # raw IP
+            is_ip = np.ones(len(start), dtype=bool)
+            l3 = start
+        is_ip &= l3 + 20 <= end
+        return l3, is_ip
+
+    def decode_headers(self, data, start, caplen, times):
+        end = start + caplen
+        l3, is_ip = self._network_offsets(data, start, end)
+        l3 = l3[is_ip]
+        end = end[is_ip]
+        times = times[is_ip]
+        version_ihl = data[l3]
+        ipv4 = (version_ihl >> 4) == 4
+        l3, end, times, version_ihl = l3[ipv4], end[ipv4], times[ipv4], version_ihl[ipv4]
+
+        flags_frag = _be16(data, l3 + 6)
+        proto = data[l3 + 9]
+        first_fragment = (flags_frag & 0x1FFF) == 0
+        l4 = l3 + (version_ihl & 0x0F).astype(np.int64) * 4
+        is_tcp = (proto == IPPROTO_TCP) & first_fragment & (l4 + 14 <= end)
+        is_udp = (proto == IPPROTO_UDP) & first_fragment & (l4 + 4 <= end)
+        # offsets of packets without the layer point at 0 so truncated ones can be gathered
+        l4_ports = np.where(is_tcp | is_udp, l4, 0)
+        l4_tcp = np.where(is_tcp, l4, 0)
+
+        sport = _be16(data, l4_ports).astype(np.int32)
+        dport = _be16(data, l4_ports + 2).astype(np.int32)
+        return {
+            'src_ip': _be32(data, l3 + 12),
+            'dst_ip': _be32(data, l3 + 16),
+            'packet_size': _be16(data, l3 + 2),
+            'time': times,
+            'identification': _be16(data, l3 + 4),
+            'ttl': data[l3 + 8],
+            'ip_flags': flags_frag >> 13,
+            'tcp_sport': np.where(is_tcp, sport, -1),
+            'tcp_dport': np.where(is_tcp, dport, -1),
+            'tcp_seq': np.where(is_tcp, _be32(data, l4_tcp + 4).astype(np.int64), -1),
+            'tcp_ack': np.where(is_tcp, _be32(data, l4_tcp + 8).astype(np.int64), -1),
+            'tcp_flags': np.where(is_tcp, _be16(data, l4_tcp + 12) & 0x1FF, 0),
+            'udp_sport': np.where(is_udp, sport, -1),
+            'udp_dport': np.where(is_udp, dport, -1),
+        }
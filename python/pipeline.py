@@ -0,0 +1,234 @@
+"""
+Producer/consumer pipeline decoupling packet capture from classification.
+
+    capture (decoder) -> [queue] -> windowing -> [queue] -> classification
+
+Every stage runs in its own thread so the FIFO keeps being read while a
+window is classified. Queues are bounded and have an explicit policy when
+full: `block` (backpressure to the previous stage), `drop-newest` or
+`drop-oldest` (a stale window is not worth classifying). Stages and queues
+keep counters (items, drops, depth, per-item latency) returned by `stats()`.
+
+Window boundaries follow packet timestamps, so replaying a pcap file at full
+speed gives the same windows as a live capture.
+"""
+
+import collections
+import queue
+import threading
+import time
+import numpy as np
+
+POLICIES = ('block', 'drop-newest', 'drop-oldest')
+
+
+class BoundedQueue:
+    """Thread safe FIFO with a maximum size and a policy for when it is full."""
+
+    def __init__(self, name, maxsize, policy='block'):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', use one of {POLICIES}.")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = collections.deque()
+        self.closed = False
+        self.puts = 0
+        self.drops = 0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, item):
+        """Add `item`, returns False if it (or the oldest item) had to be dropped."""
+        with self._lock:
+            if self.closed:
+                return False
+            dropped = False
+            if len(self.items) >= self.maxsize:
+                if self.policy == 'block':
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self._not_full.wait()
+                    if self.closed:
+                        return False
+                elif self.policy == 'drop-newest':
+                    self.drops += 1
+                    return False
+                else:
+                    self.items.popleft()
+                    self.drops += 1
+                    dropped = True
+            self.items.append(item)
+            self.puts += 1
+            self.max_depth = max(self.max_depth, len(self.items))
+            self._not_empty.notify()
+            return not dropped
+
+    def get(self, timeout=None):
+        """Next item, or None once the queue is closed and empty. Raises queue.Empty on timeout."""
+        with self._lock:
+            while not self.items and not self.closed:
+                if not self._not_empty.wait(timeout):
+                    raise queue.Empty
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self._not_full.notify()
+            return item
+
+    def close(self):
+        """No more items will be put, consumers stop once the queue is drained."""
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def stats(self):
+        return {'depth': len(self.items), 'max_depth': self.max_depth,
+                'puts': self.puts, 'drops': self.drops, 'policy': self.policy}
+
+
+class Stage(threading.Thread):
+    """
+    Runs `func` on every item of `inbox` (or on the items of `source` for the
+    first stage) and puts what it returns (a list of items) in `outbox`.
+    """
+
+    def __init__(self, name, func=None, inbox=None, outbox=None, source=None, flush=None):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.source = source
+        self.flush = flush
+        self.items = 0
+        self.busy = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+        self.error = None
+
+    def _items(self):
+        if self.source is not None:
+            yield from self.source
+            return
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                return
+            yield item
+
+    def _emit(self, results):
+        if self.outbox is not None:
+            for result in results or []:
+                self.outbox.put(result)
+
+    def run(self):
+        try:
+            for item in self._items():
+                if self.outbox is not None and self.outbox.closed:
+                    break  # the next stage stopped
+                start = time.perf_counter()
+                results = self.func(item) if self.func is not None else [item]
+                self._emit(results)
+                self.last_latency = time.perf_counter() - start
+                self.max_latency = max(self.max_latency, self.last_latency)
+                self.busy += self.last_latency
+                self.items += 1
+            if self.flush is not None:
+                self._emit(self.flush())
+        except Exception as error:  # reported by Pipeline.join
+            self.error = error
+        finally:
+            if self.outbox is not None:
+                self.outbox.close()
+            if self.inbox is not None:
+                self.inbox.close()  # unblock a producer waiting on a full queue
+
+    def stats(self):
+        return {'items': self.items, 'busy_s': round(self.busy, 3),
+                'mean_latency_ms': round(1e3 * self.busy / self.items, 3) if self.items else 0.0,
+                'last_latency_ms': round(1e3 * self.last_latency, 3),
+                'max_latency_ms': round(1e3 * self.max_latency, 3)}
+
+
+class TimeWindower:
+    """
+    Cuts decoded batches in windows of `window_size` seconds by packet timestamp,
+    aligned on multiples of the window size like `resample`. A late packet goes
+    in the window being filled. Closed windows are copies, the buffer is reused.
+    """
+
+    def __init__(self, buffer, window_size):
+        self.buffer = buffer
+        self.window_size = window_size
+        self.current = None
+
+    def split(self, batch):
+        """Yield (window index, slice of `batch`) for each window the batch spans."""
+        times = np.asarray(batch['time'])
+        if not len(times):
+            return
+        windows = (times // self.window_size).astype(np.int64)
+        if self.current is not None:
+            windows = np.maximum(windows, self.current)
+        windows = np.maximum.accumulate(windows)
+        cuts = np.flatnonzero(windows[1:] != windows[:-1]) + 1
+        for start, end in zip(np.r_[0, cuts], np.r_[cuts, len(times)]):
+            yield windows[start], {name: np.asarray(column)[start:end] for name, column in batch.items()}
+
+    def add(self, batch):
+        closed = []
+        for window, packets in self.split(batch):
+            if self.current is not None and window != self.current:
+                closed.extend(self.flush())
+            self.current = window
+            self.buffer.extend(packets)
+        return closed
+
+    def flush(self):
+        if not len(self.buffer):
+            return []
+        window = {name: column.copy() for name, column in self.buffer.window().items()}
+        self.buffer.clear()
+        return [window]
+
+
+class Pipeline:
+    """Chains `stages` (a list of (name, func, flush)) after a `source` iterator with bounded queues."""
+
+    def __init__(self, source, stages, maxsize=8, policies=None):
+        policies = policies or {}
+        self.queues = []
+        self.stages = [Stage('capture', source=source)]
+        for name, func, flush in stages:
+            queue = BoundedQueue(name, maxsize, policies.get(name, 'block'))
+            self.queues.append(queue)
+            self.stages[-1].outbox = queue
+            self.stages.append(Stage(name, func, inbox=queue, flush=flush))
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def join(self, timeout=None):
+        """Wait for all stages to finish, re-raising the first stage error."""
+        for stage in self.stages:
+            stage.join(timeout)
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+    def alive(self):
+        return any(stage.is_alive() for stage in self.stages)
+
+    def stop(self):
+        for queue in self.queues:
+            queue.close()
+
+    def stats(self):
+        stats = {stage.name: stage.stats() for stage in self.stages}
+        for queue in self.queues:
+            stats[queue.name]['queue'] = queue.stats()
+        return stats
@@ -0,0 +1,84 @@
+"""
+Throughput-only fast path ahead of the ML classifier (the `naive` design of the README).
+
+`ThroughputFilter` keeps an EWMA of the kbps and packets per second of every client,
+updated once per window from the decoded headers (one `bincount` per window), with
+hysteresis: a client becomes active when its EWMA reaches `start-kbps` (or
+`start-pps`) and stays active until it drops below `stop-kbps` (and `stop-pps`).
+Only active clients go through `make_batched_features` + the model, the others are
+short-circuited as not streaming: no video plays at a few kbps.
+"""
+
+import numpy as np
+import pandas as pd
+from config import config
+
+
+class ThroughputFilter:
+    def __init__(self, start_kbps=None, stop_kbps=None, start_pps=None, stop_pps=None, half_life=None):
+        settings = config['prefilter']
+        self.start_kbps = settings['start-kbps'] if start_kbps is None else start_kbps
+        self.stop_kbps = settings['stop-kbps'] if stop_kbps is None else stop_kbps
+        self.start_pps = settings['start-pps'] if start_pps is None else start_pps
+        self.stop_pps = settings['stop-pps'] if stop_pps is None else stop_pps
+        self.half_life = settings['half-life'] if half_life is None else half_life
+        # per tracked client, in the order of `clients`
+        self.clients = pd.Index([])
+        self.kbps = np.zeros(0)
+        self.pps = np.zeros(0)
+        self.active = np.zeros(0, dtype=bool)
+        self.client_windows = 0
+        self.short_circuited = 0
+
+    def update(self, df, seconds=None):
+        """
+        Update the EWMAs with a window of preprocessed packets (`client`, `packet_size`)
+        lasting `seconds` (default config['window-size']), returns the active clients.
+        """
+        seconds = seconds or config['window-size']
+        codes, clients = pd.factorize(df['client'].to_numpy())
+        nbytes = np.bincount(codes, weights=df['packet_size'].to_numpy(), minlength=len(clients))
+        npkts = np.bincount(codes, minlength=len(clients))
+
+        slots = self.clients.get_indexer(clients)
+        new = slots < 0
+        if new.any():
+            slots[new] = len(self.clients) + np.arange(new.sum())
+            self.clients = self.clients.append(pd.Index(clients[new]))
+            self.kbps = np.concatenate([self.kbps, np.zeros(new.sum())])
+            self.pps = np.concatenate([self.pps, np.zeros(new.sum())])
+            self.active = np.concatenate([self.active, np.zeros(new.sum(), dtype=bool)])
+
+        # every tracked client decays (no packets is a 0 rate), the ones seen add this window's rate,
+        # new clients start at it so a video starting is not missed while the EWMA warms up
+        alpha = np.full(len(self.clients), 1 - 0.5 ** (seconds / self.half_life))
+        alpha[slots[new]] = 1.0
+        self.kbps *= 1 - alpha
+        self.pps *= 1 - alpha
+        self.kbps[slots] += alpha[slots] * nbytes * 8 / 1e3 / seconds
+        self.pps[slots] += alpha[slots] * npkts / seconds
+        self.active = np.where(self.active,
+                               (self.kbps >= self.stop_kbps) | (self.pps >= self.stop_pps),
+                               (self.kbps >= self.start_kbps) | (self.pps >= self.start_pps))
+
+        active = self.active[slots]
+        self.client_windows += len(clients)
+        self.short_circuited += int((~active).sum())
+        # forget idle clients, they start again at the rate of their next window
+        seen = np.zeros(len(self.clients), dtype=bool)
+        seen[slots] = True
+        keep = self.active | seen | (self.kbps >= 1)
+        if not keep.all():
+            self.clients, self.kbps, self.pps, self.active = (
+                self.clients[keep], self.kbps[keep], self.pps[keep], self.active[keep])
+        return clients[active]
+
+    def select(self, df, seconds=None):
+        """Split a window in the rows of the active clients and the idle clients (not streaming)."""
+        active = self.update(df, seconds)
+        rows = df['client'].isin(active).to_numpy()
+        return df[rows], pd.unique(df['client'].to_numpy()[~rows])
+
+    def stats(self):
+        return {'client_windows': self.client_windows, 'short_circuited': self.short_circuited,
+                'tracked': len(self.clients), 'active': int(self.active.sum())}
@@ -5,6 +5,25 @@
 sudo tcpdump -i eno1 -s 192 -w - port 80 or port 443 | python3 scapy_sniffer.py --verbose 
 ```
 
+Packets are decoded by fixed-offset parsing of the pcap stream (`pcap_decoder.py`),
+`--decoder scapy` falls back to full Scapy dissection (e.g. for pcapng input).
+`--decoder native --source eno1` captures without tcpdump: libpcap and the header decoding
+run in a C thread (`native_capture.py`, build it with `make -C libpcap`), `--filter` is the
+BPF filter (default `port 80 or port 443`).
+Capture, windowing and classification run as threaded stages connected by bounded
+queues (`pipeline.py`), windows follow packet timestamps so a pcap file replayed at
+full speed gives the same windows as a live capture.
+`--streaming` updates per client features as packets arrive, `--hop 2` then
+classifies 10 seconds windows every 2 seconds.
+`--workers 4` shards the clients over 4 processes (`sharding.py`) for large LANs.
+`--prefilter` (without `--streaming`) only classifies the clients whose EWMA throughput
+reaches video rates (`prefilter.py`), off by default: it misses low rate video, see
+`benchmarks/bench_prefilter.py`.
+`--enforce` applies the streaming quota (`blocker.py`) from a worker thread (`enforcement.py`).
+`--metrics-port 9100` serves Prometheus metrics (`metrics.py`) on localhost, `--metrics-log 60`
+writes them as a JSON line to stderr every minute, `--profile-window 5` dumps a cProfile of
+the classification of the 5th window.
+
 ### For debugging on vscode
 
 #### Start tcpdump in background
@@ -21,6 +40,7 @@ tcpdump -i eno1 -w /tmp/packet_capture.pcap
 import argparse
 import os
 import sys
+import time
 import joblib
 import numpy as np 
 from datetime import datetime
@@ -28,12 +48,24 @@ from scapy.all import PcapReader, IP, TCP, UDP
 import pandas as pd
 from pathlib import Path
 from config import config
+from pcap_decoder import RawPcapReader
+from native_capture import NativeCapture
+from capture_buffer import PacketBuffer, packet_to_row, to_strings
 from feature_creation import (
-    make_windowed_features, 
     load_model,
     preprocess
 )
-# from blocker import Blocker
+from feature_engine import make_batched_features
+from streaming_features import StreamingWindower
+from pipeline import Pipeline, TimeWindower
+from classifier import client_probas, log_verdict
+from sharding import ShardedClassifier
+from blocker import Blocker
+from enforcement import Enforcer
+from training_store import TrainingRecorder
+from prefilter import ThroughputFilter
+from metrics import (REGISTRY, PACKETS, WINDOWS, WINDOW_BUILD, PREPROCESS, FEATURES,
+                     ACTIVE_CLIENTS, WINDOW_LAG, JsonLogger, WindowProfiler, serve)
 
 def process_packet(packet):
     """Process individual packet to extract relevant fields."""
@@ -77,98 +109,281 @@ def get_pcap_reader(source):
     else:
         raise FileNotFoundError(f"Specified source '{source}' does not exist.")
 
+def open_source(source):
+    """Open the specified source as a binary stream for the raw decoder."""
+    if source == "stdin":
+        return sys.stdin.buffer
+    elif os.path.exists(source):
+        return open(source, 'rb')
+    else:
+        raise FileNotFoundError(f"Specified source '{source}' does not exist.")
+
+def read_packets(source, decoder, capture_filter=None):
+    """
+    Yield decoded packets from source as batches of typed columns,
+    one per block read (raw), per ring read (native) or one packet at a time (scapy).
+    """
+    if decoder == "raw":
+        with RawPcapReader(open_source(source)) as reader:
+            yield from reader
+    elif decoder == "native":
+        with NativeCapture(source, capture_filter) as capture:
+            REGISTRY.collect('native_capture', capture.stats)
+            yield from capture
+    else:
+        with get_pcap_reader(source) as pcap_reader:
+            for packet in pcap_reader:
+                packet_data = process_packet(packet)
+                if packet_data:
+                    row = packet_to_row(packet_data)
+                    yield {name: [value] for name, value in row.items()}
+
+def print_packet(packet_data):
+    print((
+        f"Packet: src {packet_data['src_ip']:>15} -> dst {packet_data['dst_ip']:>15} "
+        f"size {packet_data['packet_size']:6d} tcp_sport {packet_data['tcp_sport']:6d} "
+        f"tcp_dport {packet_data['tcp_dport']:6d} udp_sport {packet_data['udp_sport']:6d} "
+        f"udp_dport {packet_data['udp_dport']:6d} time {packet_data['time']:18.6f} "
+        f"ID:{packet_data['identification']:5d} TTL:{packet_data['ttl']:3d} "
+        f"IP Flags:{packet_data['ip_flags']} TCP Seq:{packet_data['tcp_seq']:10d} "
+        f"TCP Ack:{packet_data['tcp_ack']:10d} TCP Flags:{packet_data['tcp_flags']}"
+    ))
+
+def classify(model, features, client_servers, enforcer=None, idle=()):
+    """
+    Predict and log the activity of every client with features in the window,
+    `idle` clients (short-circuited by the throughput prefilter) are not streaming.
+    """
+    # Iterate over each client with features to predict
+    for client_ip, avg_proba in client_probas(model, features).items():
+        is_streaming = avg_proba[1] > config['class-1-threshold']
+
+        # Aggregate all server IPs for this client from all their time windows
+        server_ips = set(client_servers[client_ip].tolist())
+        
+        # Update the blocker with the client's current status, in the enforcement thread
+        # (3 consecutive windows streaming/not streaming to change its state)
+        client_status = "ALLOWED"
+        if enforcer is not None:
+            enforcer.submit(client_ip, is_streaming, list(server_ips))
+            # Check if client is currently blocked to reflect in log
+            if enforcer.is_blocked(client_ip):
+                client_status = "BLOCKED"
+
+        # Log the current activity
+        log_verdict(client_ip, avg_proba, client_status)
+
+    if enforcer is not None:
+        for client_ip in idle:
+            enforcer.submit(client_ip, False, [])
+        enforcer.end_window()  # one nft transaction and one state journal write per window
+
+def stream_classify(model, features, enforcer=None):
+    """Classify the windows closed by the streaming windower."""
+    if features.empty:
+        return
+    servers = features.pop('servers')
+    client_servers = {client: np.unique(np.concatenate(group.tolist()))
+                      for client, group in servers.groupby(level='client')}
+    classify(model, features, client_servers, enforcer)
+
+def counted(batches):
+    """Count the decoded packets of `batches`."""
+    for batch in batches:
+        PACKETS.inc(len(batch['time']))
+        yield batch
+
+def timed(histogram, func):
+    def run(*args):
+        with histogram.time():
+            return func(*args)
+    return run
+
+def observe_window(clients, last_time):
+    """Window metrics: clients seen and how far the window is behind the wall clock."""
+    WINDOWS.inc()
+    ACTIVE_CLIENTS.set(clients)
+    WINDOW_LAG.set(round(time.time() - last_time, 3))
+
+def print_stats(stats):
+    print(" | ".join(
+        f"{name}: {stage['items']} items {stage['mean_latency_ms']:.1f}/{stage['max_latency_ms']:.1f} ms"
+        + (f" queue {stage['queue']['depth']}/{stage['queue']['max_depth']} drops {stage['queue']['drops']}"
+           if 'queue' in stage else "")
+        for name, stage in stats.items()))
+
+def run_pipeline(args, model, feature_cols, enforcer=None):
+    """
+    Inference as capture -> windowing -> classification stages in threads,
+    so the FIFO keeps being read while a window is classified.
+    """
+    prefilter = ThroughputFilter() if config['prefilter']['enabled'] or args.prefilter else None
+    if args.streaming:
+        windower = StreamingWindower(features=feature_cols, hop=args.hop)
+        def windows(features):
+            return [features] if not features.empty else []
+        windowing = ('windowing', timed(WINDOW_BUILD, lambda batch: windows(windower.update(batch))),
+                     lambda: windows(windower.flush()))
+        def classification(features):
+            window_end = features.index.get_level_values('dttime').max().timestamp() + config['window-size']
+            observe_window(features.index.get_level_values('client').nunique(), window_end)
+            stream_classify(model, features, enforcer)
+    else:
+        windower = TimeWindower(PacketBuffer(), config['window-size'])
+        windowing = ('windowing', timed(WINDOW_BUILD, windower.add), windower.flush)
+        def classification(window):
+            with PREPROCESS.time():
+                df_data = preprocess(pd.DataFrame(window, copy=False))
+            observe_window(df_data['client'].nunique(), window['time'].max())
+            idle = ()
+            if prefilter is not None:
+                # only clients at video rates go through feature extraction and the model
+                df_data, idle = prefilter.select(df_data)
+            if df_data.empty:
+                classify(model, pd.DataFrame(), {}, enforcer, idle)
+            else:
+                # Features of every client found in the time window at once,
+                # only the ones the model was trained with
+                with FEATURES.time():
+                    features = make_batched_features(df_data, features=feature_cols)
+                client_servers = df_data.groupby('client', observed=True)['server'].unique()
+                classify(model, features, client_servers, enforcer, idle)
+
+    def classification_stage(window):
+        classification(window)
+        if args.verbose:
+            print_stats(pipeline.stats())
+            if prefilter is not None:
+                print(f"prefilter: {prefilter.stats()}")
+
+    if args.profile_window:
+        classification_stage = WindowProfiler(args.profile_window).wrap(classification_stage)
+    pipeline = Pipeline(counted(read_packets(args.source, args.decoder, args.filter)),
+                        [windowing, ('classification', classification_stage, None)],
+                        maxsize=config['queue-size'], policies=config['queue-policy'])
+    REGISTRY.collect('pipeline', pipeline.stats, label='stage')
+    if prefilter is not None:
+        REGISTRY.collect('prefilter', prefilter.stats)
+    pipeline.start()
+    try:
+        while pipeline.alive():
+            pipeline.join(timeout=1)
+    except KeyboardInterrupt:
+        pipeline.stop()
+    print_stats(pipeline.stats())
+    if prefilter is not None:
+        print(f"prefilter: {prefilter.stats()}")
+
+def run_sharded(args, feature_cols, enforcer=None):
+    """Inference sharded by client IP over `args.workers` processes."""
+    def on_window(window, verdicts):
+        observe_window(len(verdicts), (window + 1) * config['window-size'])
+        # verdicts of every worker merged, one place to update the blocker from
+        for client_ip, (avg_proba, server_ips) in sorted(verdicts.items()):
+            # None: short-circuited by the throughput prefilter, not streaming
+            is_streaming = avg_proba is not None and log_verdict(client_ip, avg_proba)
+            if enforcer is not None:
+                enforcer.submit(client_ip, is_streaming, server_ips.tolist())
+        if enforcer is not None:
+            enforcer.end_window()
+
+    sharded = ShardedClassifier(args.workers, on_window, features=feature_cols,
+                                prefilter=config['prefilter']['enabled'] or args.prefilter)
+    try:
+        for batch in counted(read_packets(args.source, args.decoder, args.filter)):
+            sharded.feed(batch)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sharded.close()
+    print(f"{sharded.packets} packets in {sharded.windows} windows over {args.workers} workers")
+
 def main():
     parser = argparse.ArgumentParser(description="Network traffic sniffer and feature extractor.")
     parser.add_argument("--train", action="store_true", default=False, help="Record data for model training.")    
-    parser.add_argument("--verbose", action="store_true", help="Print packet details during training.")
-    parser.add_argument("--source", type=str, default="stdin", help="Input source: 'stdin' or path to named pipe (FIFO).")
+    parser.add_argument("--name", type=str, default=None,
+                        help="With --train, scenario name of the recording (e.g. youtube_packets_04).")
+    parser.add_argument("--label", type=int, default=-1,
+                        help="With --train, class of the recording: 1 video streaming, 0 not (-1 unlabeled).")
+    parser.add_argument("--chunk", type=int, default=100_000,
+                        help="With --train, append the recording to disk every CHUNK packets.")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print packet details during training, pipeline counters during inference.")
+    parser.add_argument("--source", type=str, default="stdin",
+                        help="Input source: 'stdin' or path to named pipe (FIFO), an interface with --decoder native.")
+    parser.add_argument("--decoder", choices=["raw", "scapy", "native"], default="raw",
+                        help="Packet decoder: fast fixed-offset pcap parsing (raw), Scapy dissection, "
+                             "or libpcap capture and decoding in C (native).")
+    parser.add_argument("--filter", type=str, default=config['capture-filter'],
+                        help="With --decoder native, BPF filter of the capture.")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Update features as packets arrive (windows follow packet timestamps).")
+    parser.add_argument("--hop", type=int, default=None,
+                        help="With --streaming, emit windows every HOP seconds (sliding windows).")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Shard clients over WORKERS processes (multi-core, large LANs).")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="Only classify the clients at video rates with the model (can miss low rate video).")
+    parser.add_argument("--enforce", action="store_true",
+                        help="Track streaming quotas and block servers (nftables, dnsmasq) in a worker thread.")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics.")
+    parser.add_argument("--metrics-log", type=float, default=None,
+                        help="Write the metrics as a JSON line to stderr every METRICS_LOG seconds.")
+    parser.add_argument("--profile-window", type=int, default=None,
+                        help="Dump a cProfile of the classification of the PROFILE_WINDOW-th window.")
     args = parser.parse_args()
+    if args.workers and args.streaming:
+        parser.error("--workers does not support --streaming")
+    if args.workers and args.profile_window:
+        parser.error("--profile-window profiles the windows classified in this process, not with --workers")
+
+    if args.decoder == "native" and args.source == "stdin":
+        parser.error("--decoder native captures from an interface or reads a pcap file, give it as --source")
 
-    # Verify source if not stdin
-    if args.source != "stdin" and not os.path.exists(args.source):
+    # Verify source if not stdin (an interface name for the native decoder)
+    if args.source != "stdin" and args.decoder != "native" and not os.path.exists(args.source):
         raise FileNotFoundError(f"The specified source '{args.source}' does not exist.")
     
     if not args.train:        
         print("Starting inference...")
-        model = load_model()
-        #blocker = Blocker() # TODO: uncomment this
-
-    data = []
-    start_time = datetime.now()
+        model = feature_cols = None
+        if not args.workers:  # with --workers every worker loads its model and takes its features
+            model = load_model()
+            feature_cols = list(getattr(model, 'feature_names_in_', config['selected_features']))
+        enforcer = Enforcer(Blocker()).start() if args.enforce else None
+        if enforcer is not None:
+            REGISTRY.collect('enforcer', enforcer.stats)
+        if args.metrics_port:
+            serve(REGISTRY, args.metrics_port)
+        metrics_log = JsonLogger(REGISTRY, args.metrics_log) if args.metrics_log else None
+        if metrics_log is not None:
+            metrics_log.start()
+        if args.workers:
+            run_sharded(args, feature_cols, enforcer)
+        else:
+            run_pipeline(args, model, feature_cols, enforcer)
+        if enforcer is not None:
+            enforcer.stop()
+            print(f"Enforcement: {enforcer.stats()}")
+        if metrics_log is not None:
+            metrics_log.stop()
+        print('No more data to process')
+        return
 
+    name = args.name or f"training_{datetime.now().isoformat(timespec='minutes')}"
+    recorder = TrainingRecorder(name, args.label, chunk_size=args.chunk)
     try:
-        with get_pcap_reader(args.source) as pcap_reader:
-            for packet in pcap_reader:
-                packet_data = process_packet(packet)
-                if packet_data:
-                    data.append(packet_data)
-                    if args.verbose and args.train:
-                        print((
-                            f"Packet: src {packet_data['src_ip']:>15} -> dst {packet_data['dst_ip']:>15} "
-                            f"size {packet_data['packet_size']:6d} tcp_sport {packet_data['tcp_sport']:6d} "
-                            f"tcp_dport {packet_data['tcp_dport']:6d} udp_sport {packet_data['udp_sport']:6d} "
-                            f"udp_dport {packet_data['udp_dport']:6d} time {packet_data['time']:18.6f} "
-                            f"ID:{packet_data['identification']:5d} TTL:{packet_data['ttl']:3d} "
-                            f"IP Flags:{packet_data['ip_flags']} TCP Seq:{packet_data['tcp_seq']:10d} "
-                            f"TCP Ack:{packet_data['tcp_ack']:10d} TCP Flags:{packet_data['tcp_flags']}"
-                        ))
-
-                elapsed = (datetime.now() - start_time).total_seconds()
-                if elapsed >= 10:  # Process every 10 seconds
-                    if data:  # only process if there is data
-                        if not args.train:
-                            df_data = preprocess(pd.DataFrame(data))                            
-                            if not df_data.empty:
-                                # Separate feature columns for prediction
-                                feature_cols = config['selected_features']
-                                
-                                # Iterate over each client found in the time window
-                                for client_ip, client_data in df_data.groupby('client'):                                    
-                                    features = make_windowed_features(client_data)
-                                    client_features = features[feature_cols]
-                                    if client_features.empty:
-                                        continue # no features to predict
-                                    y_proba = model.predict_proba(client_features)
-                                    avg_proba = np.mean(y_proba, axis=0)
-                                    
-                                    is_streaming = avg_proba[1] > config['class-1-threshold']
-
-                                    # Aggregate all server IPs for this client from all their time windows
-                                    server_ips = set()
-                                    if 'server' in client_data:
-                                        server_ips.update(client_data['server'].unique().tolist())
-                                    
-                                    # Update the blocker with the client's current status
-                                    # TODO: only if 3 consecutive classes 1 to 
-                                    # also if 3 consecutive classes 0 to remove from streaming state
-                                    # that is blocker worker tough... not for here ...
-                                    # blocker.update_client_status(client_ip, is_streaming, list(server_ips))
-
-                                    # Log the current activity
-                                    status_msg = "IS STREAMING" if is_streaming else "is NOT streaming"
-                                    score = 100 * avg_proba[1] if is_streaming else 100 * avg_proba[0]
-                                    
-                                    # Check if client is currently blocked to reflect in log
-                                    client_status = "ALLOWED"
-                                    # if client_ip in blocker.clients and blocker.clients[client_ip]['is_blocked']:
-                                    #     client_status = "BLOCKED"
-
-                                    print(
-                                        f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | "
-                                        f"Client: {client_ip:<15} | Status: {client_status:<7} | "
-                                        f"Activity: {status_msg:<15} | "
-                                        f"Score/Score Threshold: {score:3.0f}%/{config['class-1-threshold']*100:3.0f}%"
-                                    )
-                        
-                        data.clear()  # Clear data after processing
-                    
-                    start_time = datetime.now()  # Reset timer
-               
-    except KeyboardInterrupt: # If the user interrupts the script, save the data
-        if args.train:
-            df = pd.DataFrame(data)
-            df.to_csv(f"training_data_{start_time.isoformat(timespec='minutes')}.csv", index=False)
-            print(f"Recorded {len(data)} packets for training.")
+        for batch in read_packets(args.source, args.decoder, args.filter):
+            recorder.extend(batch)
+            if args.verbose:
+                for row in pd.DataFrame(to_strings(batch)).itertuples(index=False):
+                    print_packet(row._asdict())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()  # at most `--chunk` packets are lost on a crash
+        print(f"Recorded {recorder.packets} packets of '{name}' in {recorder.path}")
 
     print('No more data to process')
 
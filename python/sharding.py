@@ -0,0 +1,218 @@
+"""
+Sharded classification for large LANs: the decoder hashes each packet's client IP
+onto one of N worker processes, every worker builds the features and classifies
+the clients it owns, and an aggregator merges the per client verdicts of each
+window (for the log and the blocker).
+
+Packets reach the workers through shared memory: each worker has a few slots of
+fixed layout records (`RECORD`), the decoder fills a free slot and sends only its
+index over a queue. Window boundaries follow packet timestamps and are decided by
+the decoder, so every worker closes the same windows.
+
+```bash
+sudo tcpdump -i eno1 -s 192 -w - port 80 or port 443 | python3 scapy_sniffer.py --workers 4
+```
+"""
+
+import collections
+import multiprocessing
+import queue
+import threading
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from config import config
+from capture_buffer import PACKET_DTYPES, PacketBuffer
+from classifier import window_verdicts
+from feature_creation import is_lan_ip, load_model
+from pipeline import TimeWindower
+from prefilter import ThroughputFilter
+
+RECORD = np.dtype(list(PACKET_DTYPES.items()))
+
+
+def client_ips(batch):
+    """
+    Client IP of every packet determined as `preprocess` does and a mask of
+    the packets it keeps (traffic between two LAN hosts is dropped).
+    """
+    src_lan, dst_lan = is_lan_ip(batch['src_ip']), is_lan_ip(batch['dst_ip'])
+    return np.where(src_lan, batch['src_ip'], batch['dst_ip']).astype(np.uint32), ~(src_lan & dst_lan)
+
+
+def shard_of(clients, workers):
+    """Worker owning each client IP (multiplicative hash, spreads consecutive IPs)."""
+    return ((clients.astype(np.uint64) * 2654435761) & 0xFFFFFFFF) * workers >> 32
+
+
+def worker_main(index, shm_name, slots, slot_size, inbox, free, results, features, prefilter=False):
+    """
+    Worker process: buffer the packets of its clients and classify them at every window end.
+    Sends (index, None, error traceback or None) when it exits.
+    """
+    shm = records = slot = error = None
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        records = np.ndarray((slots, slot_size), dtype=RECORD, buffer=shm.buf)
+        model = load_model()
+        if features is None:
+            features = list(getattr(model, 'feature_names_in_', config['selected_features']))
+        # the throughput EWMAs of a client live in the worker owning it
+        prefilter = ThroughputFilter() if prefilter else None
+        buffer = PacketBuffer()
+        while True:
+            message = inbox.get()
+            if message is None:
+                break
+            kind, value, count = message
+            if kind == 'packets':
+                slot = records[value, :count]
+                buffer.extend({name: slot[name] for name in PACKET_DTYPES})
+                free.put(value)  # copied, the decoder can reuse the slot
+            else:  # window end
+                verdicts = window_verdicts(model, buffer.window(), features, prefilter) if len(buffer) else {}
+                results.put((index, value, verdicts))
+                buffer.clear()
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        del records, slot
+        if shm is not None:
+            shm.close()
+        results.put((index, None, error))
+
+
+class ShardedClassifier:
+    """
+    Feeds decoded batches to `workers` processes sharded by client IP and calls
+    `on_window(window index, verdicts)` from the aggregator thread once every worker
+    classified the window, verdicts as {client ip: (average class probabilities, server ips)}
+    (None probabilities for clients short-circuited by the throughput `prefilter`).
+    A worker failing or dying raises RuntimeError in the next `feed` or `close`.
+    """
+
+    def __init__(self, workers, on_window, features=None, slots=4, slot_size=1 << 15, prefilter=False):
+        self.workers = workers
+        self.on_window = on_window
+        self.slot_size = slot_size
+        self.windower = TimeWindower(None, config['window-size'])
+        self.packets = 0
+        self.windows = 0
+        self.error = None  # of a failed worker, raised in the feeding thread
+        self.failed = set()
+        context = multiprocessing.get_context('spawn')
+        self.results = context.Queue()
+        self.shms, self.slots, self.inboxes, self.free, self.processes = [], [], [], [], []
+        for index in range(workers):
+            shm = shared_memory.SharedMemory(create=True, size=slots * slot_size * RECORD.itemsize)
+            inbox, free = context.Queue(), context.Queue()
+            for slot in range(slots):
+                free.put(slot)
+            process = context.Process(target=worker_main, daemon=True, name=f"shard-{index}",
+                                      args=(index, shm.name, slots, slot_size, inbox, free, self.results, features, prefilter))
+            process.start()
+            self.shms.append(shm)
+            self.slots.append(np.ndarray((slots, slot_size), dtype=RECORD, buffer=shm.buf))
+            self.inboxes.append(inbox)
+            self.free.append(free)
+            self.processes.append(process)
+        self.aggregator = threading.Thread(target=self._aggregate, name="aggregator", daemon=True)
+        self.aggregator.start()
+
+    def feed(self, batch):
+        """Send the packets of a decoded batch to the workers owning their clients."""
+        self._check()
+        for window, packets in self.windower.split(batch):
+            if self.windower.current is not None and window != self.windower.current:
+                self._close_window()
+            self.windower.current = window
+            clients, keep = client_ips(packets)
+            shards = shard_of(clients[keep], self.workers)
+            order = np.argsort(shards, kind='stable')
+            rows = np.flatnonzero(keep)[order]
+            bounds = np.searchsorted(shards[order], np.arange(self.workers + 1))
+            for worker in range(self.workers):
+                self._send(worker, packets, rows[bounds[worker]:bounds[worker + 1]])
+            self.packets += len(rows)
+
+    def _send(self, worker, packets, rows):
+        for start in range(0, len(rows), self.slot_size):
+            chunk = rows[start:start + self.slot_size]
+            slot = self._free_slot(worker)
+            records = self.slots[worker][slot]
+            for name in PACKET_DTYPES:
+                records[name][:len(chunk)] = np.asarray(packets[name])[chunk]
+            self.inboxes[worker].put(('packets', slot, len(chunk)))
+
+    def _free_slot(self, worker):
+        """A free slot of `worker`, waiting while it is behind (backpressure) but not on a dead worker."""
+        while True:
+            try:
+                return self.free[worker].get(timeout=1)
+            except queue.Empty:
+                self._check()
+                process = self.processes[worker]
+                if not process.is_alive():
+                    self._fail(worker, f"exited with code {process.exitcode}")
+                    self._check()
+                    raise RuntimeError(f"shard-{worker} exited with code {process.exitcode}")
+
+    def _check(self):
+        """Raise the error of a failed worker (once) in the caller."""
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _fail(self, index, reason):
+        if index in self.failed:
+            return
+        print(f"Worker shard-{index} failed: {reason}")
+        self.failed.add(index)
+        if len(self.failed) == 1:  # the first failure is raised, once
+            self.error = RuntimeError(f"shard-{index} failed: {reason.strip().splitlines()[-1]}")
+
+    def _close_window(self):
+        for inbox in self.inboxes:
+            inbox.put(('close', self.windower.current, 0))
+        self.windows += 1
+
+    def _aggregate(self):
+        """Merge the verdicts of each window once every worker sent its part."""
+        pending = collections.defaultdict(dict)
+        reported = collections.Counter()
+        running = set(range(self.workers))
+        while running:
+            # checked before waiting: a worker dead then, without its exit message queued, was killed
+            dead = [index for index in running if not self.processes[index].is_alive()]
+            try:
+                index, window, verdicts = self.results.get(timeout=1)
+            except queue.Empty:
+                for index in dead:
+                    running.discard(index)
+                    self._fail(index, f"exited with code {self.processes[index].exitcode}")
+                continue
+            if window is None:
+                running.discard(index)
+                if verdicts is not None:  # the traceback of the worker
+                    self._fail(index, verdicts)
+                continue
+            pending[window].update(verdicts)
+            reported[window] += 1
+            if reported[window] == self.workers:
+                del reported[window]
+                self.on_window(window, pending.pop(window))
+
+    def close(self):
+        """Classify the last window, stop the workers and release the shared memory."""
+        if self.windower.current is not None:
+            self._close_window()
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join()
+        self.aggregator.join()
+        self.slots.clear()
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+        self._check()
@@ -0,0 +1,119 @@
+"""
+Append-only persistence for the `Blocker` client state.
+
+Updates are buffered in memory (a set of dirty clients) and written at window end
+(or every `flush_interval` seconds) as one JSON line per changed client appended to
+`<state file>.journal`, instead of rewriting the whole state file on every update.
+When the journal grows past `compact_ratio` times the number of clients the state
+is compacted: written to the JSON state file (same format as before, so old files
+load unchanged) through a temporary file + rename, and the journal is truncated.
+
+After a crash, loading the state file and replaying the journal gives the state
+as of the last flush; a partially written last line is ignored.
+"""
+
+import json
+import os
+import time
+
+
+class JournalStore:
+    def __init__(self, state_file, flush_interval=None, compact_ratio=4):
+        self.state_file = state_file
+        self.journal_file = f"{state_file}.journal"
+        self.flush_interval = flush_interval
+        self.compact_ratio = compact_ratio
+        self.dirty = set()
+        self.deleted = set()
+        self.journal_lines = 0
+        self.bytes_written = 0
+        self.last_flush = time.time()
+
+    def load(self):
+        """State file (JSON) with the journal replayed on top of it."""
+        try:
+            with open(self.state_file, 'r') as f:
+                clients = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            clients = {}
+        self.journal_lines = 0
+        try:
+            with open(self.journal_file, 'rb') as f:
+                good = 0
+                for line in f:
+                    record = self._record(line)
+                    if record is None:
+                        break  # torn write of the last flush before a crash
+                    if record.get('deleted'):
+                        clients.pop(record['client'], None)
+                    else:
+                        clients[record['client']] = record['state']
+                    self.journal_lines += 1
+                    good += len(line)
+            if good < os.path.getsize(self.journal_file):
+                os.truncate(self.journal_file, good)  # next appends start on a clean line
+        except FileNotFoundError:
+            pass
+        return clients
+
+    @staticmethod
+    def _record(line):
+        """Journal record of a line, None for a partially written one."""
+        if not line.endswith(b'\n'):
+            return None
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            return None
+
+    def mark(self, client_ip):
+        """Record that a client changed, written at the next flush."""
+        self.dirty.add(client_ip)
+        self.deleted.discard(client_ip)
+
+    def delete(self, client_ip):
+        self.deleted.add(client_ip)
+        self.dirty.discard(client_ip)
+
+    def due(self):
+        """Whether `flush_interval` seconds passed since the last flush."""
+        return self.flush_interval is not None and time.time() - self.last_flush >= self.flush_interval
+
+    def flush(self, clients):
+        """Append the changed clients to the journal, compacting it when it got too long."""
+        self.last_flush = time.time()
+        if not self.dirty and not self.deleted:
+            return
+        lines = [json.dumps({'client': ip, 'state': clients[ip]}, separators=(',', ':'))
+                 for ip in self.dirty if ip in clients]
+        lines += [json.dumps({'client': ip, 'deleted': True}) for ip in self.deleted]
+        self.dirty.clear()
+        self.deleted.clear()
+        if not lines:
+            return
+        data = '\n'.join(lines) + '\n'
+        with open(self.journal_file, 'a') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_lines += len(lines)
+        self.bytes_written += len(data)
+        if self.journal_lines > self.compact_ratio * max(len(clients), 1):
+            self.compact(clients)
+
+    def compact(self, clients):
+        """
+        Write the whole state to the JSON state file and start an empty journal.
+        The journal is complete up to `clients`, so a crash before it is truncated
+        only replays records equal to the new state file.
+        """
+        data = json.dumps(clients, indent=4)
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.state_file)
+        open(self.journal_file, 'w').close()
+        self.journal_lines = 0
+        self.bytes_written += len(data)
@@ -0,0 +1,328 @@
+"""
+Streaming windowed features: per-client accumulators updated as each packet
+arrives, so closing a window only emits a feature row instead of rebuilding
+the window with `preprocess` + `make_batched_features`.
+
+Each accumulator keeps running counts/means/M2 (Welford, numerically stable
+sums of squares) for the averages and variances, count maps for the entropies
+and nunique features and the last timestamp for the inter-arrival features.
+Windows are built from panes of `hop` seconds: with `hop` equal to the window
+size they are the same tumbling windows as `make_windowed_features`; with a
+smaller hop (e.g. 10 s windows every 2 s) a window is the merge of its panes,
+no packet is visited twice. Hopping windows reaching before the first pane of
+the capture or past the last one are not emitted: their rates would be divided
+by the full window size while covering less time.
+
+Packets are expected in capture (time) order, as tcpdump writes them; a late
+packet is added to the pane being filled.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+from config import config
+from feature_creation import is_lan_ip
+from feature_engine import plan_features
+
+# column of the per-packet row and, for up/down only counters, the direction
+COUNTED = {
+    'size': ('packet_size', None),
+    'up_size': ('packet_size', True),
+    'dw_size': ('packet_size', False),
+    'ttl': ('ttl', None),
+    'dw_ttl': ('ttl', False),
+    'ack': ('tcp_ack', None),
+    'seq': ('tcp_seq', None),
+    'tcp_sport': ('tcp_sport', None),
+    'tcp_dport': ('tcp_dport', None),
+    'udp_sport': ('udp_sport', None),
+    'udp_dport': ('udp_dport', None),
+    'flag': ('tcp_flags', None),
+    'server': ('server', None),  # always kept, the blocker needs the servers
+}
+
+# count maps each feature needs
+FEATURE_COUNTS = {
+    'pkt_entropy': ['size'],
+    'up_pkt_entropy': ['up_size'],
+    'dw_pkt_entropy': ['dw_size'],
+    'dw_ttl_unique': ['dw_ttl'],
+    'dl_pkt_entropy': ['diff'],
+    'num_unique_ips': ['server'],
+    'tcp_nports': ['tcp_sport', 'tcp_dport'],
+    'udp_nports': ['udp_sport', 'udp_dport'],
+    'tcp_seq': ['seq'],
+    'tcp_ack': ['ack'],
+    'tcp_flags': ['flag'],
+    'ttl_entropy': ['ttl'],
+    'ack_entropy': ['ack'],
+}
+
+ROW_COLUMNS = ['time', 'updown', 'packet_size', 'ttl', 'tcp_ack', 'tcp_seq', 'tcp_sport',
+               'tcp_dport', 'udp_sport', 'udp_dport', 'tcp_flags', 'server']
+
+
+def _merge_moments(a, b):
+    """Merge two (n, mean, M2) running moments (Chan et al.)."""
+    n = a[0] + b[0]
+    if not n:
+        return a
+    delta = b[1] - a[1]
+    return n, a[1] + delta * b[0] / n, a[2] + b[2] + delta * delta * a[0] * b[0] / n
+
+
+def _var(moments):
+    return moments[2] / (moments[0] - 1) if moments[0] > 1 else math.nan
+
+
+def _entropy(counts):
+    total = sum(counts.values())
+    entropy = 0.0
+    for count in counts.values():
+        prob = count / total
+        entropy -= prob * math.log2(prob)
+    return entropy
+
+
+class ClientAccumulator:
+    """Running state of one client over one pane (or a merged window)."""
+
+    __slots__ = ('n', 'up_sum', 'dw_sum', 'up', 'dw', 'ack', 'dw_ttl_sum',
+                 'first_time', 'last_time', 'diff', 'counts')
+
+    def __init__(self, counted):
+        self.n = 0
+        self.up_sum = self.dw_sum = self.dw_ttl_sum = 0
+        # (n, mean, M2) of upload/download packet sizes, tcp_ack and time differences
+        self.up = self.dw = self.ack = self.diff = (0, 0.0, 0.0)
+        self.first_time = self.last_time = None
+        self.counts = {name: {} for name in counted}
+
+    @staticmethod
+    def _add(moments, value):
+        n, mean, m2 = moments
+        n += 1
+        delta = value - mean
+        mean += delta / n
+        return n, mean, m2 + delta * (value - mean)
+
+    def add_diff(self, diff):
+        self.diff = self._add(self.diff, diff)
+        counts = self.counts.get('diff')
+        if counts is not None:
+            counts[diff] = counts.get(diff, 0) + 1
+
+    def update(self, row, counted):
+        """Add one packet, `row` in `ROW_COLUMNS` order."""
+        time, is_up, size = row[0], row[1] > 0, row[2]
+        if self.last_time is not None:
+            self.add_diff(time - self.last_time)
+        else:
+            self.first_time = time
+        self.last_time = time
+        self.n += 1
+        if is_up:
+            self.up_sum += size
+            self.up = self._add(self.up, size)
+        else:
+            self.dw_sum += size
+            self.dw = self._add(self.dw, size)
+            self.dw_ttl_sum += row[3]
+        self.ack = self._add(self.ack, row[4])
+        counts = self.counts
+        for name, column, direction in counted:
+            if direction is None or direction == is_up:
+                value = row[column]
+                counter = counts[name]
+                counter[value] = counter.get(value, 0) + 1
+
+    def merge(self, other):
+        """Merge `other`, a later pane of the same client, into a copy of this one."""
+        merged = ClientAccumulator(())
+        merged.counts = {name: dict(counter) for name, counter in self.counts.items()}
+        merged.n = self.n + other.n
+        merged.up_sum = self.up_sum + other.up_sum
+        merged.dw_sum = self.dw_sum + other.dw_sum
+        merged.dw_ttl_sum = self.dw_ttl_sum + other.dw_ttl_sum
+        merged.up = _merge_moments(self.up, other.up)
+        merged.dw = _merge_moments(self.dw, other.dw)
+        merged.ack = _merge_moments(self.ack, other.ack)
+        merged.diff = self.diff
+        merged.first_time, merged.last_time = self.first_time, self.last_time
+        if other.n:
+            if merged.last_time is not None:
+                merged.add_diff(other.first_time - merged.last_time)  # gap between the panes
+            else:
+                merged.first_time = other.first_time
+            merged.last_time = other.last_time
+            merged.diff = _merge_moments(merged.diff, other.diff)
+        for name, counter in other.counts.items():
+            target = merged.counts[name]
+            for value, count in counter.items():
+                target[value] = target.get(value, 0) + count
+        return merged
+
+    def valid(self):
+        """Same rule as `make_batched_features`: 2 upload and 2 download packets."""
+        return self.up[0] >= 2 and self.dw[0] >= 2
+
+    def features(self, window_size):
+        """All features computable from the tracked state, as in `make_windowed_features`."""
+        counts = self.counts
+        up_avg = self.up[1] if self.up[0] else math.nan
+        dw_avg = self.dw[1] if self.dw[0] else math.nan
+        up_var, dw_var = _var(self.up), _var(self.dw)
+        values = {
+            'up_speed': self.up_sum / window_size,
+            'dw_speed': self.dw_sum / window_size,
+            'net_updown': self.up_sum - self.dw_sum,
+            'div_updown': self.up_sum / (self.dw_sum if self.dw_sum else 1),
+            'div_updown_var': up_var / (dw_var if dw_var else 1),
+            'up_pkt_var': up_var,
+            'dw_pkt_var': dw_var,
+            'up_pkt_avg': up_avg,
+            'dw_pkt_avg': dw_avg,
+            'dw_ttl_avg': self.dw_ttl_sum / self.dw[0] if self.dw[0] else math.nan,
+            'tcp_ack_var': _var(self.ack),
+            'updw_pkt': dw_avg - up_avg,
+            'dl_pkt_avg': self.diff[1] if self.diff[0] else math.nan,
+            'jitter': _var(self.diff),
+        }
+        entropies = {'pkt_entropy': 'size', 'up_pkt_entropy': 'up_size', 'dw_pkt_entropy': 'dw_size',
+                     'dl_pkt_entropy': 'diff', 'ttl_entropy': 'ttl', 'ack_entropy': 'ack'}
+        for feature, name in entropies.items():
+            if name in counts:
+                values[feature] = _entropy(counts[name])
+        uniques = {'dw_ttl_unique': ['dw_ttl'], 'num_unique_ips': ['server'], 'tcp_nports': ['tcp_sport', 'tcp_dport'],
+                   'udp_nports': ['udp_sport', 'udp_dport'], 'tcp_seq': ['seq'], 'tcp_ack': ['ack'], 'tcp_flags': ['flag']}
+        for feature, names in uniques.items():
+            if all(name in counts for name in names):
+                values[feature] = sum(len(counts[name]) for name in names)
+        return values
+
+
+class StreamingWindower:
+    """
+    Routes decoded packets to per-client accumulators and emits a feature row per
+    client every time a window closes. Window boundaries follow packet timestamps.
+    """
+
+    def __init__(self, features=None, window_size=None, hop=None):
+        self.names = plan_features(features)[0]
+        self.window_size = window_size or config['window-size']
+        self.hop = hop or self.window_size
+        if self.window_size % self.hop:
+            raise ValueError(f"Window size {self.window_size} s must be a multiple of the hop {self.hop} s.")
+        self.panes_per_window = int(round(self.window_size / self.hop))
+        counted = {'server'}
+        for name in self.names:
+            counted.update(FEATURE_COUNTS.get(name, []))
+        self.track_diff = 'diff' in counted
+        counted.discard('diff')
+        self.counted = [(name, ROW_COLUMNS.index(COUNTED[name][0]), COUNTED[name][1])
+                        for name in sorted(counted)]
+        self.pane = None  # index of the pane being filled
+        self.first_pane = None  # of the capture, windows start at or after it
+        self.panes = {}  # client -> {pane index: accumulator}
+
+    def _new_accumulator(self):
+        accumulator = ClientAccumulator([name for name, _, _ in self.counted])
+        if self.track_diff:
+            accumulator.counts['diff'] = {}
+        return accumulator
+
+    def _rows(self, batch):
+        """Client and per-packet rows of a decoder batch, internal LAN traffic dropped like `preprocess`."""
+        src_in, dst_in = is_lan_ip(batch['src_ip']), is_lan_ip(batch['dst_ip'])
+        keep = ~(src_in & dst_in)
+        src_in = src_in[keep]
+        src, dst = np.asarray(batch['src_ip'])[keep], np.asarray(batch['dst_ip'])[keep]
+        columns = {name: np.asarray(batch[name])[keep] for name in ROW_COLUMNS
+                   if name not in ('updown', 'server')}
+        columns['updown'] = np.where(src_in, 1, -1)
+        columns['server'] = np.where(src_in, dst, src)
+        client = np.where(src_in, src, dst)
+        return client.tolist(), zip(*(columns[name].tolist() for name in ROW_COLUMNS))
+
+    def update(self, batch):
+        """
+        Add a batch of decoded packets (typed columns as from `pcap_decoder`).
+        Returns the feature rows of the windows closed by these packets (possibly empty).
+        """
+        closed = []
+        panes = self.panes
+        hop = self.hop
+        counted = self.counted
+        clients, rows = self._rows(batch)
+        current = self.pane
+        for client, row in zip(clients, rows):
+            pane = int(row[0] // hop)
+            if pane != current:
+                if current is not None and pane > current:
+                    closed.extend(self._close(current, pane))
+                if current is None:
+                    self.first_pane = pane
+                current = self.pane = max(pane, current) if current is not None else pane
+            client_panes = panes.get(client)
+            if client_panes is None:
+                client_panes = panes[client] = {}
+            accumulator = client_panes.get(current)
+            if accumulator is None:
+                accumulator = client_panes[current] = self._new_accumulator()
+            accumulator.update(row, counted)
+        return self._frame(closed)
+
+    def flush(self):
+        """
+        Close the window ending at the pane being filled, e.g. at the end of a capture
+        (the later hopping windows would miss panes).
+        """
+        if self.pane is None:
+            return self._frame([])
+        closed = self._close(self.pane, self.pane + 1)
+        self.pane = self.first_pane = None
+        self.panes = {}
+        return self._frame(closed)
+
+    def _close(self, last, pane):
+        """Emit every window ending at panes `last` .. `pane - 1` and drop panes out of reach."""
+        rows = []
+        for end in range(last, min(pane, last + self.panes_per_window)):
+            first = end - self.panes_per_window + 1
+            if first < self.first_pane:
+                continue  # starts before the capture
+            for client, client_panes in self.panes.items():
+                window = None
+                for index in range(first, end + 1):
+                    accumulator = client_panes.get(index)
+                    if accumulator is not None:
+                        window = accumulator if window is None else window.merge(accumulator)
+                if window is None or not window.valid():
+                    continue
+                values = window.features(self.window_size)
+                values['client'] = client
+                values['dttime'] = first * self.hop
+                values['servers'] = np.fromiter(window.counts['server'], dtype=np.uint32)
+                rows.append(values)
+        oldest = pane - self.panes_per_window + 1
+        for client in list(self.panes):
+            client_panes = self.panes[client]
+            for index in [index for index in client_panes if index < oldest]:
+                del client_panes[index]
+            if not client_panes:
+                del self.panes[client]
+        return rows
+
+    def _frame(self, rows):
+        """
+        Feature rows indexed by (client, dttime) like `make_batched_features`,
+        plus the uint32 IPs of the servers seen.
+        """
+        if not rows:
+            index = pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([], name='dttime')], names=['client', 'dttime'])
+            return pd.DataFrame(columns=self.names + ['servers'], index=index)
+        frame = pd.DataFrame(rows)
+        frame['dttime'] = pd.to_datetime(frame['dttime'], unit='s')
+        frame = frame.set_index(['client', 'dttime'])[self.names + ['servers']]
+        return frame.dropna(subset=self.names)
+
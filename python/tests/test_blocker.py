@@ -0,0 +1,106 @@
+import subprocess
+import time
+import pytest
+from blocker import Blocker
+from nft_set import FakeNft, NftSet
+
+CLIENT = '192.168.1.10'
+SERVER = '8.8.8.8'
+
+
+class FlakyNft(FakeNft):
+    """Fake nft failing its first `failures` transactions."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def __call__(self, script):
+        if self.failures:
+            self.failures -= 1
+            raise subprocess.CalledProcessError(1, ['nft', '-f', '-'])
+        super().__call__(script)
+
+
+def make_blocker(tmp_path, runner):
+    blocker = Blocker(str(tmp_path / 'clients.json'), str(tmp_path / 'blocked-ips-v4.txt'),
+                      nft=NftSet(runner=runner, timeout='2h'))
+    blocker.streaming_limit_seconds = -1  # any streaming time is over the quota
+    return blocker
+
+
+def stream(blocker, windows, client=CLIENT, servers=(SERVER,)):
+    for _ in range(windows):
+        blocker.update_client_status(client, True, list(servers))
+
+
+def blocklist(tmp_path):
+    path = tmp_path / 'blocked-ips-v4.txt'
+    return path.read_text().split() if path.exists() else []
+
+
+def test_blocks_after_three_streaming_windows(tmp_path):
+    runner = FakeNft()
+    blocker = make_blocker(tmp_path, runner)
+    stream(blocker, 2)
+    assert blocker.apply_blocks() == 0 and runner.elements == {}
+    stream(blocker, 1)
+    assert blocker.apply_blocks() == 1
+    assert runner.elements == {(CLIENT, SERVER): '2h'}
+    assert blocklist(tmp_path) == [SERVER]
+
+
+def test_blocklist_written_only_after_nft_succeeds(tmp_path):
+    runner = FlakyNft(failures=1)
+    blocker = make_blocker(tmp_path, runner)
+    stream(blocker, 3)
+    with pytest.raises(subprocess.CalledProcessError):
+        blocker.apply_blocks()
+    assert blocklist(tmp_path) == []
+    assert blocker.pending_blocked_ips == [SERVER] and (CLIENT, SERVER) in blocker.nft.adds
+
+    assert blocker.apply_blocks() == 1
+    assert blocklist(tmp_path) == [SERVER]
+    assert runner.elements == {(CLIENT, SERVER): '2h'}
+    assert blocker.apply_blocks() == 0 and blocklist(tmp_path) == [SERVER]
+
+
+def test_server_blocked_per_client_listed_once(tmp_path):
+    runner = FakeNft()
+    blocker = make_blocker(tmp_path, runner)
+    stream(blocker, 3, client=CLIENT)
+    stream(blocker, 3, client='192.168.1.11')
+    assert blocker.apply_blocks() == 1
+    assert set(runner.elements) == {(CLIENT, SERVER), ('192.168.1.11', SERVER)}
+    assert blocklist(tmp_path) == [SERVER]
+
+
+def test_expired_block_is_renewed(tmp_path, monkeypatch):
+    runner = FakeNft()
+    blocker = make_blocker(tmp_path, runner)
+    stream(blocker, 3)
+    blocker.apply_blocks()
+    stream(blocker, 1)
+    blocker.apply_blocks()
+    assert len(runner.scripts) == 1  # still blocked, not added again
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 2 * 3600 + 1)
+    runner.elements.clear()  # nft dropped the element
+    stream(blocker, 1)
+    blocker.apply_blocks()
+    assert len(runner.scripts) == 2
+    assert runner.elements == {(CLIENT, SERVER): '2h'}
+
+
+def test_blocked_servers_survive_a_restart(tmp_path):
+    runner = FakeNft()
+    blocker = make_blocker(tmp_path, runner)
+    stream(blocker, 3)
+    blocker.end_window()
+
+    restarted = make_blocker(tmp_path, runner)
+    assert SERVER in restarted.clients[CLIENT]['blocked_servers']
+    stream(restarted, 1)
+    restarted.apply_blocks()
+    assert len(runner.scripts) == 1
@@ -0,0 +1,59 @@
+from blocker import Blocker
+from enforcement import Enforcer
+from nft_set import FakeNft, NftSet
+
+CLIENTS = [f'192.168.1.{i}' for i in range(10, 15)]
+SERVER = '8.8.8.8'
+
+
+def make_enforcer(tmp_path, runner, commands, maxsize=4096):
+    blocker = Blocker(str(tmp_path / 'clients.json'), str(tmp_path / 'blocked-ips-v4.txt'),
+                      nft=NftSet(runner=runner))
+    blocker.streaming_limit_seconds = -1  # any streaming time is over the quota
+    return Enforcer(blocker, maxsize=maxsize, min_interval=0, runner=commands.append)
+
+
+def window(enforcer, verdicts):
+    for client, is_streaming in verdicts:
+        enforcer.submit(client, is_streaming, [SERVER] if is_streaming else [])
+    enforcer.end_window()
+
+
+def test_hysteresis_needs_three_consecutive_streaming_windows(tmp_path):
+    runner, commands = FakeNft(), []
+    enforcer = make_enforcer(tmp_path, runner, commands).start()
+    client = CLIENTS[0]
+    for is_streaming in (True, True, False, True, True):
+        window(enforcer, [(client, is_streaming)])
+    enforcer.stop()
+    assert runner.elements == {} and commands == []
+    assert not enforcer.is_blocked(client)
+
+    enforcer = make_enforcer(tmp_path, runner, commands).start()
+    window(enforcer, [(client, True)])  # third streaming window in a row
+    enforcer.stop()
+    assert runner.elements == {(client, SERVER): '2h'}
+    assert enforcer.is_blocked(client)
+
+
+def test_one_transaction_and_reload_per_window(tmp_path):
+    runner, commands = FakeNft(), []
+    enforcer = make_enforcer(tmp_path, runner, commands).start()
+    for _ in range(5):
+        window(enforcer, [(client, True) for client in CLIENTS])
+    enforcer.stop()
+    assert len(runner.scripts) == 1  # all clients blocked in the third window
+    assert set(runner.elements) == {(client, SERVER) for client in CLIENTS}
+    assert commands == [enforcer.reload_command]
+    stats = enforcer.stats()
+    assert stats['verdicts'] == 5 * len(CLIENTS) and stats['reloads'] == 1 and stats['failures'] == 0
+
+
+def test_full_queue_drops_nothing(tmp_path):
+    runner, commands = FakeNft(), []
+    enforcer = make_enforcer(tmp_path, runner, commands, maxsize=1).start()
+    for _ in range(3):
+        window(enforcer, [(client, True) for client in CLIENTS])
+    enforcer.stop()
+    assert enforcer.stats()['queue']['drops'] == 0
+    assert set(runner.elements) == {(client, SERVER) for client in CLIENTS}
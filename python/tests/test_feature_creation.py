@@ -0,0 +1,28 @@
+import numpy as np
+from config import config
+from feature_creation import as_ip_ints, is_lan_ip, lan_subnets
+from pcap_decoder import str_to_ip
+
+
+def test_is_lan_ip_uint32_and_strings():
+    subnets = ['192.168.0.0/24', '10.0.0.0/8', 'fd00::/8']
+    strs = np.array(['192.168.0.7', '192.168.1.7', '10.20.30.40', '8.8.8.8', 'fd00::1', '2001:db8::1'], dtype=object)
+    assert list(is_lan_ip(strs, subnets)) == [True, False, True, False, True, False]
+    assert list(is_lan_ip(str_to_ip(strs[:4]), subnets)) == [True, False, True, False]
+
+
+def test_as_ip_ints():
+    assert list(as_ip_ints(np.array(['10.0.0.1', '10.0.0.2', '10.0.0.1'], dtype=object))) == [
+        0x0a000001, 0x0a000002, 0x0a000001]
+    assert list(as_ip_ints(np.array(['10.0.0.1', 'fd00::1'], dtype=object))) == ['10.0.0.1', 'fd00::1']
+
+
+def test_lan_subnets_falls_back_to_the_old_config(monkeypatch):
+    monkeypatch.setitem(config, 'lan-subnets', ['192.168.0.0/24'])
+    assert lan_subnets() == ['192.168.0.0/24']
+    monkeypatch.delitem(config, 'lan-subnets')
+    monkeypatch.setitem(config, 'lan-subnet', '10.1.0.0')
+    monkeypatch.setitem(config, 'lan-subnet-mask', 16)
+    assert lan_subnets() == ['10.1.0.0/16']
+    assert list(is_lan_ip(np.array(['10.1.2.3', '192.168.0.5'], dtype=object))) == [True, False]
+
@@ -0,0 +1,76 @@
+import subprocess
+import pytest
+from nft_set import FakeNft, NftSet, nft_seconds
+
+
+def failing_runner(script):
+    raise subprocess.CalledProcessError(1, ['nft', '-f', '-'], stderr="Error: No such file or directory")
+
+
+def test_script_format():
+    nft = NftSet(runner=FakeNft(), family='inet', table='fw4', name='stream_user_block', timeout='2h')
+    nft.add('192.168.1.10', '8.8.8.8')
+    nft.add('192.168.1.11', '1.1.1.1', timeout='30m')
+    nft.delete('192.168.1.12', '9.9.9.9')
+    assert nft.script() == (
+        "add element inet fw4 stream_user_block "
+        "{ 192.168.1.10 . 8.8.8.8 timeout 2h, 192.168.1.11 . 1.1.1.1 timeout 30m }\n"
+        "delete element inet fw4 stream_user_block { 192.168.1.12 . 9.9.9.9 }\n")
+
+
+def test_empty_script_is_not_run():
+    runner = FakeNft()
+    nft = NftSet(runner=runner)
+    assert nft.script() == ""
+    assert nft.commit() == 0
+    assert runner.scripts == [] and nft.transactions == 0
+
+
+def test_repeated_adds_coalesce():
+    runner = FakeNft()
+    nft = NftSet(runner=runner, timeout='2h')
+    for _ in range(5):
+        nft.add('192.168.1.10', '8.8.8.8')
+    nft.add('192.168.1.10', '8.8.4.4')
+    assert nft.script().count(" . ") == 2
+    assert nft.commit() == 2
+    assert len(runner.scripts) == 1
+    assert runner.elements == {('192.168.1.10', '8.8.8.8'): '2h', ('192.168.1.10', '8.8.4.4'): '2h'}
+
+
+def test_add_then_delete_keeps_the_last_change():
+    runner = FakeNft()
+    nft = NftSet(runner=runner)
+    nft.add('192.168.1.10', '8.8.8.8')
+    nft.delete('192.168.1.10', '8.8.8.8')
+    assert nft.adds == {} and nft.deletes == {('192.168.1.10', '8.8.8.8')}
+    nft.add('192.168.1.10', '8.8.8.8')
+    assert nft.deletes == set() and ('192.168.1.10', '8.8.8.8') in nft.adds
+
+
+def test_failed_commit_keeps_the_changes_queued():
+    nft = NftSet(runner=failing_runner, timeout='2h')
+    nft.add('192.168.1.10', '8.8.8.8')
+    nft.delete('192.168.1.11', '1.1.1.1')
+    script = nft.script()
+    with pytest.raises(subprocess.CalledProcessError):
+        nft.commit()
+    assert nft.script() == script and nft.transactions == 0
+
+    runner = FakeNft()
+    nft.runner = runner
+    assert nft.commit() == 2
+    assert runner.scripts == [script]
+    assert runner.elements == {('192.168.1.10', '8.8.8.8'): '2h'}
+    assert nft.script() == "" and nft.transactions == 1
+
+
+@pytest.mark.parametrize('timeout, seconds', [('2h', 7200), ('1h30m', 5400), ('1d', 86400), ('45s', 45)])
+def test_nft_seconds(timeout, seconds):
+    assert nft_seconds(timeout) == seconds
+
+
+@pytest.mark.parametrize('timeout', ['', '2', '2x', 'h2', '2h junk'])
+def test_nft_seconds_rejects_invalid_times(timeout):
+    with pytest.raises(ValueError):
+        nft_seconds(timeout)
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+from pcap_decoder import ip_to_str, str_to_ip
+
+
+def test_str_to_ip_round_trip():
+    ips = np.array([0, 0x0a000001, 0xc0a86464, 0xffffffff], dtype=np.uint32)
+    strs = ip_to_str(ips)
+    assert list(strs) == ['0.0.0.0', '10.0.0.1', '192.168.100.100', '255.255.255.255']
+    assert (str_to_ip(strs) == ips).all()
+    assert (str_to_ip(strs.astype(str)) == ips).all()
+    assert str_to_ip([]).size == 0
+
+
+@pytest.mark.parametrize('ip', ['192.168.100.1000', '192.168.100.100.1', '1..2.3', '.1.2.3', '1.2.3.',
+                                '1.2.3', '256.1.1.1', '1.2.3.a', '1.2.3.4 ', '', '::1'])
+def test_str_to_ip_rejects_invalid_strings(ip):
+    with pytest.raises(ValueError):
+        str_to_ip(['10.0.0.1', ip])
@@ -0,0 +1,91 @@
+import json
+import os
+from state_store import JournalStore
+
+
+def client(count):
+    return {'is_streaming': False, 'consecutive_streaming_count': count, 'server_ips': {}}
+
+
+def test_flush_appends_only_changed_clients(tmp_path):
+    store = JournalStore(str(tmp_path / 'clients.json'))
+    clients = {'192.168.1.10': client(1), '192.168.1.11': client(1)}
+    store.mark('192.168.1.10')
+    store.mark('192.168.1.11')
+    store.flush(clients)
+    clients['192.168.1.10'] = client(2)
+    store.mark('192.168.1.10')
+    store.flush(clients)
+    store.flush(clients)  # nothing changed
+    with open(store.journal_file) as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(record['client'] for record in records) == ['192.168.1.10', '192.168.1.10', '192.168.1.11']
+    assert records[-1] == {'client': '192.168.1.10', 'state': client(2)}
+    assert JournalStore(store.state_file).load() == clients
+
+
+def test_torn_last_line_is_ignored_and_truncated(tmp_path):
+    store = JournalStore(str(tmp_path / 'clients.json'))
+    clients = {'192.168.1.10': client(1)}
+    store.mark('192.168.1.10')
+    store.flush(clients)
+    size = os.path.getsize(store.journal_file)
+    with open(store.journal_file, 'a') as f:
+        f.write('{"client": "192.168.1.10", "state": {"is_str')  # crash in the middle of a flush
+
+    recovered = JournalStore(store.state_file)
+    assert recovered.load() == clients
+    assert os.path.getsize(store.journal_file) == size
+    clients['192.168.1.11'] = client(3)
+    recovered.mark('192.168.1.11')
+    recovered.flush(clients)  # appends start on a clean line
+    assert JournalStore(store.state_file).load() == clients
+
+
+def test_deleted_clients_are_replayed(tmp_path):
+    store = JournalStore(str(tmp_path / 'clients.json'))
+    clients = {'192.168.1.10': client(1), '192.168.1.11': client(1)}
+    store.mark('192.168.1.10')
+    store.mark('192.168.1.11')
+    store.flush(clients)
+    del clients['192.168.1.11']
+    store.delete('192.168.1.11')
+    store.flush(clients)
+    assert JournalStore(store.state_file).load() == clients
+
+
+def test_compaction_rewrites_the_state_file(tmp_path):
+    store = JournalStore(str(tmp_path / 'clients.json'), compact_ratio=2)
+    clients = {'192.168.1.10': client(0)}
+    for count in range(1, 3):
+        clients['192.168.1.10'] = client(count)
+        store.mark('192.168.1.10')
+        store.flush(clients)
+    assert not os.path.exists(store.state_file) and store.journal_lines == 2
+    clients['192.168.1.10'] = client(3)
+    store.mark('192.168.1.10')
+    store.flush(clients)  # 3 lines > 2 x 1 client
+    assert store.journal_lines == 0 and os.path.getsize(store.journal_file) == 0
+    assert not os.path.exists(f"{store.state_file}.tmp")
+    with open(store.state_file) as f:
+        assert json.load(f) == clients
+    assert JournalStore(store.state_file).load() == clients
+
+
+def test_legacy_clients_json_loads(tmp_path):
+    clients = {'192.168.1.10': {'is_streaming': True, 'consecutive_streaming_count': 4,
+                                'consecutive_not_streaming_count': 0, 'streaming_start_time': 1.5,
+                                'total_streaming_time': 120.0, 'last_seen': 2.5,
+                                'server_ips': {'8.8.8.8': 3}, 'is_blocked': True}}
+    path = tmp_path / 'clients.json'
+    path.write_text(json.dumps(clients, indent=4))  # written by the blocker before the journal
+    store = JournalStore(str(path))
+    assert store.load() == clients
+    assert store.journal_lines == 0 and not os.path.exists(store.journal_file)
+
+
+def test_missing_or_corrupt_state_file_loads_empty(tmp_path):
+    path = tmp_path / 'clients.json'
+    assert JournalStore(str(path)).load() == {}
+    path.write_text('{"192.168.1.10": ')
+    assert JournalStore(str(path)).load() == {}
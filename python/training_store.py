@@ -0,0 +1,107 @@
+"""
+Chunked, append-only training data.
+
+`TrainingRecorder` appends the packets of a training capture to an HDF5 table
+(`config['path']['packets']`) every `chunk_size` packets, as the typed columns of
+`capture_buffer.PACKET_DTYPES` plus the scenario `name` and label `y`, instead of
+keeping every packet in memory until Ctrl-C and dumping a csv.
+
+`training_features` reads the table lazily (`feature_creation.iter_hdf`, only some
+scenarios or a time range) and computes the windowed features chunk by chunk with
+`chunked_features`: `window_chunks` carries the rows of the last window of each
+scenario to the next chunk, so a window is never split and the dataset is never
+whole in memory.
+"""
+
+import numpy as np
+import pandas as pd
+from config import config
+from capture_buffer import PACKET_DTYPES, PacketBuffer
+from feature_creation import NAME_SIZE, append_hdf, iter_hdf, preprocess
+from feature_engine import make_batched_features
+
+KEY = 'packets'
+
+
+class TrainingRecorder:
+    """Appends the packets of a capture to an HDF5 table every `chunk_size` packets."""
+
+    def __init__(self, name, y=-1, path=None, chunk_size=100_000):
+        if len(name) > NAME_SIZE:
+            raise ValueError(f"Scenario name longer than {NAME_SIZE} characters: {name}")
+        self.name = name
+        self.y = y
+        self.path = path or config['path']['packets']
+        self.chunk_size = chunk_size
+        self.buffer = PacketBuffer(chunk_size)
+        self.packets = 0
+        self.chunks = 0
+
+    def extend(self, batch):
+        """Add a batch of packets (dict of column arrays), flushing every `chunk_size` packets."""
+        self.buffer.extend(batch)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered packets to the table."""
+        if not len(self.buffer):
+            return
+        df = self.buffer.frame().astype(PACKET_DTYPES)  # copy, the buffer is reused
+        df['name'] = self.name
+        df['y'] = np.int8(self.y)
+        append_hdf(self.path, KEY, df)
+        self.packets += len(df)
+        self.chunks += 1
+        self.buffer.clear()
+
+    close = flush
+
+
+def window_chunks(chunks, by='name'):
+    """
+    Re-cut `chunks` (rows of each `by` group in time order across chunks) at window
+    edges: the last window of each group is held back until a later chunk shows it is
+    complete, so every window of the frames yielded is whole.
+    """
+    window_size = config['window-size']
+    carry = None
+    for chunk in chunks:
+        df = chunk if carry is None else pd.concat([carry, chunk], ignore_index=True)
+        if df.empty:
+            continue
+        # same windows as `Segments` when the window size divides a day
+        window = np.floor(df['time'].to_numpy() / window_size)
+        last = pd.Series(window).groupby(df[by].to_numpy()).transform('max').to_numpy()
+        pending = window == last
+        carry = df[pending]
+        if not pending.all():
+            yield df[~pending]
+    if carry is not None and not carry.empty:
+        yield carry
+
+
+def chunked_features(chunks, by='name', features=None):
+    """Windowed features (`make_batched_features`) of preprocessed `chunks`, one frame per chunk."""
+    for df in window_chunks(chunks, by):
+        yield make_batched_features(df, by=by, features=features)
+
+
+def training_features(path=None, names=None, start=None, end=None, features=None, chunksize=500_000):
+    """
+    Features and label `y` of every (scenario `name`, window) recorded in `path`,
+    computed chunk by chunk. Same rows as `make_windowed_features` per scenario.
+    """
+    labels = {}
+
+    def preprocessed():
+        for chunk in iter_hdf(path or config['path']['packets'], KEY, names, start, end, chunksize):
+            labels.update(chunk.groupby('name')['y'].first())
+            yield preprocess(chunk)
+
+    frames = list(chunked_features(preprocessed(), by='name', features=features))
+    if not frames:
+        return pd.DataFrame()
+    xy = pd.concat(frames).sort_index()
+    xy['y'] = xy.index.get_level_values('name').map(labels)
+    return xy
@@ -0,0 +1,91 @@
+"""
+Lightweight evaluator for the ExtraTrees model: `export_forest` flattens the fitted
+trees of `etree.joblib` into NumPy arrays (feature, threshold, children and class
+probabilities per node) saved as `.npz`, `ForestEvaluator` scores the whole forest
+vectorized without importing sklearn. Probabilities are identical to
+`model.predict_proba`: features are compared as float32 (as sklearn does), the
+leaf probabilities are normalized the same way and summed tree by tree in order.
+
+```bash
+python3 tree_export.py   # writes config['model-arrays'] from config['model']
+```
+"""
+
+import numpy as np
+from config import config
+
+
+def export_forest(model, path):
+    """Save the trees of a fitted sklearn forest classifier as flat arrays in `path` (.npz)."""
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset, depth = 0, 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        leaf = tree.children_left == -1
+        nodes = np.arange(tree.node_count)
+        # leaves point at themselves so every row can take max depth steps
+        lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+        rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(np.where(leaf, 0.0, tree.threshold))
+        # as DecisionTreeClassifier.predict_proba
+        proba = tree.value[:, 0, :model.n_classes_].copy()
+        normalizer = proba.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(proba / normalizer)
+        roots.append(offset)
+        offset += tree.node_count
+        depth = max(depth, tree.max_depth)
+    np.savez(path,
+             feature=np.concatenate(features).astype(np.int32),
+             threshold=np.concatenate(thresholds).astype(np.float64),
+             left=np.concatenate(lefts).astype(np.int32),
+             right=np.concatenate(rights).astype(np.int32),
+             value=np.concatenate(values).astype(np.float64),
+             roots=np.array(roots, dtype=np.int32),
+             max_depth=depth,
+             classes=model.classes_,
+             feature_names=np.asarray(getattr(model, 'feature_names_in_', []), dtype=str))
+
+
+class ForestEvaluator:
+    """`predict_proba` of an exported forest, a drop-in for the sklearn model at inference."""
+
+    def __init__(self, path):
+        with np.load(path) as arrays:
+            self.feature = arrays['feature']
+            self.threshold = arrays['threshold']
+            self.left = arrays['left']
+            self.right = arrays['right']
+            self.value = arrays['value']
+            self.roots = arrays['roots']
+            self.max_depth = int(arrays['max_depth'])
+            self.classes_ = arrays['classes']
+            if len(arrays['feature_names']):
+                self.feature_names_in_ = arrays['feature_names'].astype(object)
+        self.n_estimators = len(self.roots)
+
+    def predict_proba(self, X):
+        if hasattr(X, 'columns') and hasattr(self, 'feature_names_in_'):
+            X = X[list(self.feature_names_in_)]
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_estimators))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        leaves = self.value[nodes]  # (rows, trees, classes)
+        proba = np.zeros((len(X), len(self.classes_)))
+        for tree in range(self.n_estimators):  # same summation order as sklearn
+            proba += leaves[:, tree]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+if __name__ == "__main__":
+    from joblib import load
+    export_forest(load(config['model']), config['model-arrays'])
+    print(f"Exported {config['model']} to {config['model-arrays']}")